@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+answer_cache.py — семантический кэш ответов LLM (онлайн-режим)
+
+result_cache.py ловит только точный повтор: тот же нормализованный запрос, те же
+фильтры и режим. Перефразированный вопрос («как пользователи находят фильтры» /
+«как находят фильтры пользователи?») или другой фильтр с той же выдачей снова
+идёт в LLM — за те же секунды и деньги. Здесь ответ ищется по смыслу:
+
+- запись — единичный вектор запроса (тот же embed_query, что у поиска, он уже
+  в LRU embeddings.py), множество id чанков контекста LLM (top-5, склеенные
+  rerank.py соседи раскрываются в merged_ids), модель и текст ответа;
+- попадание — косинус с запросом ≥ ANSWER_CACHE_SIM (одно умножение на матрицу
+  всех записей) и пересечение контекстов по Жаккару ≥ ANSWER_CACHE_OVERLAP:
+  похожий вопрос по другим источникам ответ не получит;
+- LRU на ANSWER_CACHE_SIZE записей и TTL ANSWER_CACHE_TTL_S;
+- переиндексация (manifest.bump_generation("text")) или смена эмбеддера
+  сбрасывают кэш целиком — id чанков и векторы из старого индекса не сравнимы;
+- при ANSWER_CACHE_PERSIST=true кэш переживает перезапуск: ./storage/cache/answers.npz
+  (векторы + JSON записей), запись атомарная, раз в FLUSH_EVERY_S и при выходе.
+
+Кэшируются только настоящие ответы LLM — офлайн-фолбэк по бюджету или ошибке нет.
+Доля попаданий — cache_requests_total{cache="answer"} и stats()["hit_rate"].
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import metrics
+import resources
+from embeddings import CACHE_DIR, FLUSH_EVERY_S
+from manifest import read_generation
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+ANSWER_CACHE         = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_SIZE    = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_S   = float(os.getenv("ANSWER_CACHE_TTL_S", "86400"))
+ANSWER_CACHE_SIM     = float(os.getenv("ANSWER_CACHE_SIM", "0.92"))      # косинус запросов
+ANSWER_CACHE_OVERLAP = float(os.getenv("ANSWER_CACHE_OVERLAP", "0.6"))   # Жаккар id контекста
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "true").lower() == "true"
+
+def context_ids(top_hits: Iterable[Dict]) -> List[str]:
+    """id чанков, ушедших в промпт; склеенный хит — все его чанки."""
+    out: List[str] = []
+    for h in top_hits:
+        out.extend(h.get("merged_ids") or [h["id"]])
+    return out
+
+def _unit(vec: Sequence[float]) -> np.ndarray:
+    arr = np.asarray(vec, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm > 0 else arr
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+class SemanticAnswerCache:
+    """Потокобезопасный LRU с TTL: (вектор запроса, id контекста, модель) → ответ LLM."""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl_s: float = ANSWER_CACHE_TTL_S,
+                 min_sim: float = ANSWER_CACHE_SIM, min_overlap: float = ANSWER_CACHE_OVERLAP,
+                 path: Optional[Path] = None):
+        self.maxsize = max(1, maxsize)
+        self.ttl_s = ttl_s
+        self.min_sim = min_sim
+        self.min_overlap = min_overlap
+        self.path = path
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None   # (n, d) векторы записей, порядок — self._keys
+        self._keys: List[str] = []
+        self._gen: Optional[int] = None
+        self._space: Optional[str] = None           # имя эмбеддера, которым кодированы векторы
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    # ---- служебное (под self._lock) ----
+    def _reset_if_stale(self, space: str) -> None:
+        gen = int(read_generation().get("text", 0))
+        if self._gen != gen or self._space != space:
+            if self._data:
+                self._data.clear()
+                self._dirty = True
+            self._matrix = None
+            self._gen, self._space = gen, space
+
+    def _drop(self, key: str) -> None:
+        del self._data[key]
+        self._matrix = None
+        self._dirty = True
+
+    def _rows(self) -> np.ndarray:
+        if self._matrix is None:
+            self._keys = list(self._data.keys())
+            self._matrix = (np.stack([self._data[k]["vec"] for k in self._keys])
+                            if self._keys else np.zeros((0, 0), dtype=np.float32))
+        return self._matrix
+
+    # ---- API ----
+    def lookup(self, qvec: Sequence[float], ids: Iterable[str], model: str, space: str) -> Optional[str]:
+        """Ответ самой похожей записи той же модели с близким контекстом или None."""
+        q = _unit(qvec)
+        ids = frozenset(ids)
+        found = None
+        with self._lock:
+            self._reset_if_stale(space)
+            if self._data:
+                rows = self._rows()
+                sims = rows @ q if rows.shape[1] == q.shape[0] else np.zeros(len(rows), dtype=np.float32)
+                cand = np.flatnonzero(sims >= self.min_sim)
+                now = time.time()
+                for i in cand[np.argsort(-sims[cand])]:
+                    key = self._keys[i]
+                    entry = self._data.get(key)
+                    if entry is None:
+                        continue
+                    if self.ttl_s > 0 and now - entry["created"] > self.ttl_s:
+                        self._drop(key)
+                        continue
+                    if entry["model"] == model and _jaccard(entry["ids"], ids) >= self.min_overlap:
+                        self._data.move_to_end(key)
+                        found = entry["answer"]
+                        break
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.count("cache_requests_total", cache="answer", result="miss" if found is None else "hit")
+        return found
+
+    def put(self, query: str, qvec: Sequence[float], ids: Iterable[str], model: str, space: str,
+            answer: str) -> None:
+        ids = frozenset(ids)
+        key = hashlib.sha256(json.dumps([query, sorted(ids), model], ensure_ascii=False)
+                             .encode("utf-8")).hexdigest()
+        entry = {"vec": _unit(qvec), "ids": ids, "model": model, "answer": answer,
+                 "query": query, "created": time.time()}
+        with self._lock:
+            self._reset_if_stale(space)
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self._matrix = None
+            self._dirty = True
+        self.maybe_flush()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._matrix = None
+            self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl_s": self.ttl_s,
+                    "min_sim": self.min_sim, "min_overlap": self.min_overlap,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 3) if total else None}
+
+    # ---- диск ----
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                vecs, header = z["vecs"], json.loads(str(z["meta"]))
+            now = time.time()
+            with self._lock:
+                self._gen, self._space = header.get("gen"), header.get("space")
+                for vec, e in zip(vecs, header.get("entries", [])):
+                    if self.ttl_s > 0 and now - e["created"] > self.ttl_s:
+                        continue
+                    self._data[e["key"]] = {"vec": vec, "ids": frozenset(e["ids"]), "model": e["model"],
+                                            "answer": e["answer"], "query": e["query"], "created": e["created"]}
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        except Exception:
+            # битый файл кэша — просто начинаем с пустого
+            pass
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            keys = list(self._data.keys())
+            entries = [{"key": k, "ids": sorted(e["ids"]), "model": e["model"], "answer": e["answer"],
+                        "query": e["query"], "created": e["created"]}
+                       for k, e in ((k, self._data[k]) for k in keys)]
+            vecs = (np.stack([self._data[k]["vec"] for k in keys]) if keys
+                    else np.zeros((0, 0), dtype=np.float32))
+            header = {"gen": self._gen, "space": self._space, "entries": entries}
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.npz")
+        np.savez(tmp, vecs=vecs, meta=np.array(json.dumps(header, ensure_ascii=False)))
+        os.replace(tmp, self.path)
+
+    def maybe_flush(self) -> None:
+        if self.path is not None and self._dirty and time.monotonic() - self._last_flush > FLUSH_EVERY_S:
+            self.save()
+
+def _load_answer_cache() -> SemanticAnswerCache:
+    path = (CACHE_DIR / "answers.npz") if ANSWER_CACHE_PERSIST else None
+    cache = SemanticAnswerCache(path=path)
+    if path is not None:
+        atexit.register(cache.save)
+    return cache
+
+resources.registry.register("answer_cache", _load_answer_cache)
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return resources.registry.get("answer_cache")
@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from "next/server";
 import { getMockAnswerResponse } from "@/lib/mocks";
+import { USE_MOCKS, proxyToBackend } from "@/lib/backend";
 
 export async function GET(
   req: NextRequest,
@@ -8,6 +9,10 @@ export async function GET(
   try {
     const { id } = params;
 
+    if (!USE_MOCKS) {
+      return proxyToBackend(`/api/answers/${encodeURIComponent(id)}`);
+    }
+
     // Симуляция задержки API
     await new Promise((resolve) => setTimeout(resolve, 300));
 
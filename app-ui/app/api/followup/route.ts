@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from "next/server";
 import { FollowupRequestSchema } from "@/lib/schemas";
 import { getMockFollowupResponse } from "@/lib/mocks";
+import { USE_MOCKS, proxyToBackend } from "@/lib/backend";
 
 export async function POST(req: NextRequest) {
   try {
@@ -15,7 +16,14 @@ export async function POST(req: NextRequest) {
       );
     }
 
-    const { threadId, query } = validated.data;
+    if (!USE_MOCKS) {
+      return proxyToBackend("/api/followup", {
+        method: "POST",
+        body: JSON.stringify(validated.data),
+      });
+    }
+
+    const { threadId } = validated.data;
 
     // Симуляция задержки API
     await new Promise((resolve) => setTimeout(resolve, 1000));
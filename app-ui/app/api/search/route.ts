@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from "next/server";
 import { MOCK_SEARCH_RESPONSE } from "@/lib/mocks";
 import { SearchRequestSchema } from "@/lib/schemas";
+import { USE_MOCKS, proxyToBackend } from "@/lib/backend";
 
 export async function POST(req: NextRequest) {
   try {
@@ -15,12 +16,19 @@ export async function POST(req: NextRequest) {
       );
     }
 
+    if (!USE_MOCKS) {
+      return proxyToBackend("/api/search", {
+        method: "POST",
+        body: JSON.stringify(validated.data),
+      });
+    }
+
     const { mode, queryType, query, filters } = validated.data;
 
     // Симуляция задержки API
     await new Promise((resolve) => setTimeout(resolve, 800));
 
-    // Возвращаем мок-данные (в будущем здесь будет реальный бэкенд)
+    // Возвращаем мок-данные (USE_MOCKS=true)
     const response = {
       ...MOCK_SEARCH_RESPONSE,
       mode,
@@ -0,0 +1,28 @@
+/**
+ * Прокси к Python-бэкенду поиска (server.py в корне репозитория)
+ */
+
+import { NextResponse } from "next/server";
+
+export const RAG_BACKEND_URL = process.env.RAG_BACKEND_URL ?? "http://127.0.0.1:8000";
+
+// USE_MOCKS=true — отдавать моки из lib/mocks.ts (вёрстка без запущенного бэкенда)
+export const USE_MOCKS = process.env.USE_MOCKS === "true";
+
+export async function proxyToBackend(path: string, init?: RequestInit) {
+  try {
+    const res = await fetch(`${RAG_BACKEND_URL}${path}`, {
+      ...init,
+      headers: { "Content-Type": "application/json", ...(init?.headers ?? {}) },
+      cache: "no-store",
+    });
+    const data = await res.json();
+    return NextResponse.json(data, { status: res.status });
+  } catch (error) {
+    console.error(`Backend ${path} error:`, error);
+    return NextResponse.json(
+      { error: "Search backend unavailable" },
+      { status: 502 }
+    );
+  }
+}
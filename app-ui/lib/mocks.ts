@@ -17,7 +17,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 0,
+        chunk_index: "0_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.23
@@ -32,7 +32,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 1,
+        chunk_index: "1_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.28
@@ -47,7 +47,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 2,
+        chunk_index: "2_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.31
@@ -62,7 +62,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 3,
+        chunk_index: "3_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.35
@@ -77,7 +77,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 4,
+        chunk_index: "4_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.38
@@ -92,7 +92,7 @@ export const MOCK_SEARCH_RESPONSE: SearchResponse = {
         date: "2023-02",
         filename: "R-2023-02-KK-DebtScreenRedesign.md",
         section_path: "Основные наблюдения",
-        chunk_index: 5,
+        chunk_index: "5_0",
         product: "Кредитная СберКарта"
       },
       distance: 0.41
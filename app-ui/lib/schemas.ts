@@ -14,7 +14,7 @@ export const QuoteMetadataSchema = z.object({
   date: z.string(),
   filename: z.string(),
   section_path: z.string(),
-  chunk_index: z.number(),
+  chunk_index: z.string(),
   product: z.string(),
 });
 
@@ -47,6 +47,7 @@ export const SearchRequestSchema = z.object({
     iteration: z.string().optional(),
     scenario: z.string().optional(),
     date: z.string().optional(),
+    product: z.string().optional(),
   }).optional(),
 });
 
@@ -55,6 +56,9 @@ export const SearchResponseSchema = z.object({
   quotes: z.array(QuoteSchema),
   sources: z.array(SourceSchema),
   images: z.array(ImageSchema),
+  // Python-бэкенд (server.py): id ответа для /api/answers/[id] и тред для /api/followup
+  answerId: z.string().optional(),
+  threadId: z.string().optional(),
 });
 
 export const FollowupRequestSchema = z.object({
@@ -14,6 +14,7 @@ export interface SearchRequest {
     iteration?: string;
     scenario?: string;
     date?: string;
+    product?: string;
   };
 }
 
@@ -24,7 +25,7 @@ export interface QuoteMetadata {
   date: string;
   filename: string;
   section_path: string;
-  chunk_index: number;
+  chunk_index: string;
   product: string;
 }
 
@@ -53,6 +54,8 @@ export interface SearchResponse {
   quotes: Quote[];
   sources: Source[];
   images: Image[];
+  answerId?: string;
+  threadId?: string;
 }
 
 export interface FollowupRequest {
@@ -75,6 +78,7 @@ export interface SearchFilters {
   iteration?: string;
   scenario?: string;
   date?: string;
+  product?: string;
 }
 
 
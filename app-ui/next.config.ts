@@ -4,6 +4,11 @@ import path from "path";
 const nextConfig: NextConfig = {
   // Silence workspace root warning by explicitly setting tracing root to repo root
   outputFileTracingRoot: path.join(__dirname, ".."),
+  // картинки из 03_assets отдаёт Python-бэкенд (server.py)
+  async rewrites() {
+    const backend = process.env.RAG_BACKEND_URL ?? "http://127.0.0.1:8000";
+    return [{ source: "/assets/:path*", destination: `${backend}/assets/:path*` }];
+  },
 };
 
 export default nextConfig;
@@ -1,240 +1,40 @@
 # -*- coding: utf-8 -*-
 import os
-import re
-import json
+from concurrent.futures import TimeoutError as FutureTimeout
 from pathlib import Path
-from datetime import datetime
 
 import streamlit as st
-import chromadb
 from dotenv import load_dotenv
 
+import resources
+import batching
+import metrics
+from embeddings import get_text_embedder
+from answer_cache import get_answer_cache
+from result_cache import get_result_cache
+import retrieval
+
 # =========================
 # Константы и утилиты
 # =========================
 load_dotenv()
 
-DB_DIR = "./storage/chroma"
+DB_DIR = resources.DB_DIR
 OFFLINE_ONLY = os.getenv("OFFLINE_ONLY", "true").lower() == "true"
-OPENAI_LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o")
 
 BASE_DIR = Path(__file__).resolve().parent
-ASSETS_DIR = (BASE_DIR / "03_assets").resolve()
-TEXTS_DIR  = (BASE_DIR / "02_clean_texts").resolve()
 
 # ---------- пути к изображениям ----------
-def resolve_image_path(p: str) -> str:
-    """Нормализует путь к картинке для локального запуска."""
-    if not p:
-        return ""
-    p = str(p).strip()
-    if p.startswith("http://") or p.startswith("https://"):
-        return p
-    if re.match(r"^[A-Za-z]:\\", p):  # абсолютный Windows-путь
-        return p
-    rel = p.lstrip("/\\").replace("\\", "/")
-    candidates = [
-        BASE_DIR / rel,
-        ASSETS_DIR / rel,
-        ASSETS_DIR / Path(rel).name,
-        BASE_DIR / "03_assets" / "/".join(rel.split("/")[1:])
-    ]
-    for c in candidates:
-        if c.exists():
-            return str(c)
-    return str(candidates[0])
-
-def _append_img(imgs, item):
-    if isinstance(item, str):
-        imgs.append((item, None))
-    elif isinstance(item, dict):
-        path = item.get("path") or item.get("src") or item.get("url")
-        if path:
-            imgs.append((path, item.get("alt")))
-
-def _parse_images(images_raw):
-    """meta['images'] → список пар (path, alt). Поддерживает list/dict/JSON/str."""
-    imgs = []
-    if images_raw is None:
-        return imgs
-    if isinstance(images_raw, list):
-        for it in images_raw: _append_img(imgs, it)
-    elif isinstance(images_raw, dict):
-        _append_img(imgs, images_raw)
-    elif isinstance(images_raw, str):
-        try:
-            parsed = json.loads(images_raw)
-            if isinstance(parsed, list):
-                for it in parsed: _append_img(imgs, it)
-            elif isinstance(parsed, dict):
-                _append_img(imgs, parsed)
-            else:
-                _append_img(imgs, images_raw)
-        except Exception:
-            _append_img(imgs, images_raw)
-    return imgs
-
-# ---------- фолбэк: вытаскиваем картинки из исходного MD ----------
-IMG_PATTERN = re.compile(r"!\[[^\]]*\]\(([^)]+)\)")
-HDR_RE      = re.compile(r"^#{1,6}\s+.+?$", flags=re.MULTILINE)
-
-def _slice_section(md_text: str, section_path: str) -> str:
-    if not md_text or not section_path:
-        return md_text or ""
-    i = md_text.lower().find(section_path.strip().lower())
-    if i == -1:
-        return md_text
-    tail = md_text[i:]
-    m = HDR_RE.search(tail, pos=1)  # следующий заголовок в «хвосте»
-    return tail[:m.start()] if m and m.start() > 0 else tail
-
-def _fallback_images_from_md(meta, max_count=3):
-    """Если meta['images'] пусто, берём 2–3 картинки из секции соответствующего .md."""
-    filename = (meta or {}).get("filename")
-    if not filename:
-        return []
-    md_path = TEXTS_DIR / filename
-    if not md_path.exists():
-        return []
-    # читаем файл
-    try:
-        text = md_path.read_text(encoding="utf-8")
-    except Exception:
-        try:
-            text = md_path.read_text(encoding="utf-16")
-        except Exception:
-            return []
-    section_path = (meta or {}).get("section_path") or ""
-    slice_text = _slice_section(text, section_path)
-    found = IMG_PATTERN.findall(slice_text) or IMG_PATTERN.findall(text)
-    found = [p.strip().split("?")[0] for p in found][:max_count]
-    return [(p, None) for p in found]
-
-# ---------- офлайн-свод (экстрактивно) ----------
-def offline_summary(top_hits, max_sent=4):
-    """Простой экстрактивный свод: выбираем информативные предложения из top-хитов."""
-    import heapq, re as _re
-    text = " ".join((h.get("text") or "") for h in top_hits[:8])
-    sents = _re.split(r"(?<=[.!?])\s+", text)
-    sents = [s.strip() for s in sents if s.strip()]
-    if len(sents) <= max_sent:
-        return " ".join(sents)
-    def score(s):
-        sc = len(s)
-        for kw in ("процент", "лимит", "задолж", "беспроцент", "комис", "сняти", "перевод", "понят", "экран", "визуал"):
-            if kw in s.lower(): sc += 30
-        return sc
-    best = heapq.nlargest(max_sent, sents, key=score)
-    return " ".join(best)
-
-# ---------- OFFLINE Интерпретация: TF-IDF + TextRank (без внешних библиотек) ----------
-def _tokenize(text):
-    text = text.lower()
-    # убираем лишнее
-    text = re.sub(r"[^a-zа-я0-9ё\- ]+", " ", text)
-    # русские/английские стоп-слова (минимальный набор)
-    stop = set("""
-        и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
-        вот от меня еще нет о из ли же до ни кто это того потому этот какой где когда здесь там него нее них
-        при чем раз два три или либо также также-то чтобы для без про над под между около
-        the a an to of is are was were be been being this that these those and or not from by as with into onto about
-    """.split())
-    toks = [t for t in text.split() if t and t not in stop and len(t) > 2]
-    return toks
-
-def _sent_split(text):
-    parts = re.split(r"(?<=[.!?])\s+", text)
-    return [p.strip() for p in parts if len(p.strip()) > 0]
-
-def _build_tfidf(sentences):
-    # словарь
-    docs = [ _tokenize(s) for s in sentences ]
-    vocab = {}
-    for d in docs:
-        for t in d:
-            if t not in vocab:
-                vocab[t] = len(vocab)
-    # tf
-    tf = []
-    for d in docs:
-        vec = [0]*len(vocab)
-        for t in d:
-            vec[vocab[t]] += 1
-        tf.append(vec)
-    # idf
-    import math
-    df = [0]*len(vocab)
-    for j in range(len(vocab)):
-        for i in range(len(docs)):
-            if tf[i][j] > 0:
-                df[j] += 1
-    idf = [ math.log((1+len(docs))/(1+dfj))+1.0 for dfj in df ]
-    # tf-idf нормировка
-    tfidf = []
-    for i in range(len(docs)):
-        row = [ tf[i][j]*idf[j] for j in range(len(vocab)) ]
-        # l2
-        norm = math.sqrt(sum(x*x for x in row)) or 1.0
-        row = [x/norm for x in row]
-        tfidf.append(row)
-    return tfidf
-
-def _cosine(v1, v2):
-    s = 0.0
-    for a,b in zip(v1,v2):
-        s += a*b
-    return s
-
-def _textrank_scores(tfidf, damping=0.85, iters=30, eps=1e-6):
-    n = len(tfidf)
-    if n == 0:
-        return []
-    # матрица схожести (без диагонали)
-    sim = [[0.0]*n for _ in range(n)]
-    for i in range(n):
-        for j in range(i+1,n):
-            c = _cosine(tfidf[i], tfidf[j])
-            sim[i][j] = c
-            sim[j][i] = c
-    # нормировка по строкам
-    row_sum = [sum(sim[i]) for i in range(n)]
-    M = [[ (sim[i][j]/row_sum[i] if row_sum[i] > 0 else 0.0) for j in range(n)] for i in range(n)]
-    # PageRank
-    pr = [1.0/n]*n
-    for _ in range(iters):
-        new = [ (1.0-damping)/n + damping * sum(pr[j]*M[j][i] for j in range(n)) for i in range(n) ]
-        # проверка сходимости
-        diff = sum(abs(new[i]-pr[i]) for i in range(n))
-        pr = new
-        if diff < eps:
-            break
-    return pr
-
-def summarize_tfidf_textrank(hits, query:str, max_sentences:int=5):
-    """Берём топ-хиты → режем на предложения → считаем TF-IDF и TextRank → возвращаем свод."""
-    text = " ".join((h.get("text") or "") for h in hits[:10])
-    # подмешаем сам запрос (даёт лёгкий приоритет словам из запроса)
-    text = (query or "") + ". " + text
-    sentences = _sent_split(text)
-    # фильтр слишком коротких
-    sentences = [s for s in sentences if len(_tokenize(s)) >= 5]
-    if not sentences:
-        return ""
-    tfidf = _build_tfidf(sentences)
-    ranks = _textrank_scores(tfidf)
-    # берём top-N по рангу, сохраняем порядок появления
-    idx_sorted = sorted(range(len(sentences)), key=lambda i: ranks[i], reverse=True)[:max_sentences]
-    idx_sorted = sorted(idx_sorted)
-    # лёгкая «склейка»: убираем дубликаты по началу
-    result = []
-    seen = set()
-    for i in idx_sorted:
-        s = sentences[i].strip()
-        key = s[:40].lower()
-        if key not in seen:
-            result.append(s)
-            seen.add(key)
-    return " ".join(result)
+# индекс 03_assets в памяти (asset_index.py): resolve() — поиск по словарям, без stat() на каждый хит
+from asset_index import resolve_image_path
+
+# ---------- поиск, своды, поиск по макету — rag.py (общий с server.py) ----------
+import rag
+import report
+from rag import hit_images
+
+# экспорт отчёта: подпись переключателя → формат report.py ("" — не собирать)
+EXPORT_FORMATS = {"—": "", ".md": "md", ".pdf": "pdf", ".pdf с картинками": "pdf_images"}
 
 # =========================
 # UI: настройка + стили
@@ -270,6 +70,12 @@ if use_offline_mode:
 else:
     st.sidebar.info("🔵 Онлайн режим")
 
+use_hybrid = st.sidebar.toggle(
+    "🔤 Гибридный поиск (BM25 + векторы)",
+    value=retrieval.HYBRID_SEARCH,
+    help="Точные термины («БП», «обязательный платёж») ищутся лексически и сливаются с векторной выдачей (RRF)"
+)
+
 # debug_images = st.sidebar.toggle("🔧 Показывать отладку изображений", value=False)
 
 # Индикатор режима в основном интерфейсе
@@ -279,10 +85,43 @@ else:
     st.info("🔵 **Онлайн режим**: Используется ChatGPT для анализа с локальной обработкой как резерв")
 
 # =========================
-# Подключение к базам Chroma
+# Подключение к хранилищу векторов (Chroma или vector_store.py — VECTOR_BACKEND)
 # =========================
-client = chromadb.PersistentClient(path=DB_DIR)
-text_collection = client.get_or_create_collection("ux_research")   # чанк-тексты
+# Модели и клиенты живут в resources.registry — один экземпляр на процесс,
+# а не на каждый rerun. Прогрев (WARMUP_ON_START=true) идёт в фоне.
+if resources.WARMUP_ON_START:
+    resources.warm_up_in_background()
+metrics.start_file_exporter()   # METRICS_FILE задан — метрики Prometheus пишутся в файл в фоне
+
+def warn_if_embedder_mismatch():
+    # хранилище векторов (и chromadb) открываем только к первому поиску, а не до отрисовки страницы
+    text_collection = resources.collection(resources.TEXT_COLLECTION)   # чанк-тексты
+    text_embedder = get_text_embedder()   # та же модель, что строила индекс (build_index.py)
+    indexed_with = (text_collection.metadata or {}).get("embedder")
+    if indexed_with and indexed_with != text_embedder.name:
+        st.warning(f"Индекс построен моделью {indexed_with}, а запросы кодирует {text_embedder.name}. "
+                   "Переиндексируйте (`python cli.py index-text`) или поправьте OFFLINE_ONLY/LOCAL_ST_MODEL в .env.")
+
+with st.sidebar.expander("📦 Ресурсы процесса", expanded=False):
+    st.caption(f"🗄 Векторы: {resources.VECTOR_BACKEND}")
+    for row in resources.registry.stats():
+        if row.get("loaded"):
+            mem = f"{row['rss_mb']} MB" if row.get("rss_mb") is not None else "—"
+            st.caption(f"✅ {row['name']}: {row['load_s']} s, RSS +{mem}")
+        else:
+            st.caption(f"⏳ {row['name']}: не загружен")
+    rc = get_result_cache().stats()
+    st.caption(f"🗂 кэш результатов: {rc['size']}/{rc['maxsize']}, попаданий {rc['hits']}, промахов {rc['misses']}")
+    ac = get_answer_cache().stats()
+    st.caption(f"💬 кэш ответов LLM: {ac['size']}/{ac['maxsize']}, попаданий {ac['hits']}, промахов {ac['misses']}")
+    # микробатчинг эмбеддингов запросов (batching.py): сколько запросов уходит в один encode
+    for b in batching.all_stats():
+        if b["batches"]:
+            st.caption(f"🧮 батчи {b['name']}: {b['batches']}, в среднем {b['batch_size']['mean']:.1f} запр., "
+                       f"ожидание {b['queue_wait_ms']['mean']:.1f} мс")
+
+# заполняется в конце скрипта, когда стадии текущего запроса уже измерены (metrics.py)
+timings_panel = st.sidebar.expander("⏱ Тайминги", expanded=False)
 
 # =========================
 # TABs: По тексту / По макету
@@ -291,177 +130,100 @@ tab_text, tab_image = st.tabs(["🔎 По тексту", "🖼 По макету
 
 with tab_text:
     # --- Фильтры и ввод запроса ---
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     iteration = col1.text_input("Итерация (например, 1 или 2)", "")
     scenario  = col2.text_input("Сценарий/тег (например, 'беспроцентный период')", "")
     date_hint = col3.text_input("Дата (YYYY-MM, опционально)", "")
+    product   = col4.text_input("Продукт/проект (опционально)", "")
     query     = st.text_area("Идея экрана / вопрос / гипотеза", "Как показать беспроцентный период, чтобы не путали с планом выплат?")
 
-    # --- Поиск по тексту ---
-    def search_text(q: str, k: int = 12):
-        res = text_collection.query(query_texts=[q], n_results=k)
-        hits = []
-        for i in range(len(res["documents"][0])):
-            hits.append({
-                "text": res["documents"][0][i],
-                "meta": res["metadatas"][0][i],
-                "dist": res["distances"][0][i] if "distances" in res else None
-            })
-        return hits
-
-    def format_cite(hit, idx):
-        md = hit["meta"] or {}
-        label = f"{md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}"
-        where = f"{md.get('filename')} / {md.get('section_path') or '…'} / chunk {md.get('chunk_index')}"
-        return f"[{idx}] {label}\n{where}\n\"{(hit.get('text') or '').strip()}\""
-
-    def llm_answer(q, top_hits, offline_mode):
-        if offline_mode:
-            return ("**Итог (офлайн).** Ниже — лучшие цитаты по запросу.\n\n" +
-                    "\n\n".join(format_cite(h, i+1) for i, h in enumerate(top_hits[:3])))
-        try:
-            from openai import OpenAI
-            client_oai = OpenAI()
-            context = "\n\n".join(format_cite(h, i+1) for i, h in enumerate(top_hits[:5]))
-            prompt = (
-                "Ты — UX-исследователь. Ответь кратко и по делу.\n"
-                "1) Итог (2–4 предложения).\n"
-                "2) 1–3 дословные цитаты (ставь [номер источника]).\n"
-                "3) Источники: id · title · iteration · date · filename/section/chunk.\n\n"
-                f"Вопрос: {q}\n\nКонтекст:\n{context}\n"
-            )
-            resp = client_oai.chat.completions.create(
-                model=OPENAI_LLM_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            return resp.choices[0].message.content
-        except Exception as e:
-            return f"Не удалось вызвать LLM ({e}). Показаны цитаты:\n\n" + \
-                   "\n\n".join(format_cite(h, i+1) for i, h in enumerate(top_hits[:3]))
-
+    # --- Поиск по тексту: векторы + BM25 (retrieval.py через rag.py) ---
     # ================ Кнопка поиска ================
+    # Параметры поиска запоминаем в сессии: следующие rerun'ы (переключатели, скачивание
+    # отчёта) показывают тот же результат из result_cache.py, не пересчитывая конвейер.
     if st.button("Искать похожие кейсы", type="primary"):
-        with st.spinner("Ищу релевантные фрагменты..."):
-            hits = search_text(query, k=12)
-
-            # Фильтры по метаданным
-            def meta_ok(md):
-                ok = True
-                if iteration and (md.get("iteration", "") != iteration): ok = False
-                if date_hint and (md.get("date", "").strip() != date_hint.strip()): ok = False
-                if scenario and scenario.lower() not in (md.get("tags", "") or "").lower(): ok = False
-                return ok
-
-            filtered = [h for h in hits if meta_ok(h["meta"])] or hits
+        st.session_state["text_search"] = dict(
+            query=query, iteration=iteration, scenario=scenario, date_hint=date_hint, product=product,
+            offline=use_offline_mode, hybrid=use_hybrid,
+        )
+        st.session_state["export_fmt"] = "—"   # новый запрос — отчёт снова только по выбору
+    search_params = st.session_state.get("text_search")
+    if search_params:
+        query = search_params["query"]
+        with st.spinner("Ищу релевантные фрагменты..."), metrics.trace("text_total") as text_trace:
+            st.session_state.setdefault("traces", {})["по тексту"] = text_trace
+            # Фильтры по метаданным уходят в where-запрос к индексу (filters.py);
+            # ключ кэша — запрос, фильтры, режим и поколение индекса
+            warn_if_embedder_mismatch()
 
             # ======================= Аналитический вывод =======================
+            # онлайн — ответ LLM рисуется по мере стриминга (llm.py); из кэша — сразу целиком
             st.markdown("## 🧠 Аналитический вывод")
-
-            if use_offline_mode:
-                # офлайн-«генерация»: TF-IDF + TextRank
-                summary_text = summarize_tfidf_textrank(filtered, query, max_sentences=5)
-            else:
-                # если онлайн — сначала LLM, а ниже офлайн как резерв
-                llm_out = llm_answer(query, filtered, use_offline_mode)
-                st.markdown(llm_out)
-                summary_text = offline_summary(filtered, max_sent=4)
+            answer_box = st.empty()
+            on_token = None if search_params["offline"] else (lambda text: answer_box.markdown(text + " ▌"))
+            with metrics.span("answer"):
+                result = rag.answer(**search_params, k=12, on_token=on_token)
+            filtered, has_filters = result["hits"], result["has_filters"]
+            if not filtered and has_filters:
+                st.warning("По заданным фильтрам ничего не нашлось — ослабьте фильтры.")
+
+            # офлайн — TF-IDF + TextRank; онлайн — сначала LLM, а ниже офлайн как резерв
+            llm_out, summary_text = result["llm"], result["summary"]
+            if llm_out:
+                answer_box.markdown(llm_out)
+            ctx = result.get("context")
+            if ctx and "prompt_tokens" in ctx:
+                saved = ctx["tokens_saved"] / ctx["prompt_tokens_before"] if ctx["prompt_tokens_before"] else 0.0
+                ttft = "из кэша ответов" if ctx.get("cached") else (
+                    f"первый токен {ctx['ttft_ms']:.0f} мс" if "ttft_ms" in ctx else "без ответа LLM")
+                st.caption(f"🧾 Промпт LLM: {ctx['prompt_tokens']} токенов вместо {ctx['prompt_tokens_before']} "
+                           f"(−{saved:.0%}), {ctx['fragments']} фрагм. из {ctx['hits']} хитов · {ttft}")
 
             # красиво выведем офлайн-вывод как bullets
             if summary_text:
-                bullets = [s.strip() for s in re.split(r"(?<=[.!?])\s+", summary_text) if len(s.strip()) > 0][:4]
-                st.write("- " + "\n- ".join(bullets))
+                st.write("- " + "\n- ".join(report.summary_bullets(summary_text)))
             else:
                 st.info("Недостаточно контекста для свода. Попробуйте уточнить запрос.")
 
             # ======================= Экспорт отчёта =======================
+            # Отчёт собирается только по запросу (report.py): markdown — один раз на запись
+            # result_cache, PDF — в памяти и в фоновом пуле (LRU по запросу, своду и цитатам), без файлов на диске
             st.markdown("### 💾 Экспорт отчёта")
-            # Сформируем markdown-отчёт
-            def build_md_report():
-                now = datetime.now().strftime("%Y-%m-%d %H:%M")
-                parts = []
-                parts.append(f"# Аналитический отчёт — ИИ-исследователь 2.0\n")
-                parts.append(f"**Время:** {now}\n")
-                parts.append(f"**Запрос:** {query}\n")
-                parts.append("## Итоговый вывод\n")
-                if summary_text:
-                    for b in bullets:
-                        parts.append(f"- {b}")
-                    parts.append("")
-                else:
-                    parts.append("_Нет итогового свода._\n")
-                parts.append("## Источники и цитаты\n")
-                for i, h in enumerate(filtered[:8], start=1):
-                    md = h["meta"] or {}
-                    label = f"{md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}"
-                    where = f"{md.get('filename')} / {md.get('section_path') or '…'} / chunk {md.get('chunk_index')}"
-                    parts.append(f"### [{i}] {label}")
-                    parts.append(where)
-                    parts.append("")
-                    parts.append(f"> { (h.get('text') or '').strip() }")
-                    # картинки (если есть)
-                    parsed_imgs = _parse_images(md.get("images") or [])
-                    if not parsed_imgs:
-                        parsed_imgs = _fallback_images_from_md(md, max_count=3)
-                    if parsed_imgs:
-                        parts.append("")
-                        parts.append("Связанные изображения:")
-                        for p, _ in parsed_imgs[:3]:
-                            parts.append(f"![img]({p})")
-                        parts.append("")
-                return "\n".join(parts)
-
-            md_report = build_md_report()
-            st.download_button(
-                label="⬇️ Скачать .md",
-                data=md_report.encode("utf-8"),
-                file_name="ux_insights_report.md",
-                mime="text/markdown"
-            )
-
-            # Попытка PDF (если установлен reportlab)
-            try:
-                from reportlab.lib.pagesizes import A4
-                from reportlab.pdfgen import canvas
-                from reportlab.lib.units import mm
-
-                def save_pdf(text: str, path: Path):
-                    c = canvas.Canvas(str(path), pagesize=A4)
-                    width, height = A4
-                    x, y = 20*mm, height - 20*mm
-                    for line in text.splitlines():
-                        # простейшая обрезка по ширине
-                        while len(line) > 110:
-                            c.drawString(x, y, line[:110])
-                            line = line[110:]
-                            y -= 6*mm
-                            if y < 15*mm:
-                                c.showPage(); y = height - 20*mm
-                        c.drawString(x, y, line)
-                        y -= 6*mm
-                        if y < 15*mm:
-                            c.showPage(); y = height - 20*mm
-                    c.save()
-
-                pdf_path = BASE_DIR / "ux_insights_report.pdf"
-                # для PDF возьмём текст без markdown-картинок (простая версия)
-                text_for_pdf = re.sub(r"!\[[^\]]*\]\([^)]+\)", "[image]", md_report)
-                save_pdf(text_for_pdf, pdf_path)
-
-                with open(pdf_path, "rb") as f:
+            export_fmt = st.radio("Формат отчёта", list(EXPORT_FORMATS), horizontal=True, key="export_fmt")
+            if EXPORT_FORMATS[export_fmt] == "md":
+                st.download_button(
+                    label="⬇️ Скачать .md",
+                    data=report.markdown_for(result, query).encode("utf-8"),
+                    file_name="ux_insights_report.md",
+                    mime="text/markdown"
+                )
+            elif EXPORT_FORMATS[export_fmt]:
+                fmt = EXPORT_FORMATS[export_fmt]
+                pdf_bytes = None
+                if report.pdf_available():
+                    fut = report.pdf_for(result, query, fmt)
+                    try:
+                        # короткий PDF успевает за REPORT_WAIT_S, с картинками — не ждём, страница рисуется дальше
+                        pdf_bytes = fut.result(timeout=report.REPORT_WAIT_S if fmt == "pdf" else 0)
+                    except FutureTimeout:
+                        st.info("PDF готовится в фоне — результаты ниже можно смотреть.")
+                        st.button("🔄 Проверить готовность PDF")
+                    except Exception as e:
+                        st.caption(f"Не удалось собрать PDF ({e}).")
+                if pdf_bytes:
                     st.download_button(
                         label="⬇️ Скачать .pdf",
-                        data=f.read(),
+                        data=pdf_bytes,
                         file_name="ux_insights_report.pdf",
                         mime="application/pdf"
                     )
-            except Exception:
-                st.caption("Совет: если нет PDF в один клик — сохрани страницу через браузер как PDF (Print → Save as PDF).")
+                elif not report.pdf_available():
+                    st.caption("Совет: если нет PDF в один клик — сохрани страницу через браузер как PDF (Print → Save as PDF).")
 
             # ======================= Быстрый офлайн-свод для сравнения =======================
-            if use_offline_mode:
+            if search_params["offline"]:
                 st.markdown("### 🧩 Альтернативный офлайн-свод (экстрактивный)")
-                st.write(offline_summary(filtered, max_sent=4))
+                st.write(rag.offline_summary(filtered, max_sent=4, index=rag.sentence_index()))
 
             st.divider()
             st.subheader("📌 Топ-фрагменты")
@@ -485,19 +247,15 @@ with tab_text:
                 st.markdown(f'<div class="quote">{(h.get("text") or "").strip()}</div>', unsafe_allow_html=True)
                 st.markdown(f'<div class="meta">{md.get("product") or ""} · секция: {section} · chunk: {chunk_ix}</div>', unsafe_allow_html=True)
 
-                # ----- Превью: сначала из метаданных -----
-                parsed_imgs = _parse_images(md.get("images") or [])
-
-                # ----- Если в метаданных пусто — фолбэк из исходного Markdown -----
-                if not parsed_imgs:
-                    parsed_imgs = _fallback_images_from_md(md, max_count=3)
+                # ----- Превью: из метаданных, если пусто — картинки секции (section_images.json) -----
+                parsed_imgs = hit_images(md, max_count=3)
 
                 # ----- Нормализация путей и показ -----
                 resolved = []
-                for p, alt in parsed_imgs:
-                    rp = resolve_image_path(p)
-                    exists = (not rp.startswith("http")) and Path(rp).exists()
-                    resolved.append({"path": rp, "alt": alt, "exists": True if rp.startswith("http") else exists})
+                with metrics.span("image_resolve"):
+                    for p, alt in parsed_imgs:
+                        rp, exists = resolve_image_path(p)
+                        resolved.append({"path": rp, "alt": alt, "exists": exists})
                 to_show = [r for r in resolved if r["exists"]][:3]
                 if to_show:
                     cols = st.columns(len(to_show))
@@ -517,40 +275,40 @@ with tab_image:
     st.subheader("Поиск похожих интерфейсов по картинке (CLIP)")
     uploaded = st.file_uploader("Загрузите PNG/JPG макета", type=["png","jpg","jpeg","webp"])
     if uploaded:
-        from PIL import Image
-        from sentence_transformers import SentenceTransformer
-        image = Image.open(uploaded).convert("RGB")
-        st.image(image, caption="Запрос", use_container_width=True)
-
-        # эмбеддинг изображения (CLIP)
-        clip_model = SentenceTransformer("clip-ViT-B-32")
-        qvec = clip_model.encode([image], convert_to_numpy=True, normalize_embeddings=True)[0].tolist()
-
-        # поиск по коллекции ux_images
-        client_img = chromadb.PersistentClient(path=DB_DIR)
-        images_coll = client_img.get_or_create_collection("ux_images")
-        res = images_coll.query(query_embeddings=[qvec], n_results=12, include=["metadatas","documents","distances"])
-
-        hits = []
-        # Получаем количество результатов из любого доступного поля
-        result_count = len(res["metadatas"][0]) if "metadatas" in res and res["metadatas"] else 0
-        
-        for i in range(result_count):
-            md = res["metadatas"][0][i] or {}
-            # Используем индекс как ID, если ids недоступен
-            item_id = res["ids"][0][i] if "ids" in res and res["ids"] else f"item_{i}"
-            hits.append({
-                "id": item_id,
-                "path": md.get("path"),
-                "name": md.get("filename"),
-                "dist": res["distances"][0][i] if "distances" in res and res["distances"] else None
-            })
-
-        if hits:
-            st.markdown("#### Похожие визуальные решения")
-            cols = st.columns(4)
-            for i, h in enumerate(hits):
-                with cols[i % 4]:
-                    st.image(h["path"], caption=f"{h['name']}", use_container_width=True)
-        else:
-            st.info("Ничего похожего не нашлось. Убедись, что индекс изображений собран (`build_images_index.py`).")
+        with metrics.trace("image_total") as image_trace:
+            st.session_state.setdefault("traces", {})["по макету"] = image_trace
+            from PIL import Image
+            with metrics.span("image_decode"):
+                image = Image.open(uploaded).convert("RGB")
+            st.image(image, caption="Запрос", use_container_width=True)
+
+            # CLIP-эмбеддинг (кэш по sha256 байтов) + поиск по ux_images — rag.py
+            hits = rag.search_images(uploaded.getvalue(), k=12)
+
+            if hits:
+                st.markdown("#### Похожие визуальные решения")
+                cols = st.columns(4)
+                for i, h in enumerate(hits):
+                    with cols[i % 4]:
+                        st.image(h["path"], caption=f"{h['name']}", use_container_width=True)
+            else:
+                st.info("Ничего похожего не нашлось. Убедись, что индекс изображений собран (`build_images_index.py`).")
+
+# =========================
+# Тайминги стадий (metrics.py)
+# =========================
+with timings_panel:
+    if not metrics.METRICS_ENABLED:
+        st.caption("Метрики выключены (METRICS_ENABLED=false).")
+    for kind, tr in st.session_state.get("traces", {}).items():
+        if tr is None or tr.total_s is None:
+            continue
+        st.caption(f"**Последний запрос {kind}: {tr.total_s * 1000:.0f} мс**")
+        for row in tr.rows():
+            calls = f" ×{row['calls']}" if row["calls"] > 1 else ""
+            st.caption(f"{row['stage']}: {row['ms']:.1f} мс{calls}")
+    stages = metrics.stage_stats()
+    if stages:
+        st.caption("**Процесс целиком** (p50 / p95, мс):")
+        for row in stages:
+            st.caption(f"{row['stage']}: {row['p50_ms']} / {row['p95_ms']} · {row['count']} замеров")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+asset_index.py — индекс файлов 03_assets в памяти: путь из Markdown → абсолютный путь
+
+Раньше app.py на каждую картинку каждого хита перебирал до четырёх кандидатов
+через Path.exists(), а потом проверял найденный путь ещё раз. На сетевом диске
+с тысячами картинок это десятки обращений к ФС на один поиск.
+
+Теперь 03_assets обходится один раз (os.scandir), а resolve() — только поиск
+по словарям, без ввода-вывода. Актуальность поддерживает фоновый поток: раз
+в ASSET_RESCAN_S секунд он сверяет mtime каталогов (добавление/удаление файла
+меняет mtime папки) и при расхождении пересобирает индекс целиком, подменяя
+его одним присваиванием — читатели блокировок не берут.
+"""
+
+import os
+import posixpath
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import resources
+
+ASSETS_DIR     = (resources.BASE_DIR / "03_assets").resolve()
+ALLOW_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".gif", ".svg"}
+ASSET_RESCAN_S = float(os.getenv("ASSET_RESCAN_S", "30"))   # 0 — не следить за папкой
+
+_WIN_ABS_RE = re.compile(r"^[A-Za-z]:\\")
+
+class _Snapshot(NamedTuple):
+    by_rel: Dict[str, str]     # путь от корня проекта ("03_assets/x/y.png") → абсолютный
+    by_name: Dict[str, str]    # имя файла → абсолютный (первый в алфавитном порядке путей)
+    abs_paths: frozenset
+    dir_mtimes: Dict[str, int]
+    scanned_at: float
+    scan_s: float
+
+def _scan(root: Path, base: Path) -> _Snapshot:
+    t0 = time.perf_counter()
+    by_rel: Dict[str, str] = {}
+    dir_mtimes: Dict[str, int] = {}
+    stack = [str(root)]
+    while stack:
+        d = stack.pop()
+        try:
+            dir_mtimes[d] = os.stat(d).st_mtime_ns
+            entries = list(os.scandir(d))
+        except OSError:
+            continue
+        for e in entries:
+            if e.is_dir(follow_symlinks=False):
+                stack.append(e.path)
+            elif os.path.splitext(e.name)[1].lower() in ALLOW_SUFFIXES:
+                rel = os.path.relpath(e.path, base).replace("\\", "/")
+                by_rel[rel] = str(Path(e.path))
+    by_name: Dict[str, str] = {}
+    for rel in sorted(by_rel):
+        by_name.setdefault(posixpath.basename(rel), by_rel[rel])
+    return _Snapshot(by_rel, by_name, frozenset(by_rel.values()), dir_mtimes,
+                     time.time(), time.perf_counter() - t0)
+
+class AssetIndex:
+    """Снимок 03_assets + фоновая сверка mtime каталогов."""
+
+    def __init__(self, root: Path = ASSETS_DIR, base: Path = resources.BASE_DIR):
+        self.root, self.base = Path(root), Path(base)
+        self._assets_prefix = os.path.relpath(self.root, self.base).replace("\\", "/")
+        self._snap = _scan(self.root, self.base)
+        self._refresh_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    # ── Актуальность ──
+    def is_stale(self) -> bool:
+        for d, mtime in self._snap.dir_mtimes.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return not self._snap.dir_mtimes and self.root.is_dir()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Пересобрать снимок, если папка изменилась (или force). True — снимок заменён."""
+        with self._refresh_lock:
+            if not force and not self.is_stale():
+                return False
+            self._snap = _scan(self.root, self.base)
+            return True
+
+    def start(self, interval: float = ASSET_RESCAN_S) -> "AssetIndex":
+        if interval > 0 and self._watcher is None:
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.refresh()
+                    except Exception:
+                        pass
+            self._watcher = threading.Thread(target=loop, name="asset-index", daemon=True)
+            self._watcher.start()
+        return self
+
+    # ── Разрешение путей (без обращений к ФС) ──
+    def resolve(self, p: str) -> Tuple[str, bool]:
+        """
+        Путь из meta/Markdown → (путь для st.image, найден ли файл).
+        Кандидаты в том же порядке, что и прежний перебор в app.py:
+        от корня проекта, от 03_assets, по имени файла, с заменой первой папки на 03_assets.
+        """
+        if not p:
+            return "", False
+        p = str(p).strip()
+        if p.startswith("http://") or p.startswith("https://"):
+            return p, True
+        snap = self._snap
+        if _WIN_ABS_RE.match(p) or os.path.isabs(p):
+            if p in snap.abs_paths:
+                return p, True
+            if _WIN_ABS_RE.match(p):
+                return p, False
+        rel = p.lstrip("/\\").replace("\\", "/")
+        tail = "/".join(rel.split("/")[1:])
+        for key in (rel, f"{self._assets_prefix}/{rel}", None, f"{self._assets_prefix}/{tail}"):
+            if key is None:
+                found = snap.by_name.get(posixpath.basename(rel))
+            else:
+                found = snap.by_rel.get(posixpath.normpath(key))
+            if found:
+                return found, True
+        return str(self.base / rel), False
+
+    def stats(self) -> Dict[str, object]:
+        snap = self._snap
+        return {"files": len(snap.by_rel), "dirs": len(snap.dir_mtimes),
+                "scan_s": round(snap.scan_s, 3), "scanned_at": time.strftime("%H:%M:%S", time.localtime(snap.scanned_at))}
+
+resources.registry.register("asset_index", lambda: AssetIndex().start())
+
+def get_asset_index() -> AssetIndex:
+    return resources.registry.get("asset_index")
+
+def resolve_image_path(p: str) -> Tuple[str, bool]:
+    return get_asset_index().resolve(p)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+batching.py — микробатчинг эмбеддингов запросов
+
+Когда ищут несколько аналитиков сразу (server.py, несколько сессий Streamlit),
+каждый запрос раньше звал model.encode с батчем из одного элемента. На CPU
+MiniLM и CLIP кодируют батч из 16 почти за то же время, что и один элемент.
+
+MicroBatcher стоит перед моделью: вызывающий поток кладёт элемент в очередь и
+ждёт свой вектор; фоновый поток берёт первый элемент, добирает всё, что пришло
+за EMBED_BATCH_WAIT_MS (но не больше EMBED_MAX_BATCH), и кодирует одним encode.
+Пока идёт encode, новые запросы копятся в очереди и уйдут следующим батчем.
+Окно ожидания включается только под нагрузкой — одиночный запрос идёт в модель сразу.
+
+Гистограммы размера батча и ожидания в очереди — stats() / all_stats()
+(сайдбар app.py, /api/health в server.py) и metrics.render_prometheus() (/metrics, METRICS_FILE).
+"""
+
+import os
+import time
+import queue
+import bisect
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+EMBED_MICROBATCH    = os.getenv("EMBED_MICROBATCH", "true").lower() == "true"
+EMBED_MAX_BATCH     = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+WAIT_MS_BUCKETS    = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+# ── Гистограмма (кумулятивные корзины «≤ le», как в Prometheus) ────────────────
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)   # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total, n = list(self._counts), self.sum, self.count
+        cumulative, acc = [], 0
+        for le, c in zip(list(self.buckets) + ["+Inf"], counts):   # строка — чтобы снимок был валидным JSON
+            acc += c
+            cumulative.append((le, acc))
+        return {"buckets": cumulative, "sum": total, "count": n, "mean": (total / n) if n else None}
+
+# ── Планировщик ────────────────────────────────────────────────────────────────
+_batchers: List["MicroBatcher"] = []
+
+class MicroBatcher:
+    """
+    submit(item) — блокирующий вызов из любого потока, возвращает encode_batch(...)[i] для своего item.
+    encode_batch получает список элементов и возвращает последовательность результатов той же длины.
+    """
+
+    def __init__(self, name: str, encode_batch: Callable[[List[Any]], Sequence[Any]],
+                 max_batch: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_BATCH_WAIT_MS):
+        self.name = name
+        self.encode_batch = encode_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self.batches = 0
+        self._last_size = 0
+        _batchers.append(self)
+
+    def submit(self, item: Any) -> Any:
+        fut: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, fut, time.perf_counter()))
+        return fut.result()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"microbatch-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[Any, Future, float]]:
+        batch = [self._queue.get()]
+        # одиночный запрос без конкурентов не ждёт окно: ждём, только если уже есть нагрузка
+        # (прошлый батч был больше одного или очередь не пуста)
+        busy = self._last_size > 1 or not self._queue.empty()
+        deadline = time.perf_counter() + (self.max_wait if busy else 0.0)
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())   # то, что накопилось, пока шёл прошлый encode
+                continue
+            except queue.Empty:
+                pass
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            self._last_size = len(batch)
+            started = time.perf_counter()
+            self.batches += 1
+            self.batch_sizes.observe(len(batch))
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+            try:
+                out = self.encode_batch([item for item, _, _ in batch])
+                if len(out) != len(batch):
+                    raise RuntimeError(f"{self.name}: encode вернул {len(out)} результатов на {len(batch)} входов")
+                for (_, fut, _), res in zip(batch, out):
+                    fut.set_result(res)
+            except BaseException as e:  # ошибка модели — каждому ждущему, поток живёт дальше
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name, "max_batch": self.max_batch, "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches, "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(), "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+def all_stats() -> List[Dict[str, Any]]:
+    return [b.stats() for b in _batchers]
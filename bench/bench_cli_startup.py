@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+bench/bench_cli_startup.py — бюджет холодного старта cli.py
+
+Каждая команда запускается отдельным процессом (`python -X importtime cli.py …`)
+несколько раз; берётся лучшее время. Проверяется:
+1) команды без эмбеддингов (`--help`, `stats`, `index-text --help`) укладываются
+   в CLI_STARTUP_BUDGET_S (по умолчанию 1.0 с);
+2) они не импортируют тяжёлые модули: chromadb, llama_index, torch,
+   sentence_transformers, openai, transformers.
+Код выхода 1 — бюджет превышен или тяжёлый модуль протёк в импорт. Запуск из корня проекта:
+
+    python bench/bench_cli_startup.py [--repeat 5] [--budget 1.0]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CLI = BASE_DIR / "cli.py"
+
+CLI_STARTUP_BUDGET_S = float(os.getenv("CLI_STARTUP_BUDGET_S", "1.0"))
+COMMANDS = [["--help"], ["stats"], ["stats", "--json"], ["index-text", "--help"], ["index-images", "--help"]]
+HEAVY = ("chromadb", "llama_index", "torch", "sentence_transformers", "openai", "transformers")
+
+_IMPORT_RE = re.compile(r"^import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def run_once(args: List[str]) -> Tuple[float, Dict[str, float]]:
+    """(время процесса, {модуль верхнего уровня: кумулятивные мс импорта})."""
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", str(CLI), *args], cwd=BASE_DIR,
+                          capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(f"cli.py {' '.join(args)} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+    modules: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        m = _IMPORT_RE.match(line)
+        if m:
+            top = m.group(3).split(".")[0]
+            modules[top] = max(modules.get(top, 0.0), int(m.group(1)) / 1000.0)
+    return wall, modules
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Бюджет холодного старта cli.py.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=CLI_STARTUP_BUDGET_S, help="секунд на команду")
+    parser.add_argument("--top", type=int, default=5, help="сколько самых дорогих импортов показать")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for cmd in COMMANDS:
+        runs = [run_once(cmd) for _ in range(max(1, args.repeat))]
+        wall, modules = min(runs, key=lambda r: r[0])
+        heavy = sorted(m for m in modules if m in HEAVY)
+        ok = wall <= args.budget and not heavy
+        failed |= not ok
+        top = ", ".join(f"{m} {ms:.0f}ms" for m, ms in sorted(modules.items(), key=lambda kv: -kv[1])[: args.top])
+        print(f"{'OK  ' if ok else 'FAIL'} cli.py {' '.join(cmd):<22} {wall:6.3f}s (бюджет {args.budget:.2f}s)  {top}")
+        if heavy:
+            print(f"     тяжёлые импорты: {', '.join(heavy)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
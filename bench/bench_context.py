@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+bench/bench_context.py — промпт LLM до и после context_pack.py
+
+Индексирует синтетический корпус (bench/synth_corpus.py) во временной папке, как
+bench_suite.py, и для каждого запроса берёт выдачу search_text (с rerank, как в app.py).
+Затем дважды отвечает через rag.llm_answer на локальной заглушке (bench/llm_standin.py):
+CONTEXT_PACK=false — format_cite top-5 как раньше, CONTEXT_PACK=true — упакованный
+контекст. Заглушка тратит --prefill-ms на каждые 1000 токенов промпта до первого куска,
+как prefill настоящей модели, поэтому меньший промпт даёт и более ранний первый токен.
+По каждому запросу печатается: токены промпта до/после, сэкономлено, фрагментов,
+время до первого токена до/после. Итог (p50) и строки — JSON в bench/results/.
+Кэш ответов выключен, порядок «до/после» чередуется.
+
+    python bench/bench_context.py                               # 300 документов, 20 запросов
+    python bench/bench_context.py --budget 1000 --hits 8 --prefill-ms 400
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_suite  # noqa: E402
+import llm_standin  # noqa: E402
+import resources  # noqa: E402
+import synth_corpus  # noqa: E402
+import vector_store  # noqa: E402
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Токены промпта и время до первого токена до и после упаковки контекста.")
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--budget", type=int, default=None, help="LLM_CONTEXT_TOKENS (по умолчанию — из окружения)")
+    parser.add_argument("--hits", type=int, default=None, help="LLM_CONTEXT_HITS (по умолчанию — из окружения)")
+    parser.add_argument("--first-token-ms", type=float, default=150)
+    parser.add_argument("--prefill-ms", type=float, default=200, help="мс заглушки на 1000 токенов промпта")
+    parser.add_argument("--embedder", choices=["stub", "local"], default="stub")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="numpy")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="куда писать JSON")
+    args = parser.parse_args(argv)
+
+    base_url, app, stop = llm_standin.serve_in_thread(first_token_ms=args.first_token_ms, token_ms=1, tokens=5,
+                                                      prefill_ms=args.prefill_ms)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "standin")
+    import answer_cache
+    import context_pack
+    import rag
+    import retrieval
+
+    answer_cache.ANSWER_CACHE = False
+    if args.budget is not None:
+        context_pack.LLM_CONTEXT_TOKENS = args.budget
+    if args.hits is not None:
+        context_pack.LLM_CONTEXT_HITS = args.hits
+    embedder_name = bench_suite.install_embedder(args.embedder)
+    work = Path(tempfile.mkdtemp(prefix="ux_ctx_"))
+    rng = random.Random(args.seed)
+    result = {"suite": "bench_context", "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "git": bench_suite.git_info(), "embedder": embedder_name,
+              "params": {"docs": args.docs, "queries": args.queries, "budget": context_pack.LLM_CONTEXT_TOKENS,
+                         "hits": context_pack.LLM_CONTEXT_HITS, "first_token_ms": args.first_token_ms,
+                         "prefill_ms": args.prefill_ms, "tokenizer": context_pack.tokenizer_name()},
+              "rows": []}
+    failed = False
+    try:
+        client = vector_store.open_client(args.backend, str(work / args.backend))
+        paths, _ = synth_corpus.generate(args.docs, work / "texts", seed=args.seed)
+        idx = bench_suite.bench_index(paths, client, resources.TEXT_COLLECTION, work / "bm25", work / "sentences", 64)
+        resources.registry.set(f"collection:{resources.TEXT_COLLECTION}", idx["collection"])
+        retrieval.BM25_DIR = work / "bm25"
+        print(f"[{args.docs} docs, {idx['stats']['chunks']} чанков] бюджет {context_pack.LLM_CONTEXT_TOKENS} токенов, "
+              f"хитов {context_pack.LLM_CONTEXT_HITS}, токены: {context_pack.tokenizer_name()}")
+        print(f"{'запрос':<34} {'до':>6} {'после':>6} {'−ток.':>6} {'фрагм.':>6} {'TTFT до':>9} {'после':>8}")
+
+        rag.llm_answer("прогрев", retrieval.search_text("прогрев", 12), False)   # соединение в пул до замеров
+        for i, q in enumerate(bench_suite.make_queries(args.queries, rng)):
+            hits = retrieval.search_text(q, 12)
+            before, after = {}, {}
+            for packed in ((False, True) if i % 2 == 0 else (True, False)):
+                context_pack.CONTEXT_PACK = packed
+                rag.llm_answer(q, hits, False, report=after if packed else before)
+            before["prompt_tokens"] = context_pack.count_tokens(rag.build_prompt(q, hits))
+            if "ttft_ms" not in before or "ttft_ms" not in after:
+                failed = True
+                print(f"FAIL «{q}»: ответ LLM не получен")
+                continue
+            row = {"query": q, "prompt_tokens_before": before["prompt_tokens"], "prompt_tokens_after": after["prompt_tokens"],
+                   "tokens_saved": after["tokens_saved"], "fragments": after["fragments"], "hits": after["hits"],
+                   "truncated": after["truncated"], "ttft_ms_before": before["ttft_ms"], "ttft_ms_after": after["ttft_ms"]}
+            result["rows"].append(row)
+            print(f"{q[:34]:<34} {row['prompt_tokens_before']:>6} {row['prompt_tokens_after']:>6} {row['tokens_saved']:>6} "
+                  f"{row['fragments']:>6} {row['ttft_ms_before']:>7.0f}мс {row['ttft_ms_after']:>6.0f}мс")
+    finally:
+        stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    rows = result["rows"]
+    if rows:
+        med = lambda key: round(statistics.median(r[key] for r in rows), 1)
+        result["summary"] = {key: med(key) for key in ("prompt_tokens_before", "prompt_tokens_after", "tokens_saved",
+                                                       "ttft_ms_before", "ttft_ms_after")}
+        result["summary"]["saved_share"] = round(sum(r["tokens_saved"] for r in rows)
+                                                 / max(1, sum(r["prompt_tokens_before"] for r in rows)), 3)
+        s = result["summary"]
+        print(f"\np50: промпт {s['prompt_tokens_before']:.0f} → {s['prompt_tokens_after']:.0f} токенов "
+              f"(всего сэкономлено {s['saved_share']:.0%}), первый токен {s['ttft_ms_before']:.0f} → {s['ttft_ms_after']:.0f} мс")
+    out = args.out or bench_suite.RESULTS_DIR / f"bench_context-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"Результат → {out}")
+    return 1 if failed or not rows else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+bench/bench_llm.py — онлайн-ответ против локальной OpenAI-совместимой заглушки
+
+Поднимает bench/llm_standin.py в этом же процессе, направляет на неё llm.py
+(OPENAI_BASE_URL) и гоняет rag.summarize(…, offline_mode=False) на цитатах из корпуса.
+Проверяется:
+1) первый кусок ответа приходит быстрее --ttft-budget (по умолчанию 1 с);
+2) все запросы идут по одному keep-alive соединению (клиент общий, а не новый на поиск);
+3) офлайн-свод считается параллельно со стримом: ответ не дольше «LLM + запас»;
+4) сервер замолк посреди ответа → через LLM_BUDGET_S (здесь --budget) приходит
+   офлайн-фолбэк, а не вечный спиннер;
+5) семантический кэш ответов (answer_cache.py): вопрос с переставленными словами и
+   тем же контекстом отвечается без запроса к заглушке, другой контекст и новое
+   поколение текстового индекса (manifest.bump_generation) — снова через LLM.
+Проверки 1–4 идут с выключенным кэшем ответов: вопросы там нарочно похожи.
+Код выхода 1 — что-то не выполнено. Запуск из корня проекта:
+
+    python bench/bench_llm.py [--requests 10] [--budget 1.5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import llm_standin  # noqa: E402
+import synth_corpus  # noqa: E402
+
+def make_hits(n: int = 8):
+    pool = synth_corpus.sentence_pool()
+    return [{"id": f"standin-{i}", "text": " ".join(pool[i * 6:(i + 1) * 6]), "dist": None,
+             "meta": {"id": f"R-{i}", "title": "Синтетика", "iteration": "1", "date": "2024-01",
+                      "filename": f"doc{i}.md", "section_path": "H2: Сценарий", "chunk_index": f"{i}_0"}}
+            for i in range(n)]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Стриминг, пул соединений и бюджет LLM на локальной заглушке.")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=15)
+    parser.add_argument("--tokens", type=int, default=80)
+    parser.add_argument("--ttft-budget", type=float, default=1.0, help="секунд до первого куска")
+    parser.add_argument("--budget", type=float, default=1.5, help="LLM_BUDGET_S для проверки зависшего сервера")
+    args = parser.parse_args(argv)
+
+    base_url, app, stop = llm_standin.serve_in_thread(first_token_ms=args.first_token_ms,
+                                                      token_ms=args.token_ms, tokens=args.tokens)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "standin")
+    import answer_cache
+    import llm
+    import metrics
+    import rag
+    import resources
+    from manifest import bump_generation
+
+    hits = make_hits()
+    failed = False
+
+    def report(ok: bool, message: str) -> None:
+        nonlocal failed
+        failed |= not ok
+        print(("OK   " if ok else "FAIL ") + message)
+
+    try:
+        answer_cache.ANSWER_CACHE = False
+        ttft, total = [], []
+        for i in range(args.requests):
+            first = []
+            t0 = time.perf_counter()
+            llm_out, summary = rag.summarize(hits, f"вопрос {i}", offline_mode=False,
+                                             on_token=lambda text: first or first.append(time.perf_counter() - t0))
+            total.append(time.perf_counter() - t0)
+            ttft.append(first[0] if first else float("inf"))
+            if not summary or (llm_out or "").startswith(("**Итог (офлайн)", "Не удалось")):
+                report(False, f"запрос {i}: ответ LLM не получен: {(llm_out or '')[:120]}")
+        stream_s = (args.first_token_ms + args.token_ms * args.tokens) / 1000.0
+        p50_ttft, p50_total = statistics.median(ttft), statistics.median(total)
+        report(p50_ttft <= args.ttft_budget, f"первый кусок p50 {p50_ttft * 1000:.0f} мс (бюджет {args.ttft_budget * 1000:.0f} мс)")
+        report(p50_total <= stream_s + 0.25,
+               f"ответ целиком p50 {p50_total * 1000:.0f} мс (генерация заглушки {stream_s * 1000:.0f} мс, "
+               f"офлайн-свод — параллельно)")
+        stats = app[llm_standin.STATS]
+        report(len(stats["peers"]) == 1, f"{stats['requests']} запросов по {len(stats['peers'])} соединениям")
+
+        app[llm_standin.CONFIG]["stall_after"] = 5
+        llm.LLM_BUDGET_S = args.budget
+        before = {(c["metric"], tuple(c["labels"].items())): c["value"] for c in metrics.counter_stats()}
+        t0 = time.perf_counter()
+        llm_out, summary = rag.summarize(hits, "зависший сервер", offline_mode=False)
+        elapsed = time.perf_counter() - t0
+        after = {(c["metric"], tuple(c["labels"].items())): c["value"] for c in metrics.counter_stats()}
+        key = ("llm_fallbacks_total", (("reason", "budget"),))
+        report(elapsed <= args.budget + 0.5 and after.get(key, 0) == before.get(key, 0) + 1 and bool(summary),
+               f"зависший сервер: фолбэк через {elapsed:.2f} с (бюджет {args.budget} с): {(llm_out or '')[:60]}…")
+
+        app[llm_standin.CONFIG]["stall_after"] = None
+        answer_cache.ANSWER_CACHE = True
+        resources.registry.set("answer_cache", answer_cache.SemanticAnswerCache())   # без файла на диске
+        steps = [("как пользователи находят фильтры в каталоге", hits, 1),
+                 ("в каталоге пользователи как находят фильтры", hits[:4] + hits[5:6], 0),
+                 ("как пользователи находят фильтры в каталоге", hits[3:], 1)]
+        for q, ctx, expected in steps:
+            n0 = stats["requests"]
+            t0 = time.perf_counter()
+            llm_out, _ = rag.summarize(ctx, q, offline_mode=False)
+            elapsed = time.perf_counter() - t0
+            report(stats["requests"] - n0 == expected,
+                   f"кэш ответов: «{q}», чанков контекста общих {len({h['id'] for h in ctx[:5]} & {h['id'] for h in hits[:5]})}/5 → "
+                   f"{'LLM' if stats['requests'] > n0 else 'из кэша'} за {elapsed * 1000:.0f} мс")
+        bump_generation("text")
+        n0 = stats["requests"]
+        rag.summarize(hits, steps[0][0], offline_mode=False)
+        report(stats["requests"] - n0 == 1, "кэш ответов: после нового поколения индекса — снова LLM")
+        print(f"     {answer_cache.get_answer_cache().stats()}")
+    finally:
+        stop()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
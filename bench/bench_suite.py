@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+bench/bench_suite.py — бенчмарк индексации и поиска на синтетическом корпусе
+
+Для каждого размера корпуса (по умолчанию 10² / 10³ / 10⁴ документов, bench/synth_corpus.py):
+1) индексация по стадиям — parse (frontmatter), chunk (секции → чанки), embed, upsert
+   в Chroma (или NumPy-хранилище, --backend numpy), сборка BM25 и индекса предложений
+   (sentence_index.py); время и пропускная способность каждой стадии;
+2) задержки запросов p50/p95/p99 — эмбеддинг запроса, search_text (векторы, гибрид,
+   с where-фильтром), офлайн-своды (TF-IDF + TextRank — на лету и по готовым строкам
+   индекса предложений, экстрактивный);
+3) один раз — поиск по макету: индексация --images картинок и задержка запроса.
+
+Кэши запросов сбрасываются перед каждым замером — меряем холодный путь.
+Всё идёт во временной папке (своё хранилище векторов, BM25 и предложения), рабочий ./storage не трогается.
+Результат — JSON в bench/results/ (коммит, машина, параметры, метрики) — чтобы
+сравнивать прогоны между коммитами:
+
+    python bench/bench_suite.py                          # детерминированный stub-эмбеддер
+    python bench/bench_suite.py --embedder local --sizes 100 1000
+    python bench/bench_suite.py --backend numpy          # vector_store.py вместо Chroma
+    python bench/bench_suite.py --compare old.json new.json
+
+Работает офлайн: stub — хэширование токенов/пикселей в вектор, local — модели
+sentence-transformers из кэша (LOCAL_ST_MODEL / CLIP_MODEL).
+"""
+
+import os
+os.environ["OFFLINE_ONLY"] = "true"   # до импорта проекта: только локальные модели, без OpenAI
+
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import resources  # noqa: E402
+import synth_corpus  # noqa: E402
+import vector_store  # noqa: E402
+
+RESULTS_DIR = BASE_DIR / "bench" / "results"
+SUITE_VERSION = 1
+
+# ── Детерминированный эмбеддер ─────────────────────────────────────────────────
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+class StubModel:
+    """
+    Интерфейс SentenceTransformer.encode без весов: текст — feature hashing токенов,
+    картинка — уменьшенная копия в оттенках серого. Одинаковый вход → одинаковый вектор.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def _text(self, text: str, out: np.ndarray) -> None:
+        for tok in _TOKEN_RE.findall(text.lower()):
+            h = zlib.crc32(tok.encode("utf-8"))
+            out[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+
+    def _image(self, img, out: np.ndarray) -> None:
+        side = int(np.sqrt(self.dim))
+        px = np.asarray(img.convert("L").resize((side, self.dim // side)), dtype=np.float32).ravel() / 255.0
+        out[: px.size] = px - px.mean()
+
+    def encode(self, items, normalize_embeddings=True, convert_to_numpy=True, batch_size=32, **kw):
+        out = np.zeros((len(items), self.dim), dtype=np.float32)
+        for i, item in enumerate(items):
+            (self._text if isinstance(item, str) else self._image)(item, out[i])
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.where(norms > 0, norms, 1.0)
+        return out
+
+def install_embedder(kind: str) -> str:
+    if kind == "stub":
+        resources.registry.set("text_model", StubModel(384))
+        resources.registry.set("clip_model", StubModel(512))
+        return "stub(feature-hashing 384 / pixels 512)"
+    return f"local({resources.LOCAL_ST_MODEL}, {resources.CLIP_MODEL})"
+
+# ── Замеры ─────────────────────────────────────────────────────────────────────
+def latency(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if ms.size == 0:
+        return {"n": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"n": int(ms.size), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(ms.max()), 3)}
+
+def stage(seconds: float, items: int, unit: str) -> Dict[str, float]:
+    return {"s": round(seconds, 3), unit: items, f"{unit}_per_s": round(items / seconds, 1) if seconds > 0 else None}
+
+def timed(fn: Callable, samples: List[float], before: Optional[Callable] = None):
+    if before is not None:
+        before()
+    t0 = time.perf_counter()
+    out = fn()
+    samples.append(time.perf_counter() - t0)
+    return out
+
+def git_info() -> Dict[str, object]:
+    def run(*args):
+        return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=30).stdout.strip()
+    try:
+        return {"commit": run("rev-parse", "--short", "HEAD"), "subject": run("log", "-1", "--format=%s"),
+                "dirty": bool(run("status", "--porcelain", "--untracked-files=no"))}
+    except Exception:
+        return {"commit": None}
+
+# ── Индексация по стадиям ──────────────────────────────────────────────────────
+def bench_index(paths: List[Path], client, coll_name: str, bm25_dir: Path, sentences_dir: Path, batch: int) -> Dict:
+    import bm25
+    import sentence_index
+    import build_index as bi
+    from embeddings import get_text_embedder
+
+    t0 = time.perf_counter()
+    parsed = []
+    n_sections = 0
+    for p in paths:
+        front, body = bi.read_md_with_yaml(p)
+        parsed.append((front, body, bi.base_meta(front)))
+    t_parse = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    chunks = []   # (id, text, meta)
+    for front, body, base in parsed:
+        items = [(d.text, d.metadata) for d in bi.key_findings_docs(front, base)]
+        for task in bi.section_tasks(base, body):
+            n_sections += len(task[1])
+            items.extend(bi.chunk_sections(task))
+        for text, meta in items:
+            chunks.append((bi.chunk_id(meta.get("filename"), meta), text, bi.chroma_meta(meta)))
+    t_chunk = time.perf_counter() - t0
+    del parsed
+
+    try:
+        client.delete_collection(coll_name)
+    except Exception:
+        pass
+    collection = client.get_or_create_collection(coll_name)
+    embedder = get_text_embedder()
+    t_embed = t_upsert = 0.0
+    for i in range(0, len(chunks), batch):
+        part = chunks[i:i + batch]
+        t0 = time.perf_counter()
+        vectors = embedder.embed_documents([text for _, text, _ in part])
+        t_embed += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        collection.upsert(ids=[sid for sid, _, _ in part], documents=[text for _, text, _ in part],
+                          metadatas=[meta for _, _, meta in part], embeddings=vectors)
+        t_upsert += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    vector_store.persist(collection)   # NumPy-хранилище сбрасывает буфер на диск — это тоже запись
+    t_upsert += time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    bm25_meta = bm25.build(((sid, text) for sid, text, _ in chunks), bm25_dir)
+    t_bm25 = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    sent_meta = sentence_index.build(((sid, text) for sid, text, _ in chunks), sentences_dir)
+    t_sent = time.perf_counter() - t0
+
+    n = len(chunks)
+    return {
+        "collection": collection,
+        "stats": {
+            "docs": len(paths), "sections": n_sections, "chunks": n,
+            "parse": stage(t_parse, len(paths), "docs"),
+            "chunk": stage(t_chunk, n, "chunks"),
+            "embed": stage(t_embed, n, "chunks"),
+            "upsert": stage(t_upsert, n, "chunks"),
+            "bm25": {**stage(t_bm25, n, "chunks"), "terms": bm25_meta.get("n_terms")},
+            "sentences": {**stage(t_sent, n, "chunks"), "sentences": sent_meta.get("n_sents")},
+            "total_s": round(t_parse + t_chunk + t_embed + t_upsert + t_bm25 + t_sent, 3),
+        },
+    }
+
+# ── Запросы ────────────────────────────────────────────────────────────────────
+def make_queries(n: int, rng: random.Random) -> List[str]:
+    pool = synth_corpus.sentence_pool()
+    out = []
+    for _ in range(n):
+        words = rng.choice(pool).split()
+        w = rng.randint(3, min(8, max(3, len(words))))
+        start = rng.randint(0, max(0, len(words) - w))
+        out.append(" ".join(words[start:start + w]))
+    return out
+
+def bench_queries(queries: List[str], rng: random.Random, warmup: int = 5, sentences=None) -> Dict:
+    import retrieval
+    from embeddings import get_text_embedder
+    from filters import build_where
+    from summarize import offline_summary, summarize_tfidf_textrank
+
+    embedder = get_text_embedder()
+    cold = embedder.cache.clear
+    for q in queries[:warmup]:
+        retrieval.search_text(q, 12, hybrid=True)
+
+    s_embed, s_vec, s_hyb, s_plain, s_filt, s_tr, s_trp, s_off = [], [], [], [], [], [], [], []
+    for q in queries:
+        timed(lambda: embedder.embed_query(q), s_embed, cold)
+        timed(lambda: retrieval.search_text(q, 12, hybrid=False), s_vec, cold)
+        timed(lambda: retrieval.search_text(q, 12, hybrid=True, rerank=False), s_plain, cold)
+        hits = timed(lambda: retrieval.search_text(q, 12, hybrid=True), s_hyb, cold)
+        where, pred = build_where(iteration=str(rng.randint(1, 5)), vocab=set())
+        timed(lambda: retrieval.search_text(q, 12, where=where, pred=pred, hybrid=True), s_filt, cold)
+        timed(lambda: summarize_tfidf_textrank(hits, q, max_sentences=5), s_tr)
+        if sentences is not None:
+            timed(lambda: summarize_tfidf_textrank(hits, q, max_sentences=5, index=sentences), s_trp)
+        timed(lambda: offline_summary(hits, max_sent=4), s_off)
+    return {
+        "embed_query": latency(s_embed),
+        "search_text_vector": latency(s_vec),
+        "search_text_hybrid": latency(s_hyb),
+        "search_text_hybrid_no_rerank": latency(s_plain),
+        "search_text_filtered": latency(s_filt),
+        "summarize_tfidf_textrank": latency(s_tr),
+        "summarize_tfidf_textrank_precomputed": latency(s_trp),
+        "offline_summary": latency(s_off),
+    }
+
+# ── Поиск по макету ────────────────────────────────────────────────────────────
+def bench_images(fig_names: List[str], n_images: int, n_queries: int, work: Path, client,
+                 batch: int, rng: random.Random) -> Dict:
+    import rag
+    import build_images_index as bii
+    from embeddings import get_image_embedder
+
+    paths = synth_corpus.make_figures(fig_names[:n_images], work / "assets" / "synth")
+    try:
+        client.delete_collection(resources.IMAGE_COLLECTION)
+    except Exception:
+        pass
+    coll = client.get_or_create_collection(resources.IMAGE_COLLECTION)
+    resources.registry.set(f"collection:{resources.IMAGE_COLLECTION}", coll)
+    embedder = get_image_embedder()
+
+    t_decode = t_embed = t_upsert = 0.0
+    for i in range(0, len(paths), batch):
+        part = paths[i:i + batch]
+        t0 = time.perf_counter()
+        imgs = [bii.load_image(p) for p in part]
+        t_decode += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        embs = embedder.embed_images(imgs)
+        t_embed += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        coll.upsert(ids=[p.name for p in part], embeddings=embs.tolist(),
+                    metadatas=[{"path": str(p), "filename": p.name, "rel": p.name} for p in part])
+        t_upsert += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    vector_store.persist(coll)
+    t_upsert += time.perf_counter() - t0
+
+    samples: List[float] = []
+    for _ in range(n_queries):
+        data = rng.choice(paths).read_bytes()
+        timed(lambda: rag._search_images(data, 12), samples, embedder.cache.clear)
+    n = len(paths)
+    return {
+        "images": n,
+        "index": {"decode": stage(t_decode, n, "images"), "embed": stage(t_embed, n, "images"),
+                  "upsert": stage(t_upsert, n, "images")},
+        "query": {"search_images": latency(samples)},
+    }
+
+# ── Сравнение двух прогонов ────────────────────────────────────────────────────
+def compare(old_path: Path, new_path: Path) -> None:
+    old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (old_path, new_path))
+    print(f"old: {old.get('git', {}).get('commit')}  new: {new.get('git', {}).get('commit')}  "
+          f"(embedder: {old.get('embedder')} / {new.get('embedder')})")
+    old_runs = {r["docs"]: r for r in old.get("runs", [])}
+    for run in new.get("runs", []):
+        prev = old_runs.get(run["docs"])
+        if prev is None:
+            continue
+        print(f"\n== {run['docs']} docs ==")
+        for name in ("parse", "chunk", "embed", "upsert", "bm25", "sentences"):
+            if name not in prev["index"] or name not in run["index"]:
+                continue
+            a, b = prev["index"][name]["s"], run["index"][name]["s"]
+            print(f"  index.{name:<8} {a:>9.3f}s → {b:>9.3f}s  ×{(a / b) if b else float('nan'):.2f}")
+        for name, lat in run["query"].items():
+            a = prev["query"].get(name, {}).get("p95_ms")
+            b = lat.get("p95_ms")
+            if a and b:
+                print(f"  {name:<26} p95 {a:>9.3f}ms → {b:>9.3f}ms  ×{a / b:.2f}")
+
+# ── main ───────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк индексации и поиска на синтетическом корпусе.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="число документов")
+    parser.add_argument("--embedder", choices=["stub", "local"], default="stub")
+    parser.add_argument("--queries", type=int, default=200, help="запросов на каждый размер")
+    parser.add_argument("--images", type=int, default=300, help="картинок для поиска по макету (0 — пропустить)")
+    parser.add_argument("--batch", type=int, default=64, help="чанков в батче embed/upsert")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=resources.VECTOR_BACKEND,
+                        help="хранилище векторов (vector_store.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", type=Path, default=None, help="папка для корпуса и индексов (по умолчанию временная)")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочую папку")
+    parser.add_argument("--out", type=Path, default=None, help="куда писать JSON")
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("OLD", "NEW"), help="сравнить два JSON и выйти")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    embedder_name = install_embedder(args.embedder)
+    import retrieval
+    import sentence_index
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="ux_bench_"))
+    work.mkdir(parents=True, exist_ok=True)
+    client = vector_store.open_client(args.backend, str(work / args.backend))
+    rng = random.Random(args.seed)
+    result = {
+        "suite": "bench_suite", "version": SUITE_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": git_info(),
+        "python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+        "embedder": embedder_name,
+        "params": {"sizes": args.sizes, "queries": args.queries, "images": args.images,
+                   "batch": args.batch, "seed": args.seed, "backend": args.backend},
+        "runs": [],
+    }
+    fig_names: List[str] = []
+    try:
+        for n_docs in args.sizes:
+            print(f"[{n_docs} docs] генерирую корпус…")
+            t0 = time.perf_counter()
+            paths, figs = synth_corpus.generate(n_docs, work / f"texts_{n_docs}", seed=args.seed)
+            fig_names = fig_names or figs
+            gen_s = time.perf_counter() - t0
+
+            print(f"[{n_docs} docs] индексирую по стадиям…")
+            bm25_dir = work / f"bm25_{n_docs}"
+            sentences_dir = work / f"sentences_{n_docs}"
+            idx = bench_index(paths, client, resources.TEXT_COLLECTION, bm25_dir, sentences_dir, args.batch)
+            resources.registry.set(f"collection:{resources.TEXT_COLLECTION}", idx["collection"])
+            retrieval.BM25_DIR = bm25_dir
+
+            print(f"[{n_docs} docs] {args.queries} запросов…")
+            query = bench_queries(make_queries(args.queries, rng), rng,
+                                  sentences=sentence_index.SentenceIndex.open(sentences_dir))
+            stats = idx["stats"]
+            result["runs"].append({"docs": n_docs, "generate_s": round(gen_s, 3), "figure_refs": len(figs),
+                                   "sections": stats.pop("sections"), "chunks": stats.pop("chunks"),
+                                   "index": {k: v for k, v in stats.items() if k != "docs"}, "query": query})
+            r = result["runs"][-1]
+            print(f"  chunks={r['chunks']}  index {r['index']['total_s']}s  "
+                  f"(embed {r['index']['embed']['chunks_per_s']}/s, upsert {r['index']['upsert']['chunks_per_s']}/s)  "
+                  f"hybrid p50/p95/p99 = {query['search_text_hybrid']['p50_ms']}/"
+                  f"{query['search_text_hybrid']['p95_ms']}/{query['search_text_hybrid']['p99_ms']} ms")
+            shutil.rmtree(work / f"texts_{n_docs}", ignore_errors=True)
+
+        if args.images and fig_names:
+            print(f"[images] {min(args.images, len(fig_names))} картинок…")
+            result["images"] = bench_images(fig_names, args.images, min(args.queries, 100), work, client,
+                                            args.batch, rng)
+            q = result["images"]["query"]["search_images"]
+            print(f"  search_images p50/p95/p99 = {q['p50_ms']}/{q['p95_ms']}/{q['p99_ms']} ms")
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(work, ignore_errors=True)
+
+    out = args.out or RESULTS_DIR / f"bench_suite-{time.strftime('%Y%m%d-%H%M%S')}-{result['git'].get('commit') or 'nogit'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"\nРезультат → {out}")
+
+if __name__ == "__main__":
+    main()
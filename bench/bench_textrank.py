@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+bench/bench_textrank.py — микро-бенчмарк офлайн-свода TF-IDF + TextRank
+
+Сравнивает прежнюю реализацию на списках Python (скопирована ниже как ref_*)
+с векторизованной summarize.py на 50 / 200 / 1000 предложениях из 02_clean_texts
+и проверяет, что ранжирование совпадает.
+
+Запуск (из корня проекта):
+    python bench/bench_textrank.py
+    python bench/bench_textrank.py --sizes 50 200 --repeat 5
+    python bench/bench_textrank.py --ref-max 200   # эталон на 1000 предложений считается минутами
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+import summarize  # noqa: E402
+
+# ── Прежняя реализация (эталон) ────────────────────────────────────────────────
+def ref_tokenize(text):
+    text = text.lower()
+    # убираем лишнее
+    text = re.sub(r"[^a-zа-я0-9ё\- ]+", " ", text)
+    # русские/английские стоп-слова (минимальный набор)
+    stop = set("""
+        и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
+        вот от меня еще нет о из ли же до ни кто это того потому этот какой где когда здесь там него нее них
+        при чем раз два три или либо также также-то чтобы для без про над под между около
+        the a an to of is are was were be been being this that these those and or not from by as with into onto about
+    """.split())
+    toks = [t for t in text.split() if t and t not in stop and len(t) > 2]
+    return toks
+
+def ref_sent_split(text):
+    parts = re.split(r"(?<=[.!?])\s+", text)
+    return [p.strip() for p in parts if len(p.strip()) > 0]
+
+def ref_build_tfidf(sentences):
+    # словарь
+    docs = [ ref_tokenize(s) for s in sentences ]
+    vocab = {}
+    for d in docs:
+        for t in d:
+            if t not in vocab:
+                vocab[t] = len(vocab)
+    # tf
+    tf = []
+    for d in docs:
+        vec = [0]*len(vocab)
+        for t in d:
+            vec[vocab[t]] += 1
+        tf.append(vec)
+    # idf
+    import math
+    df = [0]*len(vocab)
+    for j in range(len(vocab)):
+        for i in range(len(docs)):
+            if tf[i][j] > 0:
+                df[j] += 1
+    idf = [ math.log((1+len(docs))/(1+dfj))+1.0 for dfj in df ]
+    # tf-idf нормировка
+    tfidf = []
+    for i in range(len(docs)):
+        row = [ tf[i][j]*idf[j] for j in range(len(vocab)) ]
+        # l2
+        norm = math.sqrt(sum(x*x for x in row)) or 1.0
+        row = [x/norm for x in row]
+        tfidf.append(row)
+    return tfidf
+
+def ref_cosine(v1, v2):
+    s = 0.0
+    for a,b in zip(v1,v2):
+        s += a*b
+    return s
+
+def ref_textrank_scores(tfidf, damping=0.85, iters=30, eps=1e-6):
+    n = len(tfidf)
+    if n == 0:
+        return []
+    # матрица схожести (без диагонали)
+    sim = [[0.0]*n for _ in range(n)]
+    for i in range(n):
+        for j in range(i+1,n):
+            c = ref_cosine(tfidf[i], tfidf[j])
+            sim[i][j] = c
+            sim[j][i] = c
+    # нормировка по строкам
+    row_sum = [sum(sim[i]) for i in range(n)]
+    M = [[ (sim[i][j]/row_sum[i] if row_sum[i] > 0 else 0.0) for j in range(n)] for i in range(n)]
+    # PageRank
+    pr = [1.0/n]*n
+    for _ in range(iters):
+        new = [ (1.0-damping)/n + damping * sum(pr[j]*M[j][i] for j in range(n)) for i in range(n) ]
+        # проверка сходимости
+        diff = sum(abs(new[i]-pr[i]) for i in range(n))
+        pr = new
+        if diff < eps:
+            break
+    return pr
+
+def ref_summarize_tfidf_textrank(hits, query:str, max_sentences:int=5):
+    """Берём топ-хиты → режем на предложения → считаем TF-IDF и TextRank → возвращаем свод."""
+    text = " ".join((h.get("text") or "") for h in hits[:10])
+    # подмешаем сам запрос (даёт лёгкий приоритет словам из запроса)
+    text = (query or "") + ". " + text
+    sentences = ref_sent_split(text)
+    # фильтр слишком коротких
+    sentences = [s for s in sentences if len(ref_tokenize(s)) >= 5]
+    if not sentences:
+        return ""
+    tfidf = ref_build_tfidf(sentences)
+    ranks = ref_textrank_scores(tfidf)
+    # берём top-N по рангу, сохраняем порядок появления
+    idx_sorted = sorted(range(len(sentences)), key=lambda i: ranks[i], reverse=True)[:max_sentences]
+    idx_sorted = sorted(idx_sorted)
+    # лёгкая «склейка»: убираем дубликаты по началу
+    result = []
+    seen = set()
+    for i in idx_sorted:
+        s = sentences[i].strip()
+        key = s[:40].lower()
+        if key not in seen:
+            result.append(s)
+            seen.add(key)
+    return " ".join(result)
+
+# ── Бенчмарк ───────────────────────────────────────────────────────────────────
+def corpus_sentences() -> list:
+    """Все «содержательные» предложения корпуса (≥5 токенов, как в своде)."""
+    text = " ".join(p.read_text(encoding="utf-8") for p in sorted((BASE_DIR / "02_clean_texts").glob("*.md")))
+    sents = summarize._sent_split(re.sub(r"\s+", " ", text))
+    return [s for s in sents if len(summarize._tokenize(s)) >= 5]
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ref-max", type=int, default=1000, help="не гонять эталон на выборках больше N")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args(argv)
+
+    pool = corpus_sentences()
+    rnd = random.Random(args.seed)
+    print(f"Корпус: {len(pool)} предложений")
+    print(f"{'n':>6} {'vocab':>7} {'ref, s':>10} {'numpy, s':>10} {'speedup':>9}  ranking")
+    for n in args.sizes:
+        sample = [rnd.choice(pool) for _ in range(n)] if n > len(pool) else rnd.sample(pool, n)
+        toks = [summarize._tokenize(s) for s in sample]
+        vocab = len({t for ts in toks for t in ts})
+
+        new_ranks = summarize.rank_sentences(sample, toks)
+        t_new = best_of(lambda: summarize.rank_sentences(sample), args.repeat)
+
+        if n <= args.ref_max:
+            ref_ranks = None
+            def run_ref():
+                nonlocal ref_ranks
+                ref_ranks = ref_textrank_scores(ref_build_tfidf(sample))
+            t_ref = best_of(run_ref, 1 if n > 200 else args.repeat)
+            top = min(10, n)
+            # сравниваем веса top-k, а не индексы: у одинаковых предложений веса равны,
+            # и порядок между ними в эталоне решает шум округления
+            ref_top = np.sort(np.asarray(ref_ranks))[::-1][:top]
+            new_top = np.sort(new_ranks)[::-1][:top]
+            same_top = bool(np.allclose(ref_top, new_top, rtol=0, atol=1e-12))
+            max_diff = float(np.max(np.abs(np.asarray(ref_ranks) - new_ranks)))
+            verdict = f"top-{top} {'совпадает' if same_top else 'РАСХОДИТСЯ'}, max|Δ|={max_diff:.1e}"
+            print(f"{n:>6} {vocab:>7} {t_ref:>10.4f} {t_new:>10.4f} {t_ref / t_new:>8.0f}×  {verdict}")
+        else:
+            print(f"{n:>6} {vocab:>7} {'—':>10} {t_new:>10.4f} {'—':>9}  (эталон пропущен, --ref-max)")
+
+if __name__ == "__main__":
+    main()
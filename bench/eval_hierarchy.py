@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+bench/eval_hierarchy.py — иерархический поиск (hierarchy.py) против плоского
+
+Генерирует тематический синтетический корпус (bench/synth_corpus.py, --topics),
+индексирует его как bench_suite.py, строит ux_docs / ux_sections и для каждого
+запроса сравнивает векторную ветку search_text (BM25 не меняется и выключен):
+- полнота recall@k — какая доля плоского top-k нашлась иерархическим; в синтетике
+  одни и те же предложения темы повторяются в десятках документов, и равноудалённые
+  чанки делят top-k случайно — поэтому ещё «recall с ничьими»: иерархический хит
+  засчитан, если он не дальше k-го плоского;
+- близость — средний косинус top-k к запросу, иерархический / плоский (1.0 — не хуже);
+- задержки p50/p95 обоих путей (вектор запроса уже в кэше, меряется только поиск).
+Несколько --top-docs / --top-sections — несколько строк отчёта: видно, чем платится
+полнота за скорость. Всё во временной папке, рабочий ./storage не трогается.
+
+    python bench/eval_hierarchy.py                          # 2000 документов, NumPy-хранилище
+    python bench/eval_hierarchy.py --docs 5000 --backend chroma --top-docs 20 40 80
+"""
+
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import bench_suite  # noqa: E402
+import resources  # noqa: E402
+import synth_corpus  # noqa: E402
+import vector_store  # noqa: E402
+
+def build_levels(paths: List[Path], client, collection) -> Dict:
+    import build_index as bi
+    import hierarchy
+    from embeddings import get_text_embedder
+
+    for name in (resources.DOC_COLLECTION, resources.SECTION_COLLECTION):
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+    docs_coll = client.get_or_create_collection(resources.DOC_COLLECTION)
+    sections_coll = client.get_or_create_collection(resources.SECTION_COLLECTION)
+    t0 = time.perf_counter()
+    docs = []
+    for p in paths:
+        front, _ = bi.read_md_with_yaml(p)
+        docs.append((p.name, hierarchy.doc_text(front), bi.chroma_meta(bi.base_meta(front))))
+    res = hierarchy.build(collection, docs_coll, sections_coll, docs, [], get_text_embedder().embed_documents)
+    vector_store.persist(docs_coll)
+    vector_store.persist(sections_coll)
+    for name, coll in ((resources.DOC_COLLECTION, docs_coll), (resources.SECTION_COLLECTION, sections_coll)):
+        resources.registry.set(f"collection:{name}", coll)
+    return {**res, "build_s": round(time.perf_counter() - t0, 3)}
+
+def _cos(hits: List[Dict]) -> float:
+    # distance — квадрат L2 единичных векторов: cos = 1 − d/2
+    return float(np.mean([1.0 - h["dist"] / 2.0 for h in hits])) if hits else 0.0
+
+def evaluate(queries: List[str], k: int, top_docs: int, top_sections: int) -> Dict:
+    import hierarchy
+    import retrieval
+    from embeddings import get_text_embedder
+
+    hierarchy.HIER_TOP_DOCS, hierarchy.HIER_TOP_SECTIONS = top_docs, top_sections
+    t_flat, t_hier, recall, recall_ties, closeness = [], [], [], [], []
+    for q in queries:
+        get_text_embedder().embed_query(q)
+        flat = bench_suite.timed(lambda: retrieval.search_text(q, k, hybrid=False, rerank=False,
+                                                               hierarchical=False), t_flat)
+        hier = bench_suite.timed(lambda: retrieval.search_text(q, k, hybrid=False, rerank=False,
+                                                               hierarchical=True), t_hier)
+        if not flat:
+            continue
+        recall.append(len({h["id"] for h in flat} & {h["id"] for h in hier}) / len(flat))
+        worst = flat[-1]["dist"] + 1e-5
+        recall_ties.append(min(1.0, sum(h["dist"] <= worst for h in hier) / len(flat)))
+        base = _cos(flat)
+        closeness.append(_cos(hier) / base if base > 0 else 1.0)
+    flat_lat, hier_lat = bench_suite.latency(t_flat), bench_suite.latency(t_hier)
+    return {
+        "top_docs": top_docs, "top_sections": top_sections, "k": k,
+        "recall_at_k": round(float(np.mean(recall)), 4) if recall else None,
+        "recall_at_k_p10": round(float(np.percentile(recall, 10)), 4) if recall else None,
+        "recall_ties": round(float(np.mean(recall_ties)), 4) if recall_ties else None,
+        "closeness": round(float(np.mean(closeness)), 4) if closeness else None,
+        "flat": flat_lat, "hierarchical": hier_lat,
+        "speedup_p50": round(flat_lat["p50_ms"] / hier_lat["p50_ms"], 2) if hier_lat.get("p50_ms") else None,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Полнота и задержка иерархического поиска против плоского.")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--topics", type=int, default=40, help="тем в синтетическом корпусе")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=12)
+    parser.add_argument("--top-docs", type=int, nargs="+", default=[20, 40, 80])
+    parser.add_argument("--top-sections", type=int, default=None,
+                        help="секций на втором шаге (по умолчанию 3 × top-docs)")
+    parser.add_argument("--embedder", choices=["stub", "local"], default="stub")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="numpy")
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", type=Path, default=None, help="куда писать JSON")
+    args = parser.parse_args(argv)
+
+    embedder_name = bench_suite.install_embedder(args.embedder)
+    work = Path(tempfile.mkdtemp(prefix="ux_hier_"))
+    rng = random.Random(args.seed)
+    result = {"suite": "eval_hierarchy", "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "git": bench_suite.git_info(), "embedder": embedder_name,
+              "params": {"docs": args.docs, "topics": args.topics, "queries": args.queries, "k": args.k,
+                         "backend": args.backend, "seed": args.seed},
+              "runs": []}
+    try:
+        client = vector_store.open_client(args.backend, str(work / args.backend))
+        print(f"[{args.docs} docs, {args.topics} тем] генерирую и индексирую…")
+        paths, _ = synth_corpus.generate(args.docs, work / "texts", seed=args.seed, topics=args.topics)
+        idx = bench_suite.bench_index(paths, client, resources.TEXT_COLLECTION, work / "bm25",
+                                      work / "sentences", args.batch)
+        resources.registry.set(f"collection:{resources.TEXT_COLLECTION}", idx["collection"])
+        levels = build_levels(paths, client, idx["collection"])
+        result["index"] = {"chunks": idx["stats"]["chunks"], **levels}
+        print(f"  чанков {idx['stats']['chunks']}, секций {levels['sections']}, документов {levels['docs']} "
+              f"(уровни за {levels['build_s']} с)")
+
+        queries = bench_suite.make_queries(args.queries, rng)
+        print(f"{'docs':>5} {'sections':>8} {'recall@k':>9} {'c ничьими':>9} {'близость':>9} "
+              f"{'плоский p50/p95':>17} {'иерарх. p50/p95':>17} {'×':>6}")
+        for top_docs in args.top_docs:
+            run = evaluate(queries, args.k, top_docs, args.top_sections or 3 * top_docs)
+            result["runs"].append(run)
+            f, h = run["flat"], run["hierarchical"]
+            print(f"{top_docs:>5} {run['top_sections']:>8} {run['recall_at_k']:>9.3f} {run['recall_ties']:>9.3f} "
+                  f"{run['closeness']:>9.3f} "
+                  f"{f['p50_ms']:>8.2f}/{f['p95_ms']:<8.2f} {h['p50_ms']:>8.2f}/{h['p95_ms']:<8.2f} "
+                  f"{run['speedup_p50']:>6.2f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out = args.out or bench_suite.RESULTS_DIR / f"eval_hierarchy-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"\nРезультат → {out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
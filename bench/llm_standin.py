@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+bench/llm_standin.py — локальная заглушка OpenAI-совместимого чата для проверки llm.py
+
+POST /v1/chat/completions: stream=true — SSE-куски chat.completion.chunk, иначе один ответ.
+Текст ответа — предложения из 02_clean_texts (bench/synth_corpus.py), задержки настраиваются:
+--first-token-ms (до первого куска), --token-ms (между кусками), --tokens (сколько кусков),
+--stall-after N (после N кусков замолчать — проверка жёсткого бюджета LLM_BUDGET_S),
+--prefill-ms (мс на 1000 токенов промпта до первого куска, как prefill у настоящих
+моделей; токены — оценка len / CHARS_PER_TOKEN, как у context_pack.py без tiktoken).
+GET /stats — {"requests", "connections"}: сколько запросов пришло по скольким TCP-соединениям.
+
+    python bench/llm_standin.py --port 8099
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=x OFFLINE_ONLY=false streamlit run app.py
+
+bench/bench_llm.py поднимает её в том же процессе (serve_in_thread).
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import synth_corpus  # noqa: E402
+
+CHARS_PER_TOKEN = 3.5
+
+CONFIG = web.AppKey("config", dict)
+STATS = web.AppKey("stats", dict)
+
+def _words(n: int) -> list:
+    words = " ".join(synth_corpus.sentence_pool()[:200]).split()
+    return [(w if i == 0 else " " + w) for i, w in enumerate((words * (n // max(1, len(words)) + 1))[:n])]
+
+def _chunk(content: Any, finish: Any = None) -> str:
+    body = {"id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": int(time.time()),
+            "model": "standin", "choices": [{"index": 0, "delta": {} if content is None else {"content": content},
+                                             "finish_reason": finish}]}
+    return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+async def handle_chat(request: web.Request) -> web.StreamResponse:
+    cfg, stats = request.app[CONFIG], request.app[STATS]
+    stats["requests"] += 1
+    stats["peers"].add(request.transport.get_extra_info("peername") if request.transport else None)
+    body = await request.json()
+    words = _words(cfg["tokens"])
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages") or []) / CHARS_PER_TOKEN
+    await asyncio.sleep((cfg["first_token_ms"] + cfg["prefill_ms"] * prompt_tokens / 1000.0) / 1000.0)
+    if not body.get("stream"):
+        await asyncio.sleep(cfg["token_ms"] * len(words) / 1000.0)
+        return web.json_response({
+            "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()), "model": "standin",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": round(prompt_tokens), "completion_tokens": len(words), "total_tokens": len(words)},
+        })
+    resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    try:
+        await resp.prepare(request)
+        for i, w in enumerate(words):
+            if cfg["stall_after"] is not None and i >= cfg["stall_after"]:
+                await asyncio.sleep(3600)   # «сервер завис» — клиента выручает только бюджет
+            await resp.write(_chunk(w).encode("utf-8"))
+            await asyncio.sleep(cfg["token_ms"] / 1000.0)
+        # [DONE] и конец chunked-тела — одной записью, как у настоящих серверов
+        await resp.write_eof((_chunk(None, "stop") + "data: [DONE]\n\n").encode("utf-8"))
+    except ConnectionResetError:
+        pass   # клиент оборвал ответ по бюджету
+    return resp
+
+async def handle_stats(request: web.Request) -> web.Response:
+    stats = request.app[STATS]
+    return web.json_response({"requests": stats["requests"], "connections": len(stats["peers"])})
+
+def make_app(first_token_ms: float = 150, token_ms: float = 15, tokens: int = 80, stall_after=None,
+             prefill_ms: float = 0) -> web.Application:
+    app = web.Application()
+    app[CONFIG] = {"first_token_ms": first_token_ms, "token_ms": token_ms, "tokens": tokens, "stall_after": stall_after,
+                   "prefill_ms": prefill_ms}
+    app[STATS] = {"requests": 0, "peers": set()}
+    app.router.add_post("/v1/chat/completions", handle_chat)
+    app.router.add_get("/stats", handle_stats)
+    return app
+
+def serve_in_thread(**config) -> Tuple[str, web.Application, Callable[[], None]]:
+    """(base_url вида http://127.0.0.1:PORT/v1, приложение — его CONFIG можно менять на ходу, stop())."""
+    app = make_app(**config)
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    box: Dict[str, Any] = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        box["port"] = site._server.sockets[0].getsockname()[1]
+        box["runner"] = runner
+        ready.set()
+        loop.run_forever()
+        loop.run_until_complete(runner.cleanup())
+
+    thread = threading.Thread(target=run, name="llm-standin", daemon=True)
+    thread.start()
+    ready.wait(10)
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+
+    return f"http://127.0.0.1:{box['port']}/v1", app, stop
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка чата со стримингом.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--first-token-ms", type=float, default=150)
+    parser.add_argument("--token-ms", type=float, default=15)
+    parser.add_argument("--tokens", type=int, default=80)
+    parser.add_argument("--stall-after", type=int, default=None)
+    parser.add_argument("--prefill-ms", type=float, default=0, help="мс на 1000 токенов промпта")
+    args = parser.parse_args(argv)
+    web.run_app(make_app(args.first_token_ms, args.token_ms, args.tokens, args.stall_after, args.prefill_ms),
+                host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
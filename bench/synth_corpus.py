@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+bench/synth_corpus.py — синтетический корпус отчётов в формате 02_clean_texts
+
+Каждый документ — YAML-frontmatter (id, title, project, product, iteration, date,
+tags, key_findings, …) и секции «## Сценарий N | Экран» с картинками
+![…](../03_assets/synth/<id>_figNN.png), задачей, анализом и выводами.
+Предложения берутся из настоящих отчётов (02_clean_texts) и перемешиваются —
+так у чанков реалистичная длина и словарь. Генерация детерминирована (seed).
+topics > 0 — пул делится на столько тем, и каждый документ (frontmatter и секции)
+пишется из предложений одной темы: как настоящие исследования про один продукт/экран.
+Без тем документы — случайная смесь, и у «исследования» нет своей темы вовсе.
+
+Запуск отдельно (из корня проекта):
+    python bench/synth_corpus.py --docs 1000 --out /tmp/synth
+"""
+
+import re
+import sys
+import random
+import argparse
+from pathlib import Path
+from typing import List, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+TEXTS_DIR = BASE_DIR / "02_clean_texts"
+
+PRODUCTS = ["Кредитная СберКарта", "Дебетовая карта", "Накопительный счёт", "Вклад", "Ипотека", "Кредит наличными"]
+PROJECTS = ["Кредитная карта", "Daily Banking", "Сбережения", "Кредиты"]
+SCREENS  = ["Главный экран", "Экран карты", "Внесён платёж", "Полный платёж", "Наличные", "Онбординг",
+            "Беспроцентные периоды", "Обязательный платёж", "История операций", "Уведомления"]
+TAGS     = ["UX", "SBOL", "credit card", "debt screen", "usability", "qualitative research", "onboarding",
+            "беспроцентный период", "обязательный платёж", "наличные", "уведомления", "B2C", "iteration 2"]
+METHODS  = ["Модерируемое UX-тестирование", "Немодерируемый тест", "Глубинные интервью", "First Click"]
+
+_STRIP_RE = re.compile(r"[*_`>#|]+")
+_SENT_RE  = re.compile(r"(?<=[.!?])\s+")
+
+# ── Пул предложений из настоящего корпуса ──────────────────────────────────────
+def sentence_pool(texts_dir: Path = TEXTS_DIR) -> List[str]:
+    pool: List[str] = []
+    for p in sorted(texts_dir.glob("*.md")):
+        text = p.read_text(encoding="utf-8", errors="ignore")
+        if text.startswith("---"):
+            text = text.split("---", 2)[-1]
+        for line in text.splitlines():
+            line = line.strip().lstrip("-").strip()
+            if not line or line.startswith("!") or line.startswith("#") or "|" in line:
+                continue
+            line = _STRIP_RE.sub("", line).strip()
+            for s in _SENT_RE.split(line):
+                if len(s) >= 30:
+                    pool.append(s)
+    if not pool:  # без 02_clean_texts — минимальный запасной словарь
+        pool = [f"Респонденты {w} понимают {x} на экране {y}." for w in ("не", "частично", "полностью")
+                for x in ("беспроцентный период", "обязательный платёж", "проценты по наличным")
+                for y in SCREENS]
+    return sorted(set(pool))
+
+# ── Документ ───────────────────────────────────────────────────────────────────
+def _q(s: str) -> str:
+    return '"' + s.replace("\\", "/").replace('"', "'") + '"'
+
+def make_doc(i: int, rng: random.Random, pool: List[str],
+             sections: Tuple[int, int] = (4, 10), figs: Tuple[int, int] = (1, 3)) -> Tuple[str, str, List[str]]:
+    """(имя файла, текст, имена картинок)."""
+    year, month = rng.randint(2019, 2025), rng.randint(1, 12)
+    doc_id = f"S-{year}-{month:02d}-SYN-{i:05d}"
+    product = rng.choice(PRODUCTS)
+    tags = rng.sample(TAGS, rng.randint(3, 6))
+    findings = rng.sample(pool, min(len(pool), rng.randint(3, 6)))
+    lines = [
+        "---",
+        f"id: {_q(doc_id)}",
+        f"title: {_q('Синтетическое исследование: ' + rng.choice(SCREENS).lower() + f' №{i}')}",
+        f"project: {_q(rng.choice(PROJECTS))}",
+        f"product: {_q(product)}",
+        f"type: {_q('Юзабилити-тест / сценарное исследование')}",
+        f"goal: {_q(rng.choice(pool))}",
+        f"iteration: {_q(str(rng.randint(1, 5)))}",
+        f"method: {_q(rng.choice(METHODS) + f' ({rng.randint(5, 15)} интервью)')}",
+        f"date: {_q(f'{year}-{month:02d}')}",
+        'tools: ["Figma", "Zoom"]',
+        'authors: ["Synthetic Bench"]',
+        'source: "bench/synth_corpus.py"',
+        "key_findings:",
+        *[f"  - {_q(f)}" for f in findings],
+        'status: "завершено"',
+        "tags: [" + ", ".join(_q(t) for t in tags) + "]",
+        "---",
+        "",
+    ]
+    fig_names: List[str] = []
+    for s in range(1, rng.randint(*sections) + 1):
+        screen = rng.choice(SCREENS)
+        lines.append(f"## Сценарий {s} | {screen}  ")
+        lines.append(f"**Из исследования:** {doc_id}  ")
+        for _ in range(rng.randint(*figs)):
+            name = f"{doc_id}_fig{len(fig_names) + 1:02d}.png"
+            fig_names.append(name)
+            lines.append(f"![Сценарий {s} | {screen}](../03_assets/synth/{name})")
+        lines.append("")
+        lines.append(f"**Задача:** {rng.choice(pool)}")
+        lines.append("")
+        lines.append(f"**Анализ по {rng.randint(5, 15)} интервью:**")
+        lines.extend(f"- {x}  " for x in rng.sample(pool, min(len(pool), rng.randint(3, 7))))
+        lines.append("")
+        lines.append("**Выводы:**")
+        lines.extend(f"- {x}  " for x in rng.sample(pool, min(len(pool), rng.randint(2, 4))))
+        lines.append("")
+    return f"{doc_id}.md", "\n".join(lines), fig_names
+
+def topic_pools(pool: List[str], topics: int, seed: int = 42) -> List[List[str]]:
+    """Пул, случайно разбитый на topics непересекающихся частей."""
+    shuffled = list(pool)
+    random.Random(seed).shuffle(shuffled)
+    return [shuffled[t::topics] for t in range(topics)]
+
+def generate(n_docs: int, out_dir: Path, seed: int = 42, topics: int = 0) -> Tuple[List[Path], List[str]]:
+    """Пишет n_docs файлов в out_dir; возвращает (пути, все имена картинок по порядку)."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    pool = sentence_pool()
+    pools = topic_pools(pool, topics, seed) if topics > 0 else None
+    trng = random.Random(seed + 1)   # отдельный генератор: без тем корпус тот же, что и раньше
+    paths, figs = [], []
+    for i in range(n_docs):
+        name, text, fig_names = make_doc(i, rng, pools[trng.randrange(topics)] if pools else pool)
+        p = out_dir / name
+        p.write_text(text, encoding="utf-8")
+        paths.append(p)
+        figs.extend(fig_names)
+    return paths, figs
+
+# ── Картинки «макетов» ─────────────────────────────────────────────────────────
+def make_figures(names: List[str], out_dir: Path, seed: int = 42, size: Tuple[int, int] = (180, 360)) -> List[Path]:
+    """PNG-заглушки, похожие на экраны: шапка, карточки, кнопка — детерминированно по seed."""
+    from PIL import Image, ImageDraw
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    w, h = size
+    for name in names:
+        img = Image.new("RGB", size, (245, 245, 247))
+        d = ImageDraw.Draw(img)
+        accent = tuple(rng.randint(0, 220) for _ in range(3))
+        d.rectangle([0, 0, w, rng.randint(30, 60)], fill=accent)
+        y = 70
+        while y < h - 60:
+            ch = rng.randint(30, 80)
+            d.rounded_rectangle([10, y, w - 10, y + ch], radius=8, fill=(255, 255, 255), outline=(220, 220, 220))
+            for ly in range(y + 8, y + ch - 8, 12):
+                d.line([20, ly, 20 + rng.randint(40, w - 50), ly], fill=(120, 120, 120), width=3)
+            y += ch + rng.randint(6, 16)
+        d.rounded_rectangle([20, h - 50, w - 20, h - 15], radius=10, fill=accent)
+        p = out_dir / name
+        img.save(p)
+        paths.append(p)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетический корпус отчётов для бенчмарков.")
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--figures", type=int, default=0, help="сколько PNG-картинок нарисовать (0 — только ссылки)")
+    parser.add_argument("--topics", type=int, default=0, help="тем в корпусе (0 — документы без своей темы)")
+    args = parser.parse_args(argv)
+    paths, figs = generate(args.docs, args.out / "texts", args.seed, args.topics)
+    if args.figures:
+        make_figures(figs[: args.figures], args.out / "assets" / "synth", args.seed)
+    print(f"{len(paths)} документов, {len(figs)} ссылок на картинки → {args.out}")
+
+if __name__ == "__main__":
+    sys.exit(main())
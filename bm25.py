@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+bm25.py — компактный BM25-индекс по тем же chunk id, что и коллекция ux_research
+
+Зачем: MiniLM часто промахивается мимо точных продуктовых терминов
+(«обязательный платёж», «беспроцентный период», «БП»). Лексический поиск их ловит,
+а app.py сливает его с векторным через reciprocal-rank fusion (retrieval.py).
+
+Формат на диске (./storage/bm25/, всё — .npy, читается через mmap без разбора):
+- terms.npy     — отсортированный словарь стемов (U32), поиск терма — searchsorted;
+- offsets.npy   — int64[V+1], границы постингов терма;
+- docs.npy      — int32[P], номера чанков в постингах;
+- tfs.npy       — uint16[P], частота терма в чанке;
+- doc_len.npy   — int32[N], длина чанка в токенах;
+- ids.npy       — U*, chunk id по номеру;
+- meta.json     — N, avgdl, k1, b.
+Открытие индекса не читает постинги в память: страницы подтягивает ОС по мере запросов,
+и несколько процессов делят один page cache.
+"""
+
+import re
+import json
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BM25_VERSION = 1
+TERM_WIDTH   = 32          # стемы длиннее обрезаются (одинаково при сборке и запросе)
+K1, B        = 1.5, 0.75
+
+_WORD_RE = re.compile(r"[0-9a-zа-яё]+(?:-[0-9a-zа-яё]+)*", re.IGNORECASE)
+
+# русские/английские стоп-слова (без коротких аббревиатур: «БП», «КЦ» должны искаться)
+STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
+    вот от меня еще нет о из ли до ни кто это того потому этот какой где когда здесь там него нее них
+    при чем или либо также чтобы для без про над под между около
+    the a an to of is are was were be been being this that these those and or not from by as with into onto about
+""".split())
+
+# ── Нормализация: стемминг Snowball (если установлен) или грубое срезание окончаний ──
+try:
+    import snowballstemmer
+    _RU = snowballstemmer.stemmer("russian")
+    _EN = snowballstemmer.stemmer("english")
+except Exception:  # pragma: no cover — без snowballstemmer работает упрощённый вариант
+    _RU = _EN = None
+
+_RU_SUFFIXES = sorted("""
+    ами ями ого его ому ему ыми ими ой ей ый ий ая яя ое ее ые ие ую юю ов ев ам ям ах ях ом ем
+    ью ия ие ий ать ять ить еть ует ют ат ят ит ет ла ло ли а я о е ы и у ю ь
+""".split(), key=len, reverse=True)
+
+def _crude_stem(word: str) -> str:
+    for suf in _RU_SUFFIXES:
+        if len(word) - len(suf) >= 3 and word.endswith(suf):
+            return word[: -len(suf)]
+    return word
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if _RU is not None:
+        word = (_RU if re.search("[а-я]", word) else _EN).stemWord(word)
+    else:
+        word = _crude_stem(word)
+    return word[:TERM_WIDTH]
+
+def analyze(text: str) -> List[str]:
+    """Текст → стемы (без стоп-слов и одиночных символов)."""
+    out = []
+    for m in _WORD_RE.finditer(text or ""):
+        w = m.group(0).lower()
+        if len(w) < 2 or w in STOP_WORDS:
+            continue
+        out.append(stem(w))
+    return out
+
+# ── Сборка ─────────────────────────────────────────────────────────────────────
+def build(chunks: Iterable[Tuple[str, str]], out_dir: Path) -> dict:
+    """
+    chunks — поток (chunk_id, text). Постинги копим numpy-массивами по страницам,
+    затем одна сортировка по терму. Запись атомарная: во временную папку и rename.
+    """
+    t0 = time.perf_counter()
+    vocab: dict = {}
+    ids: List[str] = []
+    doc_len: List[int] = []
+    parts_t, parts_d, parts_f = [], [], []
+    for doc_no, (cid, text) in enumerate(chunks):
+        ids.append(cid)
+        toks = analyze(text)
+        doc_len.append(len(toks))
+        if not toks:
+            continue
+        tids, counts = np.unique(np.fromiter((vocab.setdefault(t, len(vocab)) for t in toks), dtype=np.int64),
+                                 return_counts=True)
+        parts_t.append(tids.astype(np.int32))
+        parts_d.append(np.full(len(tids), doc_no, dtype=np.int32))
+        parts_f.append(np.minimum(counts, 65535).astype(np.uint16))
+
+    n = len(ids)
+    term_ids = np.concatenate(parts_t) if parts_t else np.zeros(0, np.int32)
+    docs = np.concatenate(parts_d) if parts_d else np.zeros(0, np.int32)
+    tfs = np.concatenate(parts_f) if parts_f else np.zeros(0, np.uint16)
+
+    # перенумеруем термы в алфавитном порядке — тогда поиск терма это searchsorted
+    terms_unsorted = np.array(list(vocab.keys()) or [""], dtype=f"U{TERM_WIDTH}")[: len(vocab)]
+    alpha = np.argsort(terms_unsorted, kind="stable")
+    rank = np.empty(len(vocab), dtype=np.int32)
+    rank[alpha] = np.arange(len(vocab), dtype=np.int32)
+    term_ids = rank[term_ids] if len(term_ids) else term_ids
+    order = np.lexsort((docs, term_ids))
+    docs, tfs, term_ids = docs[order], tfs[order], term_ids[order]
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+
+    out_dir = Path(out_dir)
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(tmp / "terms.npy", terms_unsorted[alpha])
+    np.save(tmp / "offsets.npy", offsets)
+    np.save(tmp / "docs.npy", docs)
+    np.save(tmp / "tfs.npy", tfs)
+    np.save(tmp / "doc_len.npy", np.asarray(doc_len, dtype=np.int32))
+    np.save(tmp / "ids.npy", np.asarray(ids or [""], dtype=str)[:n])
+    meta = {
+        "version": BM25_VERSION, "n_docs": n, "n_terms": len(vocab), "n_postings": int(len(docs)),
+        "avgdl": float(np.mean(doc_len)) if doc_len else 0.0, "k1": K1, "b": B,
+        "stemmer": "snowball" if _RU is not None else "crude",
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    if out_dir.exists():
+        old = out_dir.with_name(out_dir.name + ".old")
+        if old.exists():
+            _rmtree(old)
+        out_dir.rename(old)
+        tmp.rename(out_dir)
+        _rmtree(old)
+    else:
+        tmp.rename(out_dir)
+    meta["build_s"] = round(time.perf_counter() - t0, 3)
+    return meta
+
+def _rmtree(p: Path) -> None:
+    for f in p.iterdir():
+        f.unlink()
+    p.rmdir()
+
+# ── Поиск ──────────────────────────────────────────────────────────────────────
+class BM25Index:
+    """Открытый через mmap индекс; search() — чистый numpy, без Python-циклов по постингам."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.terms, self.offsets = load("terms.npy"), load("offsets.npy")
+        self.docs, self.tfs = load("docs.npy"), load("tfs.npy")
+        self.doc_len, self.ids = load("doc_len.npy"), load("ids.npy")
+        self.n = int(self.meta["n_docs"])
+        self.avgdl = float(self.meta["avgdl"]) or 1.0
+        self.k1, self.b = float(self.meta["k1"]), float(self.meta["b"])
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["BM25Index"]:
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _term_id(self, term: str) -> int:
+        i = int(np.searchsorted(self.terms, term))
+        return i if i < len(self.terms) and self.terms[i] == term else -1
+
+    def search(self, query: str, k: int = 12) -> List[Tuple[str, float]]:
+        """Топ-k (chunk_id, score) по BM25."""
+        if self.n == 0:
+            return []
+        qterms = set(analyze(query))
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in qterms:
+            tid = self._term_id(term)
+            if tid < 0:
+                continue
+            lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = np.asarray(self.docs[lo:hi])
+            tf = np.asarray(self.tfs[lo:hi], dtype=np.float32)
+            df = hi - lo
+            idf = np.log(1.0 + (self.n - df + 0.5) / (df + 0.5))
+            dl = np.asarray(self.doc_len[docs], dtype=np.float32)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / self.avgdl))
+        hit = np.flatnonzero(scores)
+        if len(hit) == 0:
+            return []
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return [(str(self.ids[i]), float(scores[i])) for i in hit]
@@ -1,30 +1,50 @@
 # -*- coding: utf-8 -*-
 """
 build_images_index.py
-Сканирует 03_assets, строит эмбеддинги CLIP и кладёт их в Chroma (коллекция 'ux_images').
+Сканирует 03_assets, строит эмбеддинги CLIP и кладёт их в Chroma (коллекция 'ux_images')
+или, при `--backend numpy` / VECTOR_BACKEND=numpy, во встроенное хранилище vector_store.py.
 
 • Работает офлайн (sentence-transformers), интернет нужен только на первый скачанный вес CLIP.
+• CLIP берётся из embeddings.py — та же модель, что и во вкладке «По макету».
 • Метаданные: path (абсолютный), filename (имя файла), rel (относительный путь от корня проекта).
+• Инкрементально: манифест ./storage/images_manifest.json (rel → размер, mtime, sha256, id).
+  Эмбеддятся только новые/изменённые файлы, удалённые с диска — удаляются из коллекции.
+  `python build_images_index.py --full` — пересобрать коллекцию целиком.
+• id стабильный: img::<sha256 содержимого>::<хэш пути> — не зависит от порядка файлов.
+• Пул потоков декодирует и уменьшает картинки, пока CLIP кодирует предыдущий батч.
 """
 
 import os
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from PIL import Image
-import chromadb
-from sentence_transformers import SentenceTransformer
+
+import resources
+import vector_store
+from embeddings import get_image_embedder
+from manifest import bump_generation, empty_manifest, load_manifest, save_manifest, sha256_file
 
 # --------- Константы проекта ---------
 BASE_DIR = Path(__file__).resolve().parent
 ASSETS_DIR = (BASE_DIR / "03_assets").resolve()
 DB_DIR = (BASE_DIR / "storage" / "chroma").resolve()
+VECTOR_DIR = (BASE_DIR / "storage" / "vectors").resolve()
+MANIFEST_PATH = (BASE_DIR / "storage" / "images_manifest.json").resolve()
 
 COLLECTION_NAME = "ux_images"
 ALLOW_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
 
+BATCH       = int(os.getenv("IMAGE_BATCH", "32"))          # картинок на один вызов CLIP
+DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", "4"))
+RESIZE_SHORT = 256   # CLIP всё равно сводит короткую сторону к 224 — большие скриншоты уменьшаем заранее
+
 # --------- Утилиты ---------
-def iter_images(root: Path) -> List[Path]:
+def iter_images(root: Path) -> Iterator[Path]:
     for p in root.rglob("*"):
         if p.is_file() and p.suffix.lower() in ALLOW_SUFFIXES:
             yield p
@@ -35,81 +55,175 @@ def build_rel_path(p: Path) -> str:
     except Exception:
         return str(p).replace("\\", "/")
 
-def main():
+def image_id(content_sha: str, rel_path: str) -> str:
+    """Стабильный id: содержимое + путь (одинаковые картинки в разных папках не сливаются)."""
+    return f"img::{content_sha[:24]}::{hashlib.sha1(rel_path.encode('utf-8')).hexdigest()[:8]}"
+
+def load_image(p: Path) -> Image.Image:
+    """Декод + уменьшение в потоке пула (PIL отпускает GIL на декоде и ресайзе)."""
+    img = Image.open(p)
+    img.draft("RGB", (RESIZE_SHORT * 2, RESIZE_SHORT * 2))  # JPEG: декодируем сразу в уменьшенном масштабе
+    img = img.convert("RGB")
+    short = min(img.size)
+    if short > RESIZE_SHORT:
+        scale = RESIZE_SHORT / short
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.BICUBIC)
+    return img
+
+def _decode(job: Tuple[Path, Dict]) -> Tuple[Path, Dict, Optional[Image.Image], Optional[str]]:
+    p, entry = job
+    try:
+        return p, entry, load_image(p), None
+    except Exception as e:
+        return p, entry, None, str(e)
+
+def batched(items: List, size: int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# --------- Сканирование и дифф ---------
+def plan(files: List[Path], old_files: Dict) -> Tuple[Dict, List[Tuple[Path, Dict]], Dict]:
+    """
+    Возвращает (новый манифест файлов, очередь на эмбеддинг, счётчики).
+    Размер+mtime не изменились — файл даже не читаем; иначе считаем sha256.
+    """
+    files_out: Dict[str, Dict] = {}
+    todo: List[Tuple[Path, Dict]] = []
+    stats = {"new": 0, "changed": 0, "same": 0}
+    for p in files:
+        rel = build_rel_path(p)
+        st = p.stat()
+        prev = old_files.get(rel)
+        if prev and prev.get("size") == st.st_size and prev.get("mtime") == st.st_mtime_ns:
+            files_out[rel] = prev
+            stats["same"] += 1
+            continue
+        sha = sha256_file(p)
+        entry = {"size": st.st_size, "mtime": st.st_mtime_ns, "sha256": sha, "id": image_id(sha, rel)}
+        if prev and prev.get("id") == entry["id"]:
+            files_out[rel] = entry   # touch без изменения содержимого
+            stats["same"] += 1
+            continue
+        stats["changed" if prev else "new"] += 1
+        todo.append((p, entry))
+    return files_out, todo, stats
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Индексация 03_assets в Chroma (CLIP, инкрементально).")
+    parser.add_argument("--full", action="store_true", help="пересобрать коллекцию целиком")
+    parser.add_argument("--batch", type=int, default=BATCH, help=f"картинок в батче CLIP (по умолчанию {BATCH})")
+    parser.add_argument("--workers", type=int, default=DECODE_WORKERS, help="потоков на декодирование")
+    parser.add_argument("--backend", choices=("chroma", "numpy"), default=resources.VECTOR_BACKEND,
+                        help=f"хранилище векторов (по умолчанию VECTOR_BACKEND={resources.VECTOR_BACKEND})")
+    args = parser.parse_args(argv)
+
     if not ASSETS_DIR.exists():
         raise SystemExit(f"Не найдена папка с ассетами: {ASSETS_DIR}")
 
     print(f"[1/4] Сканирую изображения в: {ASSETS_DIR}")
-    files = list(iter_images(ASSETS_DIR))
+    files = sorted(iter_images(ASSETS_DIR))
     if not files:
         raise SystemExit("В 03_assets нет изображений (*.png/jpg/jpeg/webp). Добавь файлы и повтори.")
 
     print(f"  Найдено файлов: {len(files)}")
 
-    print("[2/4] Инициирую Chroma…")
-    client = chromadb.PersistentClient(path=str(DB_DIR))
-    # Создаём коллекцию (очистим, чтобы не плодить дубликаты)
-    try:
-        coll = client.get_collection(COLLECTION_NAME)
-    except Exception:
-        coll = client.create_collection(COLLECTION_NAME)
+    embedder = get_image_embedder()
+    old = load_manifest(MANIFEST_PATH)
+    full = (args.full or not old or old.get("embedder") != embedder.name
+            or old.get("backend", "chroma") != args.backend)
 
-    # Полная очистка коллекции
-    try:
-        coll.delete(where={})
-        print("  Коллекция очистилась (upsert по-честному).")
-    except Exception:
-        print("  Не удалось очистить коллекцию — продолжу добавление поверх.")
-
-    print("[3/4] Загружаю CLIP-модель (sentence-transformers: clip-ViT-B-32)…")
-    model = SentenceTransformer("clip-ViT-B-32")  # офлайн, если веса уже на диске
-
-    # Батч-обработка (бережём память)
-    BATCH = 32
-    added = 0
-    ids, embs, metas, docs = [], [], [], []
-
-    def flush_batch():
-        nonlocal ids, embs, metas, docs, added
-        if not ids:
-            return
-        coll.add(ids=ids, embeddings=embs, metadatas=metas, documents=docs)
-        added += len(ids)
-        print(f"  + {len(ids)} (всего: {added})")
-        ids, embs, metas, docs = [], [], [], []
-
-    print("[4/4] Кодирую и добавляю в коллекцию…")
-    for idx, p in enumerate(files, start=1):
+    store_dir = VECTOR_DIR if args.backend == "numpy" else DB_DIR
+    print(f"[2/4] Открываю хранилище векторов ({args.backend})…")
+    client = vector_store.open_client(args.backend, str(store_dir))   # chromadb — только при backend=chroma
+    if full:
+        # полная пересборка: коллекцию сносим, а не чистим delete(where={})
         try:
-            img = Image.open(p).convert("RGB")
-        except Exception as e:
-            print(f"  ! Пропуск (не читается): {p} ({e})")
-            continue
-
-        # эмбеддинг
-        emb = model.encode([img], convert_to_numpy=True, normalize_embeddings=True)[0]
-
-        # айди и метаданные
-        fid = f"img::{p.stem}::{idx}"  # уникализация
-        abs_path = str(p.resolve())
-        rel_path = build_rel_path(p)
-
-        ids.append(fid)
-        embs.append(emb.tolist())
-        metas.append({
-            "path": abs_path,            # абсолютный для st.image
-            "filename": p.name,          # для подписи
-            "rel": rel_path,             # на всякий случай
-        })
-        docs.append(rel_path)  # документ = относительный путь
-
-        if len(ids) >= BATCH:
-            flush_batch()
-
-    flush_batch()
-
+            client.delete_collection(COLLECTION_NAME)
+        except Exception:
+            pass
+        old = empty_manifest()
+    coll = client.get_or_create_collection(COLLECTION_NAME)
+
+    old_files = old.get("files", {})
+    files_out, todo, stats = plan(files, old_files)
+    present = set(files_out) | {build_rel_path(p) for p, _ in todo}
+
+    # удалённые файлы и старые версии изменённых
+    stale = [e["id"] for rel, e in old_files.items() if rel not in present]
+    stale += [old_files[build_rel_path(p)]["id"] for p, _ in todo if build_rel_path(p) in old_files]
+    if stale:
+        coll.delete(ids=stale)
+    print(f"  Новых: {stats['new']}, изменённых: {stats['changed']}, без изменений: {stats['same']}, "
+          f"удалено из индекса: {len(stale)}")
+
+    # манифест сразу отражает удаления; изменённые файлы допишутся после записи их векторов
+    manifest = empty_manifest(embedder=embedder.name, backend=args.backend)
+    manifest["files"] = files_out
+
+    def commit():
+        """Сначала векторы (NumPy-хранилище копит их в памяти), потом манифест:
+        манифест не должен помнить картинки, которых нет в хранилище."""
+        vector_store.persist(coll)
+        save_manifest(MANIFEST_PATH, manifest)
+
+    commit()
+    if not todo:
+        if stale:
+            bump_generation("images")
+        print("\nГотово ✅ Индекс изображений актуален.")
+        return
+
+    print(f"[3/4] Загружаю CLIP-модель ({embedder.name})…")
+    print(f"[4/4] Кодирую и добавляю в коллекцию (батч {args.batch}, потоков декодирования {args.workers})…")
+    t0 = time.perf_counter()
+    last_commit = time.monotonic()
+    added, skipped = 0, 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="decode") as pool:
+            # prefetch: следующий батч декодируется, пока CLIP кодирует текущий
+            batches = list(batched(todo, args.batch))
+            pending = pool.map(_decode, batches[0])
+            for bi in range(len(batches)):
+                decoded = list(pending)
+                if bi + 1 < len(batches):
+                    pending = pool.map(_decode, batches[bi + 1])
+
+                ok = [(p, e, img) for p, e, img, err in decoded if img is not None]
+                for p, _, _, err in decoded:
+                    if err is not None:
+                        skipped += 1
+                        print(f"  ! Пропуск (не читается): {p} ({err})")
+                if ok:
+                    embs = embedder.embed_images([img for _, _, img in ok])
+                    coll.upsert(
+                        ids=[e["id"] for _, e, _ in ok],
+                        embeddings=embs.tolist(),
+                        metadatas=[{
+                            "path": str(p.resolve()),       # абсолютный для st.image
+                            "filename": p.name,             # для подписи
+                            "rel": build_rel_path(p),       # на всякий случай
+                            "sha256": e["sha256"],
+                        } for p, e, _ in ok],
+                        documents=[build_rel_path(p) for p, _, _ in ok],  # документ = относительный путь
+                    )
+                    for p, e, _ in ok:
+                        manifest["files"][build_rel_path(p)] = e
+                    added += len(ok)
+                    # сброс NumPy-хранилища переписывает коллекцию — не на каждый батч
+                    if time.monotonic() - last_commit >= vector_store.VECTOR_FLUSH_S:
+                        commit()
+                        last_commit = time.monotonic()
+                rate = added / (time.perf_counter() - t0)
+                print(f"  + {len(ok)} (всего: {added}/{len(todo)}, {rate:.1f} img/s)")
+    finally:
+        commit()     # и при падении: записанное не пропадёт, следующий запуск продолжит
+
+    gen = bump_generation("images")   # кэш результатов поиска по макету устаревает сам
     print("\nГотово ✅")
-    print(f"Индекс изображений собран: коллекция '{COLLECTION_NAME}', хранилище: {DB_DIR}")
+    print(f"Поколение индекса изображений: {gen}")
+    print(f"Индекс изображений собран: коллекция '{COLLECTION_NAME}' ({coll.count()} шт.), хранилище: {store_dir}")
+    if skipped:
+        print(f"Пропущено нечитаемых файлов: {skipped}")
     print("Теперь во вкладке «🖼 По макету» можно искать похожие интерфейсы по картинке.")
 
 if __name__ == "__main__":
@@ -6,8 +6,27 @@ build_index.py — индексация UX-исследований в Chroma с
 1) Читает все .md из ./02_clean_texts с YAML-frontmatter.
 2) Разбивает Markdown на секции по заголовкам #..######, строит "section_path" (хлебные крошки).
 3) Для каждой секции вытаскивает до 3 изображений (![](...)) — именно их и кладёт в meta["images"].
-4) Делит текст секции на чанки (SentenceSplitter) и сохраняет в коллекцию "ux_research" (./storage/chroma).
+4) Делит текст секции на чанки (SentenceSplitter) и сохраняет в коллекцию "ux_research"
+   (./storage/chroma; `--backend numpy` или VECTOR_BACKEND=numpy — ./storage/vectors, vector_store.py).
 5) Поддерживает офлайн-эмбеддинги через sentence-transformers (OFFLINE_ONLY=true в .env).
+   Эмбеддер общий с app.py (embeddings.py), имя модели пишется в метаданные коллекции.
+6) Инкрементально: манифест ./storage/index_manifest.json хранит хэши файлов и чанков,
+   эмбеддятся только новые/изменённые чанки, исчезнувшие id удаляются.
+   `python build_index.py --full` — полная пересборка.
+7) Потоково: чанки идут батчами по INDEX_BATCH; эмбеддинг батча N+1 идёт параллельно
+   с записью батча N в Chroma (ограниченная очередь), память не растёт с корпусом.
+8) Параллельно: `--workers N` (или INDEX_WORKERS) разносит нарезку файлов — и секций
+   больших файлов — по пулу процессов; id и порядок чанков те же, что и без пула.
+9) После изменений пересобирает BM25-индекс ./storage/bm25 (bm25.py) по тем же chunk id —
+   app.py сливает лексический и векторный поиск (retrieval.py).
+10) Там же пересобирает ./storage/sentences (sentence_index.py): предложения чанков,
+   их токены и строки TF-IDF по словарю и IDF всего корпуса — офлайн-своды на запросе
+   только собирают готовые строки.
+11) Держит два верхних уровня для поиска «исследование → секция → чанк» (hierarchy.py):
+   ux_docs — вектор title + goal + key_findings файла вместе с центроидом его чанков,
+   ux_sections — центроиды чанков секций; пересчитываются только изменённые файлы.
+12) Пишет ./storage/section_images.json: (filename, section_path) → картинки секции —
+   app.py берёт превью оттуда, не перечитывая исходный Markdown на каждый поиск.
 
 Важно:
 - В meta["images"] кладётся СПИСОК строк путей из Markdown (напр. "/03_assets/fig.png"), не json.dumps.
@@ -19,42 +38,66 @@ import re
 import yaml
 import json
 import pathlib
-from typing import List, Dict, Tuple, Optional
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Deque, Iterator, List, Dict, Tuple, Optional
 
 from dotenv import load_dotenv
 load_dotenv()
 
 # ── Параметры проекта ──────────────────────────────────────────────────────────
-DATA_DIR = pathlib.Path("./02_clean_texts")   # где лежат .md
-DB_DIR   = "./storage/chroma"                 # куда пишет Chroma
-COLL_NAME = "ux_research"                     # имя коллекции (должно совпадать с app.py)
-
-OFFLINE_ONLY      = os.getenv("OFFLINE_ONLY", "true").lower() == "true"
-OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-large")
-LOCAL_ST_MODEL     = os.getenv("LOCAL_ST_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# пути — от папки скрипта, как у читателей (resources.py, filters.py, retrieval.py…), а не от cwd
+BASE_DIR = pathlib.Path(__file__).resolve().parent
+DATA_DIR = BASE_DIR / "02_clean_texts"                        # где лежат .md
+DB_DIR   = str(BASE_DIR / "storage" / "chroma")               # куда пишет Chroma (VECTOR_BACKEND=chroma)
+VECTOR_DIR = str(BASE_DIR / "storage" / "vectors")            # куда пишет vector_store.py (VECTOR_BACKEND=numpy)
+COLL_NAME = "ux_research"                                     # имя коллекции (должно совпадать с app.py)
+MANIFEST_PATH = BASE_DIR / "storage" / "index_manifest.json"  # хэши файлов/чанков для инкрементальной индексации
+BM25_DIR = BASE_DIR / "storage" / "bm25"                      # лексический индекс (bm25.py)
+SENTENCES_DIR = BASE_DIR / "storage" / "sentences"            # предложения и TF-IDF (sentence_index.py)
+SECTION_IMAGES_PATH = BASE_DIR / "storage" / "section_images.json"  # (filename, section_path) → картинки
+FILE_IMAGES_KEY     = "*"      # ключ «все картинки файла» в карте секций
+LOOKUP_MAX_IMAGES   = 12
+
+CHUNK_SIZE    = 1100
+CHUNK_OVERLAP = 220
+META_VERSION  = 2      # схема меты чанков; сменилась → полная пересборка
+EMBED_BATCH   = int(os.getenv("INDEX_BATCH", "64"))   # чанков на один вызов эмбеддера
+QUEUE_DEPTH   = 2                                     # батчей в очереди на запись (ограничивает память)
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "1"))  # процессов для нарезки (1 — без пула)
+LARGE_FILE_CHARS    = 40_000   # файлы больше режем по группам секций между воркерами
+SECTION_GROUP_CHARS = 20_000
 
 # ── Embeddings ─────────────────────────────────────────────────────────────────
-if OFFLINE_ONLY:
-    from sentence_transformers import SentenceTransformer
-    st_model = SentenceTransformer(LOCAL_ST_MODEL)
-
-    def embed_fn(texts: List[str]) -> List[List[float]]:
-        return st_model.encode(texts, normalize_embeddings=True).tolist()
+# Тот же эмбеддер, что и у app.py при запросе (см. embeddings.py):
+# OFFLINE_ONLY=true → sentence-transformers (LOCAL_ST_MODEL), иначе OpenAI.
+from embeddings import get_text_embedder
+embedder = get_text_embedder()
 
-    embed_meta = f"ST({LOCAL_ST_MODEL})"
-else:
-    from llama_index.embeddings.openai import OpenAIEmbedding
-    emb = OpenAIEmbedding(model=OPENAI_EMBED_MODEL)
+def embed_fn(texts: List[str]) -> List[List[float]]:
+    return embedder.embed_documents(texts)
 
-    def embed_fn(texts: List[str]) -> List[List[float]]:
-        return emb.get_text_embedding_batch(texts)
-
-    embed_meta = f"OpenAI({OPENAI_EMBED_MODEL})"
+embed_meta = embedder.name
 
 # ── LlamaIndex + Chroma ────────────────────────────────────────────────────────
-import chromadb
-from llama_index.core import Document
-from llama_index.core.node_parser import SentenceSplitter
+# chromadb и llama_index тяжёлые (секунды на импорт) — импортируются внутри функций,
+# которым нужны: `cli.py stats`/`--help` и импорт ради parse_sections их не грузят.
+if TYPE_CHECKING:
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+
+import bm25
+import hierarchy
+import resources
+import sentence_index
+import vector_store
+from filters import filter_fields, norm_text, split_tags
+from manifest import load_manifest, save_manifest, empty_manifest, sha256_file, chunk_hash, bump_generation
 
 # ── Регэкспы ───────────────────────────────────────────────────────────────────
 IMG_MD_RE  = re.compile(r"!\[[^\]]*\]\(([^)]+)\)")
@@ -133,18 +176,42 @@ def extract_images_from_text(md_text: str, max_count: int = 3) -> List[str]:
             break
     return clean
 
-def split_text(body: str, chunk_size: int = 1100, chunk_overlap: int = 220) -> List[str]:
-    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.split_text(body)
+_SPLITTERS: Dict[Tuple[int, int], "SentenceSplitter"] = {}
 
-# ── Построение документов ──────────────────────────────────────────────────────
-def docs_from_file(front: Dict, body: str) -> List[Document]:
+def section_image_map(body: str) -> Dict[str, List[str]]:
     """
-    На выходе — список LlamaIndex Document c корректной метой:
-    - id, title, iteration, date, filename, section_path, chunk_index
-    - images: список путей из той же секции (до 3 штук)
+    section_path → упорядоченный список картинок секции (без дублей);
+    FILE_IMAGES_KEY → картинки всего файла (запасной вариант для секций без картинок).
     """
-    base = {
+    out: Dict[str, List[str]] = {FILE_IMAGES_KEY: extract_images_from_text(body, max_count=LOOKUP_MAX_IMAGES)}
+    for section_path, section_text in parse_sections(body):
+        imgs = extract_images_from_text(section_text, max_count=LOOKUP_MAX_IMAGES)
+        if imgs:
+            known = out.setdefault(section_path or "", [])
+            known.extend(i for i in imgs if i not in known)
+    return out
+
+def write_section_images(manifest: Dict) -> int:
+    """Компактная карта (filename → section_path → картинки) для app.py — собирается из манифеста."""
+    lookup = {name: entry.get("images") or {} for name, entry in sorted(manifest.get("files", {}).items())}
+    tmp = SECTION_IMAGES_PATH.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(lookup, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, SECTION_IMAGES_PATH)
+    return sum(len(v) for v in lookup.values())
+
+def split_text(body: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    # сплиттер (и его токенизатор) создаём один раз на процесс, а не на каждую секцию
+    splitter = _SPLITTERS.get((chunk_size, chunk_overlap))
+    if splitter is None:
+        from llama_index.core.node_parser import SentenceSplitter
+        splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        _SPLITTERS[(chunk_size, chunk_overlap)] = splitter
+    return splitter.split_text(body)
+
+# ── Построение документов ──────────────────────────────────────────────────────
+def base_meta(front: Dict) -> Dict:
+    """Общая мета документа из frontmatter — копируется в каждый чанк."""
+    return {
         "id":        front.get("id"),
         "title":     front.get("title"),
         "project":   front.get("project"),
@@ -157,11 +224,14 @@ def docs_from_file(front: Dict, body: str) -> List[Document]:
         "authors":   ", ".join(front.get("authors", [])) if isinstance(front.get("authors"), list) else front.get("authors"),
         "tags":      ", ".join(front.get("tags", [])) if isinstance(front.get("tags"), list) else front.get("tags"),
         "filename":  front.get("filename"),
+        # нормализованные поля для where-фильтров (теги → булевы ключи, дата → диапазон YYYYMM)
+        **filter_fields(front),
     }
 
+def key_findings_docs(front: Dict, base: Dict) -> List["Document"]:
+    """key_findings из YAML (если есть) — по чанку на пункт."""
+    from llama_index.core import Document
     docs: List[Document] = []
-
-    # key_findings из YAML (если есть)
     kf = front.get("key_findings", []) or []
     if isinstance(kf, list):
         for i, item in enumerate(kf):
@@ -173,70 +243,420 @@ def docs_from_file(front: Dict, body: str) -> List[Document]:
                     metadata={**base, "section_path": "key_findings", "chunk_index": f"kf_{i}", "images": []},
                 )
             )
+    return docs
+
+def section_docs(base: Dict, sec_idx: int, section_path: str, section_text: str) -> List["Document"]:
+    """Чанки одной секции; chunk_index = <номер секции>_<номер чанка>."""
+    from llama_index.core import Document
+    # Картинки секции (до 3)
+    section_images = extract_images_from_text(section_text, max_count=3)
+
+    # На случай, если секция без заголовка:
+    section_path = section_path or ""
+
+    docs: List[Document] = []
+    # Режем секцию на чанки
+    chunks = split_text(section_text)
+    for i, chunk in enumerate(chunks):
+        if not chunk.strip():
+            continue
+        meta = {
+            **base,
+            "section_path": section_path,
+            "chunk_index": f"{sec_idx}_{i}",
+            "images": section_images,  # СПИСОК строк путей — именно так ждёт app.py
+        }
+        docs.append(Document(text=chunk, metadata=meta))
+    return docs
+
+def docs_from_file(front: Dict, body: str) -> List["Document"]:
+    """
+    На выходе — список LlamaIndex Document c корректной метой:
+    - id, title, iteration, date, filename, section_path, chunk_index
+    - images: список путей из той же секции (до 3 штук)
+    """
+    base = base_meta(front)
+    docs = key_findings_docs(front, base)
 
     # Разбиваем Markdown на секции и затем на чанки
-    sections = parse_sections(body)
-    for sec_idx, (section_path, section_text) in enumerate(sections):
-        # Картинки секции (до 3)
-        section_images = extract_images_from_text(section_text, max_count=3)
-
-        # На случай, если секция без заголовка:
-        section_path = section_path or ""
-
-        # Режем секцию на чанки
-        chunks = split_text(section_text)
-        for i, chunk in enumerate(chunks):
-            if not chunk.strip():
-                continue
-            meta = {
-                **base,
-                "section_path": section_path,
-                "chunk_index": f"{sec_idx}_{i}",
-                "images": section_images,  # СПИСОК строк путей — именно так ждёт app.py
-            }
-            docs.append(Document(text=chunk, metadata=meta))
+    for sec_idx, (section_path, section_text) in enumerate(parse_sections(body)):
+        docs.extend(section_docs(base, sec_idx, section_path, section_text))
 
     return docs
 
+# ── Параллельный разбор (process pool) ─────────────────────────────────────────
+def chunk_sections(task: Tuple[Dict, List[Tuple[int, str, str]]]) -> List[Tuple[str, Dict]]:
+    """
+    Работа для воркера: (base, [(sec_idx, section_path, text), ...]) → [(text, meta), ...].
+    Отдаём простые кортежи, а не Document — их дешевле гонять между процессами.
+    """
+    base, sections = task
+    out: List[Tuple[str, Dict]] = []
+    for sec_idx, section_path, section_text in sections:
+        out.extend((d.text, d.metadata) for d in section_docs(base, sec_idx, section_path, section_text))
+    return out
+
+def section_tasks(base: Dict, body: str) -> List[Tuple[Dict, List[Tuple[int, str, str]]]]:
+    """
+    Небольшой файл — одна задача; большой (> LARGE_FILE_CHARS) режем на группы
+    соседних секций примерно по SECTION_GROUP_CHARS, чтобы его делили несколько воркеров.
+    """
+    sections = [(i, sp, st) for i, (sp, st) in enumerate(parse_sections(body))]
+    if len(body) <= LARGE_FILE_CHARS:
+        return [(base, sections)]
+    tasks, group, size = [], [], 0
+    for sec in sections:
+        group.append(sec)
+        size += len(sec[2])
+        if size >= SECTION_GROUP_CHARS:
+            tasks.append((base, group))
+            group, size = [], 0
+    if group:
+        tasks.append((base, group))
+    return tasks
+
+def ordered_map(fn: Callable, jobs: Iterator, pool: Optional[ProcessPoolExecutor], window: int) -> Iterator:
+    """
+    Как pool.map, но ленивый и с окном: в работе не больше window задач, результаты
+    отдаются строго в порядке jobs. Элементы jobs вида ("run", arg) считаются через fn,
+    остальные проходят насквозь (сохраняя своё место в потоке). pool=None — последовательно.
+    """
+    pending: Deque = deque()
+
+    def resolve(item):
+        return item.result() if isinstance(item, Future) else item
+
+    for job in jobs:
+        if isinstance(job, tuple) and job and job[0] == "run":
+            pending.append(pool.submit(fn, job[1]) if pool is not None else fn(job[1]))
+        else:
+            pending.append(job)
+        while len(pending) > window:
+            yield resolve(pending.popleft())
+    while pending:
+        yield resolve(pending.popleft())
+
 # ── Главная функция индексации ─────────────────────────────────────────────────
-def main():
-    files = sorted(DATA_DIR.glob("*.md"))
-    if not files:
-        print("Нет файлов в ./02_clean_texts — положите туда ваши .md исследования.")
+def stamp_embedder(collection, name: str) -> None:
+    """Запоминаем в коллекции, какой моделью построен индекс (app.py сверяет)."""
+    meta = {k: v for k, v in (collection.metadata or {}).items() if not str(k).startswith("hnsw:")}
+    if meta.get("embedder") == name:
         return
+    try:
+        collection.modify(metadata={**meta, "embedder": name})
+    except Exception as e:
+        print(f"  ! Не удалось записать embedder в метаданные коллекции: {e}")
 
-    client = chromadb.PersistentClient(path=DB_DIR)
-    collection = client.get_or_create_collection(COLL_NAME)
+def chroma_meta(meta: Dict) -> Dict:
+    """Chroma не принимает пустые списки в метаданных — такие ключи просто опускаем."""
+    return {k: v for k, v in meta.items() if not (isinstance(v, list) and not v)}
+
+def chunk_id(filename: str, meta: Dict) -> str:
+    """Стабильный id: <filename>-<chunk_index>."""
+    return f"{filename or 'file'}-{meta.get('chunk_index', '0')}"
 
-    all_texts: List[str]   = []
-    all_metas:  List[dict] = []
-    all_ids:    List[str]  = []
+# ── Потоковый конвейер: parse → embed → upsert ─────────────────────────────────
+class FileDone:
+    """Маркер «файл разобран целиком»: после записи его чанков коммитим запись манифеста."""
+    __slots__ = ("name", "entry", "orphans")
 
-    doc_counter = 0
+    def __init__(self, name: str, entry: Dict, orphans: List[str]):
+        self.name, self.entry, self.orphans = name, entry, orphans
 
+def iter_jobs(files: List[pathlib.Path], old_files: Dict, stats: Dict) -> Iterator:
+    """
+    Для каждого изменённого файла: ("kf", name, docs) → ("run", задача)… → ("file", name, hash, prev).
+    Неизменённые файлы не читаются дальше хэша и не парсятся.
+    """
     for p in files:
+        file_hash = sha256_file(p)
+        prev = old_files.get(p.name)
+        if prev and prev.get("sha256") == file_hash:
+            stats["files_same"] += 1
+            stats["chunks_same"] += len(prev.get("chunks", {}))
+            if "images" not in prev or "product" not in prev:
+                # манифест до появления карты картинок / словаря продуктов — досчитываем без переэмбеддинга
+                front, body = read_md_with_yaml(p)
+                prev.setdefault("images", section_image_map(body))
+                prev.setdefault("product", norm_text(front.get("product")))
+                prev.setdefault("project", norm_text(front.get("project")))
+            continue
+        stats["files_changed" if prev else "files_new"] += 1
+
         front, body = read_md_with_yaml(p)
-        docs = docs_from_file(front, body)
-
-        for d in docs:
-            all_texts.append(d.text)
-            all_metas.append(d.metadata)
-            # стабильный id: <filename>#<section>#<chunk>
-            sid = f"{front.get('filename','file')}-{d.metadata.get('chunk_index','0')}"
-            all_ids.append(sid)
-            doc_counter += 1
-
-    print(f"Prepared {len(all_texts)} chunks from {len(files)} files. Embedding via {embed_meta} ...")
-    vectors = embed_fn(all_texts)
-
-    # Запись в Chroma (upsert — безопасно перезаписывает)
-    collection.upsert(
-        ids=all_ids,
-        embeddings=vectors,
-        metadatas=all_metas,
-        documents=all_texts
+        base = base_meta(front)
+        yield ("kf", p.name, [(d.text, d.metadata) for d in key_findings_docs(front, base)])
+        for task in section_tasks(base, body):
+            yield ("run", task)
+        yield ("file", p.name, file_hash, prev, split_tags(front.get("tags")), section_image_map(body),
+               norm_text(front.get("product")), norm_text(front.get("project")))
+
+def iter_changes(files: List[pathlib.Path], old_files: Dict, stats: Dict,
+                 pool: Optional[ProcessPoolExecutor] = None, window: int = 1) -> Iterator:
+    """
+    Лениво идёт по файлам и отдаёт (id, text, meta) только для новых/изменённых чанков,
+    а после чанков каждого изменённого файла — FileDone. Нарезка секций идёт в pool,
+    но порядок чанков и их id те же, что и при последовательном разборе.
+    """
+    cur_chunks: Dict[str, str] = {}
+    for item in ordered_map(chunk_sections, iter_jobs(files, old_files, stats), pool, window):
+        if isinstance(item, tuple) and item and item[0] == "file":
+            _, name, file_hash, prev, tags, images, product, project = item
+            prev_chunks = (prev or {}).get("chunks", {})
+            orphans = [sid for sid in prev_chunks if sid not in cur_chunks]
+            # теги, продукт и проект — словари для фильтров app.py (filters.known_values),
+            # images — карта секция → картинки (section_images.json)
+            entry = {"sha256": file_hash, "chunks": cur_chunks, "tags": tags, "images": images,
+                     "product": product, "project": project}
+            yield FileDone(name, entry, orphans)
+            cur_chunks = {}
+            continue
+        if isinstance(item, tuple) and item and item[0] == "kf":
+            item = item[2]
+        for text, meta in item:
+            sid = chunk_id(meta.get("filename"), meta)
+            h = chunk_hash(text, meta)
+            cur_chunks[sid] = h
+            prev_chunks = (old_files.get(meta.get("filename")) or {}).get("chunks", {})
+            if prev_chunks.get(sid) == h:
+                stats["chunks_same"] += 1
+                continue
+            stats["chunks_changed" if sid in prev_chunks else "chunks_new"] += 1
+            yield sid, text, chroma_meta(meta)
+
+def iter_batches(items: Iterator, size: int) -> Iterator[Tuple[List[Tuple[str, str, Dict]], List[FileDone]]]:
+    """
+    Режет поток на батчи по size чанков. К батчу прикрепляются FileDone, пришедшие
+    до его отправки: все чанки этих файлов лежат в этом или более ранних батчах.
+    """
+    batch: List[Tuple[str, str, Dict]] = []
+    done: List[FileDone] = []
+    for item in items:
+        if isinstance(item, FileDone):
+            done.append(item)
+            continue
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch, done
+            batch, done = [], []
+    if batch or done:
+        yield batch, done
+
+class ChromaWriter(threading.Thread):
+    """
+    Пишет в Chroma из ограниченной очереди, пока главный поток эмбеддит следующий батч.
+    Готовые файлы коммитит в манифест не реже раза в VECTOR_FLUSH_S — падение на 90% не теряет
+    уже записанное: следующий запуск продолжит с того же места. Перед манифестом векторы
+    сбрасываются на диск (vector_store.persist): NumPy-хранилище копит записи в памяти,
+    и манифест не должен помнить чанки, которых после падения в хранилище нет.
+    """
+
+    def __init__(self, collection, manifest: Dict, depth: int = QUEUE_DEPTH):
+        super().__init__(name="chroma-writer", daemon=True)
+        self.collection = collection
+        self.manifest = manifest
+        self.queue: "queue.Queue" = queue.Queue(maxsize=depth)
+        self.error: Optional[BaseException] = None
+        self.written = 0
+        self.deleted = 0
+        self.t0 = time.perf_counter()
+        self.uncommitted = False          # в манифесте (в памяти) есть файлы, ещё не сохранённые на диск
+        self.last_commit = time.monotonic()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # дочитываем очередь, чтобы главный поток не завис на put()
+            try:
+                self._write(*item)
+            except BaseException as e:
+                self.error = e
+
+    def _write(self, batch, vectors, done: List[FileDone]):
+        if batch:
+            ids, texts, metas = zip(*batch)
+            self.collection.upsert(ids=list(ids), embeddings=vectors, metadatas=list(metas), documents=list(texts))
+            self.written += len(batch)
+        for fd in done:
+            if fd.orphans:
+                self.collection.delete(ids=fd.orphans)
+                self.deleted += len(fd.orphans)
+            self.manifest["files"][fd.name] = fd.entry
+            self.uncommitted = True
+        # сброс NumPy-хранилища переписывает коллекцию целиком — не на каждый батч
+        if self.uncommitted and time.monotonic() - self.last_commit >= vector_store.VECTOR_FLUSH_S:
+            self.commit()
+        elapsed = time.perf_counter() - self.t0
+        print(f"  written {self.written} chunks · {self.written / elapsed if elapsed else 0.0:.1f} chunks/s")
+
+    def commit(self):
+        """Сначала векторы, потом манифест."""
+        vector_store.persist(self.collection)
+        save_manifest(MANIFEST_PATH, self.manifest)
+        self.uncommitted = False
+        self.last_commit = time.monotonic()
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(item)
+
+    def finish(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        if self.uncommitted:
+            self.commit()     # и при падении главного потока: записанное не пропадёт
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Индексация ./02_clean_texts в Chroma (инкрементально, потоково).")
+    parser.add_argument("--full", action="store_true", help="игнорировать манифест и пересобрать коллекцию целиком")
+    parser.add_argument("--batch", type=int, default=EMBED_BATCH, help=f"чанков в батче эмбеддинга (по умолчанию {EMBED_BATCH})")
+    parser.add_argument("--workers", type=int, default=INDEX_WORKERS,
+                        help=f"процессов для разбора/нарезки (по умолчанию {INDEX_WORKERS}; 1 — без пула)")
+    parser.add_argument("--backend", choices=("chroma", "numpy"), default=resources.VECTOR_BACKEND,
+                        help=f"хранилище векторов (по умолчанию VECTOR_BACKEND={resources.VECTOR_BACKEND})")
+    args = parser.parse_args(argv)
+
+    files = sorted(DATA_DIR.glob("*.md"))
+    if not files:
+        print("Нет файлов в ./02_clean_texts — положите туда ваши .md исследования.")
+        return
+
+    store_dir = VECTOR_DIR if args.backend == "numpy" else DB_DIR
+    client = vector_store.open_client(args.backend, store_dir)
+
+    params = {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "meta_version": META_VERSION}
+    if args.backend != "chroma":
+        params["backend"] = args.backend   # другое хранилище пусто → манифест не про него, пересборка
+    old = load_manifest(MANIFEST_PATH)
+    full = args.full or not old or old.get("embedder") != embed_meta or old.get("params") != params
+    if full and old and not args.full:
+        print(f"Манифест от другой модели/нарезки ({old.get('embedder')}, {old.get('params')}) — полная пересборка.")
+
+    if full:
+        # полная пересборка: сносим коллекцию, чтобы не осталось сирот от прошлых запусков
+        for name in (COLL_NAME, resources.DOC_COLLECTION, resources.SECTION_COLLECTION):
+            try:
+                client.delete_collection(name)
+            except Exception:
+                pass
+        old = empty_manifest()
+    collection = client.get_or_create_collection(COLL_NAME)
+    stamp_embedder(collection, embed_meta)
+
+    old_files = old.get("files", {})
+    present = {p.name for p in files}
+    # стартуем со старыми записями: незатронутые файлы в манифесте остаются как были,
+    # изменённые заменяются по мере записи их чанков
+    new = empty_manifest(embedder=embed_meta, params=params)
+    new["files"] = {name: entry for name, entry in old_files.items() if name in present}
+
+    stats = {"files_new": 0, "files_changed": 0, "files_same": 0, "files_removed": 0,
+             "chunks_new": 0, "chunks_changed": 0, "chunks_same": 0, "chunks_deleted": 0}
+
+    # файлы, которых больше нет на диске: их чанки удаляем до записи — new["files"] их уже
+    # не помнит, и манифест, сохранённый по ходу прогона, не должен оставить их сиротами
+    removed_ids: List[str] = []
+    for name in old_files:
+        if name not in present:
+            stats["files_removed"] += 1
+            removed_ids.extend(old_files[name].get("chunks", {}).keys())
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+
+    workers = max(1, args.workers)
+    print(f"Streaming {len(files)} files → {COLL_NAME} "
+          f"(batch {args.batch}, workers {workers}, embed via {embed_meta}) ...")
+    # spawn, а не fork: к моменту первых задач уже работает поток записи в Chroma
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    writer = ChromaWriter(collection, new)
+    writer.start()
+    try:
+        changes = iter_changes(files, old_files, stats, pool=pool, window=workers * 2)
+        for batch, done in iter_batches(changes, args.batch):
+            vectors = embed_fn([text for _, text, _ in batch]) if batch else []
+            writer.put((batch, vectors, done))
+    finally:
+        writer.finish()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    stats["chunks_deleted"] = writer.deleted + len(removed_ids)
+    vector_store.persist(collection)
+
+    save_manifest(MANIFEST_PATH, new)
+    n_sections = write_section_images(new)
+    elapsed = time.perf_counter() - writer.t0
+    print(
+        "Diff: files +{files_new} ~{files_changed} ={files_same} -{files_removed}; "
+        "chunks +{chunks_new} ~{chunks_changed} ={chunks_same} -{chunks_deleted}".format(**stats)
     )
-    print(f"Indexed {len(all_texts)} chunks into collection '{COLL_NAME}'. Storage: {DB_DIR}")
+    print(f"Embedded {writer.written} chunks in {elapsed:.1f}s. "
+          f"Collection '{COLL_NAME}' now holds {collection.count()} chunks. Storage: {store_dir} ({args.backend})")
+    print(f"Section → images lookup: {n_sections} entries → {SECTION_IMAGES_PATH}")
+
+    if writer.written or stats["chunks_deleted"] or not (BM25_DIR / "meta.json").exists():
+        build_bm25(collection)
+    if writer.written or stats["chunks_deleted"] or not (SENTENCES_DIR / "meta.json").exists():
+        build_sentences(collection)
+    build_hierarchy(client, collection, files, old_files, new["files"])
+    if writer.written or stats["chunks_deleted"]:
+        # кэш результатов app.py/server.py (result_cache.py) привязан к поколению индекса
+        print(f"Index generation: text={bump_generation('text')}")
+
+def iter_collection(collection, include: List[str], page: int = 1000) -> Iterator[Tuple[str, Dict]]:
+    """Постранично обходит коллекцию: (id, {поле: значение}) — без загрузки всего разом."""
+    offset = 0
+    while True:
+        res = collection.get(limit=page, offset=offset, include=include)
+        ids = res.get("ids") or []
+        if not ids:
+            return
+        for i, cid in enumerate(ids):
+            yield cid, {key: res[key][i] for key in include}
+        offset += len(ids)
+
+def build_bm25(collection) -> None:
+    """BM25 строится по всей коллекции (те же chunk id), чтобы совпадать с ней один в один."""
+    print(f"Building BM25 index → {BM25_DIR} ...")
+    meta = bm25.build(((cid, row["documents"] or "") for cid, row in iter_collection(collection, ["documents"])), BM25_DIR)
+    print(f"BM25: {meta['n_docs']} chunks, {meta['n_terms']} terms, {meta['n_postings']} postings "
+          f"({meta['stemmer']} stemmer) in {meta['build_s']}s")
+
+def build_hierarchy(client, collection, files: List[pathlib.Path], old_files: Dict, new_files: Dict) -> None:
+    """ux_docs / ux_sections для изменённых файлов; пустые уровни при непустой коллекции — для всех."""
+    docs_coll = client.get_or_create_collection(resources.DOC_COLLECTION)
+    sections_coll = client.get_or_create_collection(resources.SECTION_COLLECTION)
+    rebuild = docs_coll.count() == 0 and collection.count() > 0
+    changed = [p for p in files if rebuild or (old_files.get(p.name) or {}).get("sha256") != new_files[p.name]["sha256"]]
+    removed = [name for name in old_files if name not in new_files]
+    if not changed and not removed:
+        return
+    print(f"Building document/section levels → {resources.DOC_COLLECTION}, {resources.SECTION_COLLECTION} ...")
+    t0 = time.perf_counter()
+    docs = []
+    for p in changed:
+        front, _ = read_md_with_yaml(p)
+        meta = chroma_meta(base_meta(front))
+        docs.append((p.name, hierarchy.doc_text(front), meta))
+    res = hierarchy.build(collection, docs_coll, sections_coll, docs, removed, embed_fn)
+    vector_store.persist(docs_coll)
+    vector_store.persist(sections_coll)
+    print(f"Levels: {res['docs']} docs, {res['sections']} sections updated, {res['removed']} files removed "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+def build_sentences(collection) -> None:
+    """Предложения и TF-IDF для офлайн-сводов — по всей коллекции, как и BM25."""
+    print(f"Building sentence index → {SENTENCES_DIR} ...")
+    meta = sentence_index.build(((cid, row["documents"] or "")
+                                 for cid, row in iter_collection(collection, ["documents"])), SENTENCES_DIR)
+    print(f"Sentences: {meta['n_sents']} in {meta['n_chunks']} chunks, {meta['n_terms']} terms, "
+          f"{meta['nnz']} TF-IDF entries in {meta['build_s']}s")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+cli.py — единая точка входа: индексация, состояние индекса, проверка, поиск из терминала
+
+    python cli.py index-text [--full] [--batch N] [--workers N]     # = build_index.py
+    python cli.py index-images [--full] [--batch N] [--workers N]   # = build_images_index.py
+    python cli.py stats [--chroma] [--json]                         # что лежит в ./storage
+    python cli.py verify                                            # манифесты ↔ Chroma ↔ BM25 ↔ предложения ↔ 03_assets
+    python cli.py query "текст" [-k 12] [--iteration 2] [--summary] # поиск как в app.py (--no-rerank — без MMR)
+
+Тяжёлые модули (chromadb, llama_index, sentence-transformers/torch, openai) импортируются
+только внутри команд, которым они нужны: `--help` и `stats` стартуют за доли секунды.
+Бюджет холодного старта проверяет bench/bench_cli_startup.py.
+Команды работают из корня проекта (пути ./02_clean_texts и ./storage — как у индексаторов).
+"""
+
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BASE_DIR = Path(__file__).resolve().parent
+STORAGE_DIR = BASE_DIR / "storage"
+TEXT_MANIFEST = STORAGE_DIR / "index_manifest.json"
+IMAGE_MANIFEST = STORAGE_DIR / "images_manifest.json"
+BM25_META = STORAGE_DIR / "bm25" / "meta.json"
+SENTENCES_META = STORAGE_DIR / "sentences" / "meta.json"
+SECTION_IMAGES = STORAGE_DIR / "section_images.json"
+
+# ── Утилиты ────────────────────────────────────────────────────────────────────
+def _read_json(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def _dir_size_mb(path: Path) -> Optional[float]:
+    if not path.exists():
+        return None
+    total = sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return round(total / 2**20, 2)
+
+def _collection_ids(collection, page: int = 5000) -> set:
+    ids, offset = set(), 0
+    while True:
+        got = collection.get(limit=page, offset=offset, include=[]).get("ids") or []
+        if not got:
+            return ids
+        ids.update(got)
+        offset += len(got)
+
+# ── index-text / index-images ──────────────────────────────────────────────────
+def cmd_index_text(argv: List[str]) -> int:
+    import build_index
+    build_index.main(argv)
+    return 0
+
+def cmd_index_images(argv: List[str]) -> int:
+    import build_images_index
+    build_images_index.main(argv)
+    return 0
+
+# ── stats ──────────────────────────────────────────────────────────────────────
+def collect_stats(with_chroma: bool = False) -> Dict[str, Any]:
+    """Сводка по ./storage только из JSON-файлов; with_chroma — ещё число записей в коллекциях."""
+    from manifest import read_generation   # лёгкий модуль: json + pathlib
+
+    text = _read_json(TEXT_MANIFEST)
+    files = text.get("files", {}) or {}
+    images = _read_json(IMAGE_MANIFEST)
+    bm25_meta = _read_json(BM25_META)
+    sent_meta = _read_json(SENTENCES_META)
+    out: Dict[str, Any] = {
+        "text": {
+            "embedder": text.get("embedder"), "params": text.get("params"),
+            "files": len(files), "chunks": sum(len(e.get("chunks", {})) for e in files.values()),
+        },
+        "images": {"embedder": images.get("embedder"), "files": len(images.get("files", {}) or {})},
+        "bm25": {k: bm25_meta.get(k) for k in ("n_docs", "n_terms", "n_postings", "stemmer")} if bm25_meta else None,
+        "sentences": {k: sent_meta.get(k) for k in ("n_chunks", "n_sents", "n_terms", "nnz")} if sent_meta else None,
+        "section_images": sum(len(v) for v in _read_json(SECTION_IMAGES).values()) or None,
+        "generation": read_generation(),
+        "storage_mb": {name: _dir_size_mb(STORAGE_DIR / name) for name in ("chroma", "vectors", "bm25", "sentences", "cache")},
+    }
+    if with_chroma:
+        import resources
+        out["chroma"] = {}
+        for name in (resources.TEXT_COLLECTION, resources.IMAGE_COLLECTION,
+                     resources.DOC_COLLECTION, resources.SECTION_COLLECTION):
+            try:
+                out["chroma"][name] = resources.vector_client().get_collection(name).count()
+            except Exception:
+                out["chroma"][name] = None
+    return out
+
+def cmd_stats(args) -> int:
+    st = collect_stats(args.chroma)
+    if args.json:
+        print(json.dumps(st, ensure_ascii=False, indent=1))
+        return 0
+    t, im = st["text"], st["images"]
+    print(f"Тексты:   {t['files']} файлов, {t['chunks']} чанков, эмбеддер {t['embedder'] or '—'}")
+    print(f"Картинки: {im['files']} файлов, эмбеддер {im['embedder'] or '—'}")
+    if st["bm25"]:
+        b = st["bm25"]
+        print(f"BM25:     {b['n_docs']} чанков, {b['n_terms']} термов, {b['n_postings']} постингов ({b['stemmer']})")
+    else:
+        print("BM25:     не собран")
+    if st["sentences"]:
+        s = st["sentences"]
+        print(f"Своды:    {s['n_sents']} предложений в {s['n_chunks']} чанках, {s['n_terms']} термов, TF-IDF nnz {s['nnz']}")
+    else:
+        print("Своды:    индекс предложений не собран (своды считаются на лету)")
+    print(f"Секции с картинками: {st['section_images'] or '—'}")
+    print(f"Поколения индекса:   {st['generation'] or '—'}")
+    sizes = ", ".join(f"{k} {v} MB" for k, v in st["storage_mb"].items() if v is not None)
+    print(f"На диске: {sizes or '—'}")
+    if "chroma" in st:
+        print("Векторы:  " + ", ".join(f"{k}={v if v is not None else 'нет'}" for k, v in st["chroma"].items()))
+    return 0
+
+# ── verify ─────────────────────────────────────────────────────────────────────
+def cmd_verify(args) -> int:
+    """Сверяет манифест, Chroma, BM25 и индекс предложений (те же chunk id) и наличие картинок. Код выхода 1 — есть проблемы."""
+    import resources
+    from asset_index import get_asset_index
+    from bm25 import BM25Index
+    from embeddings import get_text_embedder, get_image_embedder
+    from manifest import all_ids, load_manifest
+    from sentence_index import SentenceIndex
+
+    problems: List[str] = []
+
+    def check(ok: bool, message: str) -> None:
+        print(("  ✓ " if ok else "  ✗ ") + message)
+        if not ok:
+            problems.append(message)
+
+    client = resources.vector_client()
+    store = "Chroma" if resources.VECTOR_BACKEND == "chroma" else "NumPy"
+    print(f"Тексты (хранилище {store}):")
+    text = load_manifest(TEXT_MANIFEST)
+    manifest_ids = all_ids(text) if text else set()
+    check(bool(text), f"манифест {TEXT_MANIFEST.name}: {len(manifest_ids)} чанков")
+    try:
+        coll = client.get_collection(resources.TEXT_COLLECTION)
+    except Exception:
+        coll = None
+    check(coll is not None, f"коллекция {resources.TEXT_COLLECTION}")
+    if coll is not None:
+        chroma_ids = _collection_ids(coll)
+        check(chroma_ids == manifest_ids,
+              f"{store} ↔ манифест: {len(chroma_ids)} / {len(manifest_ids)} "
+              f"(нет в {store} {len(manifest_ids - chroma_ids)}, лишних {len(chroma_ids - manifest_ids)})")
+        stamped = (coll.metadata or {}).get("embedder")
+        current = get_text_embedder().name
+        check(stamped in (None, current), f"эмбеддер индекса {stamped} ↔ запросов {current}")
+        index = BM25Index.open(BM25_META.parent)
+        check(index is not None, "BM25-индекс открывается")
+        if index is not None:
+            bm25_ids = set(map(str, index.ids[: index.n]))
+            check(bm25_ids == chroma_ids, f"BM25 ↔ {store}: {len(bm25_ids)} / {len(chroma_ids)}")
+        sents = SentenceIndex.open(SENTENCES_META.parent)
+        check(sents is not None, "индекс предложений открывается")
+        if sents is not None:
+            sent_ids = set(map(str, sents.ids[: sents.n]))
+            check(sent_ids == chroma_ids, f"предложения ↔ {store}: {len(sent_ids)} / {len(chroma_ids)}")
+
+    print("Картинки:")
+    images = load_manifest(IMAGE_MANIFEST)
+    entries = images.get("files", {}) if images else {}
+    check(bool(images), f"манифест {IMAGE_MANIFEST.name}: {len(entries)} файлов")
+    if images:
+        missing = [rel for rel in entries if not (BASE_DIR / rel).is_file()]
+        check(not missing, f"файлы манифеста на диске (нет {len(missing)})")
+        check(images.get("embedder") in (None, get_image_embedder().name),
+              f"эмбеддер {images.get('embedder')} ↔ запросов {get_image_embedder().name}")
+        try:
+            icoll = client.get_collection(resources.IMAGE_COLLECTION)
+            ids = _collection_ids(icoll)
+            expected = {e["id"] for e in entries.values()}
+            check(ids == expected, f"{store} ↔ манифест: {len(ids)} / {len(expected)}")
+        except Exception:
+            check(False, f"коллекция {resources.IMAGE_COLLECTION}")
+
+    lookup = _read_json(SECTION_IMAGES)
+    if lookup:
+        assets = get_asset_index()
+        refs = {p for per_file in lookup.values() for imgs in per_file.values() for p in imgs}
+        unresolved = [p for p in refs if not assets.resolve(p)[1]]
+        check(not unresolved, f"ссылки на картинки из Markdown находятся в 03_assets (нет {len(unresolved)} из {len(refs)})")
+        for p in sorted(unresolved)[:5]:
+            print(f"      {p}")
+
+    print("Итог: " + ("всё сходится" if not problems else f"проблем: {len(problems)}"))
+    return 1 if problems else 0
+
+# ── query ──────────────────────────────────────────────────────────────────────
+def cmd_query(args) -> int:
+    import rag
+    hits, has_filters = rag.search(args.text, args.iteration, args.scenario, args.date, args.product,
+                                   k=args.k, hybrid=not args.no_hybrid, rerank=not args.no_rerank)
+    if args.json:
+        print(json.dumps([{"id": h["id"], "dist": h.get("dist"), "rrf": h.get("rrf"), "meta": h.get("meta"),
+                           "merged_ids": h.get("merged_ids"), "text": h.get("text")} for h in hits], ensure_ascii=False, indent=1, default=str))
+        return 0
+    if not hits:
+        print("Ничего не нашлось" + (" — ослабьте фильтры." if has_filters else "."))
+        return 0
+    for i, h in enumerate(hits, start=1):
+        md = h.get("meta") or {}
+        text = " ".join((h.get("text") or "").split())
+        print(f"[{i}] {md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}")
+        print(f"    {md.get('filename')} / {md.get('section_path') or '…'} / chunk {md.get('chunk_index')}")
+        print(f"    {text[:300]}{'…' if len(text) > 300 else ''}")
+    if args.summary:
+        _, summary_text = rag.summarize(hits, args.text, offline_mode=True)
+        print("\nСвод (TF-IDF + TextRank):\n" + (summary_text or "—"))
+    return 0
+
+# ── main ───────────────────────────────────────────────────────────────────────
+PASSTHROUGH = {"index-text": cmd_index_text, "index-images": cmd_index_images}
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="ИИ-исследователь: индексация и обслуживание индекса.")
+    sub = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    sub.add_parser("index-text", add_help=False, help="индексировать ./02_clean_texts (параметры — как у build_index.py)")
+    sub.add_parser("index-images", add_help=False, help="индексировать 03_assets (параметры — как у build_images_index.py)")
+
+    p = sub.add_parser("stats", help="состояние индексов без загрузки моделей")
+    p.add_argument("--chroma", action="store_true", help="ещё и число записей в коллекциях (Chroma или NumPy — VECTOR_BACKEND)")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("verify", help="сверить манифесты, Chroma, BM25 и картинки")
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser("query", help="поиск по тексту (как во вкладке «По тексту»)")
+    p.add_argument("text")
+    p.add_argument("-k", type=int, default=12)
+    p.add_argument("--iteration", default="")
+    p.add_argument("--scenario", default="")
+    p.add_argument("--date", default="")
+    p.add_argument("--product", default="")
+    p.add_argument("--no-hybrid", action="store_true", help="только векторный поиск, без BM25")
+    p.add_argument("--no-rerank", action="store_true", help="без склейки соседних чанков и MMR (rerank.py)")
+    p.add_argument("--summary", action="store_true", help="добавить офлайн-свод")
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_query)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    os.chdir(BASE_DIR)   # индексаторы считают пути от корня проекта
+    # index-* отдают все остальные аргументы (и --help) своему парсеру
+    if argv and argv[0] in PASSTHROUGH:
+        return PASSTHROUGH[argv[0]](argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+context_pack.py — контекст LLM в пределах бюджета токенов
+
+rag.build_prompt раньше склеивал format_cite top-5 хитов как есть: соседние чанки
+одной секции приходили с общими 220 символами перекрытия, а заголовок
+«id · title · итерация · дата» и длинный section_path («H1: Отчёт: «…» › H2: …»)
+повторялись у каждого фрагмента одного исследования. За эти токены платим и ждём
+prefill до первого слова ответа. pack():
+1) склеивает фрагменты одной секции, идущие подряд или внахлёст (по chunk_index,
+   в том числе уже склеенные rerank.py «18_0–18_2»), перекрытие вырезает
+   rerank.join_overlap; повтор того же чанка выбрасывается;
+2) группирует фрагменты по исследованию: заголовок и общий префикс section_path —
+   один раз на исследование, у фрагмента — остаток пути и chunk; из текста уходят
+   ссылки внутри чанков, которые уже есть в заголовке или бесполезны модели:
+   «**Из исследования:** …», «**Источник:** `…#fig`», картинки ![…](…), хвостовые
+   пробелы markdown-переносов;
+3) кладёт фрагменты по релевантности (лучший хит фрагмента), пока влезают
+   в LLM_CONTEXT_TOKENS; не влезший целиком обрезается по границе предложения,
+   если остаток бюджета не меньше MIN_PART_TOKENS.
+Кандидаты — LLM_CONTEXT_HITS лучших хитов (5 — как раньше). Номера [n] идут по
+порядку фрагментов в контексте, на них LLM и ссылается.
+
+Токены считает tiktoken (кодировка модели OPENAI_LLM_MODEL); без него или без
+скачанной кодировки — оценка len / CHARS_PER_TOKEN. Сколько токенов сэкономлено
+против прежнего промпта, rag.llm_answer пишет в отчёт запроса и в метрики.
+"""
+
+import os
+import re
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import resources
+from rerank import join_overlap
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+CONTEXT_PACK       = os.getenv("CONTEXT_PACK", "true").lower() == "true"
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "1500"))   # бюджет на контекст (без инструкции и вопроса)
+LLM_CONTEXT_HITS   = int(os.getenv("LLM_CONTEXT_HITS", "5"))        # сколько лучших хитов рассматривать
+
+MIN_PART_TOKENS = 60      # меньше — фрагмент не обрезаем, а пропускаем
+CHARS_PER_TOKEN = 3.5     # оценка без tiktoken: русский текст у o200k/cl100k — 3–4 символа на токен
+PATH_SEP        = " › "
+_SENT_END = re.compile(r"(?<=[.!?…])\s+")
+_NOISE = [
+    re.compile(r"^\s*\*\*Из исследования:\*\*.*$\n?", re.M),
+    re.compile(r"^\s*\*\*Источник:\*\*\s*\n?\s*`[^`\n]*`[ \t]*$\n?", re.M),
+    re.compile(r"!\[[^\]\n]*\]\([^)\n]*\)[ \t]*\n?"),
+]
+_TRAILING_WS = re.compile(r"[ \t]+$", re.M)
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+# ── Токены ─────────────────────────────────────────────────────────────────────
+def _load_tokenizer():
+    """Кодировка tiktoken для OPENAI_LLM_MODEL или None (нет пакета или файла кодировки — офлайн)."""
+    try:
+        import tiktoken
+        from llm import OPENAI_LLM_MODEL
+        try:
+            return tiktoken.encoding_for_model(OPENAI_LLM_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+resources.registry.register("llm_tokenizer", _load_tokenizer, warm=not resources.OFFLINE_ONLY)
+
+def count_tokens(text: str) -> int:
+    enc = resources.registry.get("llm_tokenizer")
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def tokenizer_name() -> str:
+    enc = resources.registry.get("llm_tokenizer")
+    return enc.name if enc is not None else f"≈len/{CHARS_PER_TOKEN:g}"
+
+# ── Фрагменты ──────────────────────────────────────────────────────────────────
+def clean_text(text: str) -> str:
+    """Текст чанка без ссылок на источник и картинок — они в заголовке исследования или не нужны модели."""
+    for rx in _NOISE:
+        text = rx.sub("", text)
+    return _BLANK_LINES.sub("\n\n", _TRAILING_WS.sub("", text)).strip()
+
+def _span(md: Dict) -> Optional[Tuple[Tuple, int, int]]:
+    """((файл, секция, номер секции), первый чанк, последний) из "18_2" или склеенного "18_0–18_2"."""
+    first, _, last = str(md.get("chunk_index") or "").partition("–")
+    sec, _, i = first.rpartition("_")
+    sec2, _, j = (last or first).rpartition("_")
+    if not (sec.isdigit() and i.isdigit() and j.isdigit()) or sec2 != sec:
+        return None
+    return (md.get("filename"), md.get("section_path"), sec), int(i), int(j)
+
+def _chunk_label(sec: str, lo: int, hi: int) -> str:
+    return f"{sec}_{lo}" if lo == hi else f"{sec}_{lo}–{sec}_{hi}"
+
+def _fragments(hits: Sequence[Dict]) -> List[Dict]:
+    """Хиты → фрагменты: подряд идущие и перекрывающиеся чанки одной секции — один фрагмент; порядок — по лучшему хиту."""
+    frags: List[Dict] = []
+    runs: Dict[Tuple, List[Tuple[int, int, int, Dict]]] = {}
+    for rank, h in enumerate(hits):
+        pos = _span(h.get("meta") or {})
+        if pos is None:
+            frags.append({"rank": rank, "ranks": [rank], "hit": h, "text": clean_text(h.get("text") or ""),
+                          "ids": list(h.get("merged_ids") or [h["id"]]), "chunk": (h.get("meta") or {}).get("chunk_index")})
+        else:
+            runs.setdefault(pos[0], []).append((pos[1], pos[2], rank, h))
+    for key, members in runs.items():
+        members.sort(key=lambda m: (m[0], m[1]))
+        group = [members[0]]
+        for m in members[1:]:
+            if m[0] <= max(g[1] for g in group) + 1:
+                group.append(m)
+            else:
+                frags.append(_join(key, group))
+                group = [m]
+        frags.append(_join(key, group))
+    frags.sort(key=lambda f: f["rank"])
+    return frags
+
+def _join(key: Tuple, group: List[Tuple[int, int, int, Dict]]) -> Dict:
+    text, ids, hi = "", [], -1
+    for lo_m, hi_m, _, h in group:
+        if hi_m <= hi:
+            continue                      # тот же чанк (или целиком внутри уже склеенного)
+        part = (h.get("text") or "").strip()
+        text = join_overlap(text, part) if text else part
+        ids.extend(cid for cid in (h.get("merged_ids") or [h["id"]]) if cid not in ids)
+        hi = hi_m
+    best = min(group, key=lambda m: m[2])
+    return {"rank": best[2], "ranks": [m[2] for m in group], "hit": best[3], "text": clean_text(text), "ids": ids,
+            "chunk": _chunk_label(key[2], group[0][0], hi)}
+
+# ── Заголовки ──────────────────────────────────────────────────────────────────
+def _doc_key(md: Dict) -> Tuple:
+    return md.get("filename"), md.get("id")
+
+def _label(md: Dict) -> str:
+    return f"{md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}"
+
+def _common_prefix(paths: List[List[str]]) -> List[str]:
+    out: List[str] = []
+    for parts in zip(*paths):
+        if any(p != parts[0] for p in parts):
+            break
+        out.append(parts[0])
+    # хотя бы один сегмент — фрагменту, иначе у единственного пути не осталось бы секции
+    return out[:-1] if out and any(len(p) == len(out) for p in paths) else out
+
+def _render(docs: List[Tuple[Dict, List[Dict]]]) -> str:
+    blocks, n = [], 0
+    for md, frags in docs:
+        paths = [str((f["hit"].get("meta") or {}).get("section_path") or "").split(PATH_SEP) for f in frags]
+        if len(frags) == 1:
+            # один фрагмент исследования — как format_cite, выносить общее не из чего
+            n += 1
+            where = f"{md.get('filename')} / {PATH_SEP.join(paths[0]) or '…'} / chunk {frags[0]['chunk']}"
+            blocks.append(f"[{n}] {_label(md)}\n{where}\n\"{frags[0]['text']}\"")
+            continue
+        prefix = _common_prefix(paths)
+        lines = [f"## {_label(md)} · {md.get('filename')}" + (f"\n{PATH_SEP.join(prefix)}" if prefix else "")]
+        for f, path in zip(frags, paths):
+            n += 1
+            lines.append(f"[{n}] {PATH_SEP.join(path[len(prefix):]) or '…'} / chunk {f['chunk']}\n\"{f['text']}\"")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Начало текста по границе предложения, не длиннее max_tokens."""
+    out = ""
+    for sent in _SENT_END.split(text):
+        cand = f"{out} {sent}" if out else sent
+        if count_tokens(cand) > max_tokens:
+            break
+        out = cand
+    return out + " …" if out else ""
+
+# ── Упаковка ───────────────────────────────────────────────────────────────────
+def pack(hits: Sequence[Dict], budget: Optional[int] = None, max_hits: Optional[int] = None) -> Dict:
+    """
+    {"text", "ids" (chunk id в контексте), "tokens", "fragments", "hits", "truncated"}.
+    Бюджет — на текст контекста целиком, с заголовками; None — LLM_CONTEXT_TOKENS / LLM_CONTEXT_HITS.
+    """
+    budget = LLM_CONTEXT_TOKENS if budget is None else budget
+    max_hits = LLM_CONTEXT_HITS if max_hits is None else max_hits
+    frags = _fragments(hits[:max_hits])
+    docs: Dict[Tuple, Tuple[Dict, List[Dict]]] = {}
+    used, truncated = 0, 0
+    for f in frags:
+        md = f["hit"].get("meta") or {}
+        key = _doc_key(md)
+        trial = dict(docs)
+        trial[key] = (docs[key][0], docs[key][1] + [f]) if key in docs else (md, [f])
+        tokens = count_tokens(_render(list(trial.values())))
+        if tokens > budget:
+            # фрагмент не влез целиком — берём его начало на остаток бюджета (заголовки уже учтены)
+            spare = budget - tokens + count_tokens(f["text"])
+            cut = _truncate(f["text"], spare) if spare >= MIN_PART_TOKENS else ""
+            if not cut:
+                continue
+            f = {**f, "text": cut}
+            trial[key] = (trial[key][0], trial[key][1][:-1] + [f])
+            tokens = count_tokens(_render(list(trial.values())))
+            if tokens > budget:
+                continue
+            truncated += 1
+        docs, used = trial, tokens
+    kept = [f for _, fs in docs.values() for f in fs]
+    return {"text": _render(list(docs.values())), "ids": [cid for f in kept for cid in f["ids"]],
+            "tokens": used, "fragments": len(kept), "hits": len({r for f in kept for r in f["ranks"]}),
+            "truncated": truncated}
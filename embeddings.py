@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+embeddings.py — единый слой эмбеддингов для индексаторов и app.py
+
+Что даёт:
+1) TextEmbedder — один и тот же эмбеддер (MiniLM офлайн или OpenAI онлайн) и при
+   индексации (build_index.py), и при запросе (app.py → query_embeddings).
+   Раньше app.py отдавал query_texts в Chroma, и запрос эмбеддился дефолтной
+   моделью Chroma, а не той, что строила индекс.
+2) ImageEmbedder — CLIP для build_images_index.py и вкладки «По макету».
+3) QueryCache — ограниченный LRU векторов запросов: ключ — нормализованный текст
+   (или sha256 байтов картинки) + имя модели. Повторный запрос модель не трогает.
+   При QUERY_CACHE_PERSIST=true кэш сохраняется в ./storage/cache/*.npz.
+4) Промахи кэша у локальных моделей (MiniLM, CLIP) идут через микробатчинг
+   (batching.py): одновременные запросы кодируются одним encode.
+"""
+
+import os
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+import metrics
+import resources
+from batching import EMBED_MICROBATCH, MicroBatcher
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+OFFLINE_ONLY       = os.getenv("OFFLINE_ONLY", "true").lower() == "true"
+OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-large")
+LOCAL_ST_MODEL     = resources.LOCAL_ST_MODEL
+CLIP_MODEL         = resources.CLIP_MODEL
+
+QUERY_CACHE_SIZE    = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "false").lower() == "true"
+CACHE_DIR           = resources.BASE_DIR / "storage" / "cache"
+FLUSH_EVERY_S       = 30.0
+
+# ── Ключи кэша ─────────────────────────────────────────────────────────────────
+def normalize_query(text: str) -> str:
+    """Регистр и пробелы не должны порождать новый эмбеддинг."""
+    return " ".join((text or "").lower().replace("ё", "е").split())
+
+def bytes_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+# ── LRU-кэш векторов ───────────────────────────────────────────────────────────
+class QueryCache:
+    """Потокобезопасный LRU: key → float32-вектор, с опциональным сохранением на диск."""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, path: Optional[Path] = None, name: str = "query"):
+        self.maxsize = max(1, maxsize)
+        self.name = name
+        self.path = path
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+        metrics.count("cache_requests_total", cache=self.name, result="miss" if vec is None else "hit")
+        return vec
+
+    def put(self, key: str, vec: Sequence[float]) -> None:
+        arr = np.asarray(vec, dtype=np.float32)
+        with self._lock:
+            self._data[key] = arr
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            self._dirty = True
+        self.maybe_flush()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._dirty = True
+
+    # ---- диск ----
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as z:
+                keys, vecs = z["keys"], z["vecs"]
+            with self._lock:
+                for k, v in zip(keys.tolist(), vecs):
+                    self._data[str(k)] = v
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        except Exception:
+            # битый файл кэша — просто начинаем с пустого
+            pass
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._data:
+                return
+            keys = np.array(list(self._data.keys()))
+            dims = {v.shape[0] for v in self._data.values()}
+            if len(dims) != 1:
+                return
+            vecs = np.stack(list(self._data.values()))
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp.npz")
+        np.savez(tmp, keys=keys, vecs=vecs)
+        os.replace(tmp, self.path)
+
+    def maybe_flush(self) -> None:
+        if self.path is not None and self._dirty and time.monotonic() - self._last_flush > FLUSH_EVERY_S:
+            self.save()
+
+def _cache_for(kind: str) -> QueryCache:
+    path = (CACHE_DIR / f"query_{kind}.npz") if QUERY_CACHE_PERSIST else None
+    cache = QueryCache(QUERY_CACHE_SIZE, path, name=f"query_{kind}")
+    if path is not None:
+        atexit.register(cache.save)
+    return cache
+
+# ── Текстовый эмбеддер ─────────────────────────────────────────────────────────
+class TextEmbedder:
+    """
+    embed_documents — батч для индексации, embed_query — один запрос через LRU.
+    Векторы нормированы (для ST — normalize_embeddings=True, OpenAI — уже нормированы).
+    """
+
+    def __init__(self, offline: bool = OFFLINE_ONLY, cache: Optional[QueryCache] = None):
+        self.offline = offline
+        self.name = f"ST({LOCAL_ST_MODEL})" if offline else f"OpenAI({OPENAI_EMBED_MODEL})"
+        self.cache = cache if cache is not None else _cache_for("text")
+        # OpenAI — сетевой API со своими лимитами, батчим только локальную модель
+        self.batcher = MicroBatcher("text", self._encode_local) if offline and EMBED_MICROBATCH else None
+
+    @staticmethod
+    def _encode_local(texts: List[str]) -> np.ndarray:
+        return resources.text_model().encode(texts, normalize_embeddings=True, batch_size=len(texts))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.offline:
+            model = resources.text_model()
+            return model.encode(texts, normalize_embeddings=True).tolist()
+        return resources.registry.get("openai_embed").get_text_embedding_batch(texts)
+
+    def _embed_query_uncached(self, text: str) -> List[float]:
+        if self.batcher is not None:
+            return self.batcher.submit(text)
+        if self.offline:
+            model = resources.text_model()
+            return model.encode([text], normalize_embeddings=True)[0].tolist()
+        return resources.registry.get("openai_embed").get_query_embedding(text)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = f"{self.name}::{normalize_query(text)}"
+        vec = self.cache.get(key)
+        if vec is None:
+            vec = np.asarray(self._embed_query_uncached(text), dtype=np.float32)
+            self.cache.put(key, vec)
+        return vec.tolist()
+
+# ── CLIP-эмбеддер изображений ──────────────────────────────────────────────────
+class ImageEmbedder:
+    """CLIP: embed_images для батчей индексатора, embed_image_bytes — запрос с кэшем."""
+
+    def __init__(self, cache: Optional[QueryCache] = None):
+        self.name = f"CLIP({CLIP_MODEL})"
+        self.cache = cache if cache is not None else _cache_for("image")
+        self.batcher = MicroBatcher("image", self.embed_images) if EMBED_MICROBATCH else None
+
+    def embed_images(self, images) -> np.ndarray:
+        if not images:
+            return np.zeros((0, 0), dtype=np.float32)
+        model = resources.clip_model()
+        return model.encode(list(images), convert_to_numpy=True, normalize_embeddings=True)
+
+    def embed_image_bytes(self, data: bytes) -> List[float]:
+        key = f"{self.name}::{bytes_key(data)}"
+        vec = self.cache.get(key)
+        if vec is None:
+            import io
+            from PIL import Image
+            img = Image.open(io.BytesIO(data)).convert("RGB")   # декод — в потоке вызывающего
+            if self.batcher is not None:
+                vec = np.asarray(self.batcher.submit(img), dtype=np.float32)
+            else:
+                vec = self.embed_images([img])[0].astype(np.float32)
+            self.cache.put(key, vec)
+        return vec.tolist()
+
+# ── Синглтоны процесса ─────────────────────────────────────────────────────────
+def _load_openai_embed():
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    return OpenAIEmbedding(model=OPENAI_EMBED_MODEL)
+
+resources.registry.register("openai_embed", _load_openai_embed, warm=not OFFLINE_ONLY)
+resources.registry.register("text_embedder", TextEmbedder)
+resources.registry.register("image_embedder", ImageEmbedder)
+
+def get_text_embedder() -> TextEmbedder:
+    return resources.registry.get("text_embedder")
+
+def get_image_embedder() -> ImageEmbedder:
+    return resources.registry.get("image_embedder")
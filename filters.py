@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+filters.py — фильтры по метаданным, которые исполняет сам Chroma (where=...)
+
+Индекс (build_index.py → filter_fields) пишет в каждый чанк нормализованные поля:
+- "tag:<тег>": True        — по булеву ключу на каждый тег (нижний регистр, ё→е);
+- "product_norm", "project_norm" — продукт/проект в нижнем регистре;
+- "date_start", "date_end" — диапазон дат исследования как YYYYMM (int),
+                             "2023-02 — 2023-03" → 202302..202303.
+
+Запрос (build_where) превращает фильтры UI в where-условие Chroma. Тег и продукт/проект
+ищутся подстрокой по словарям корпуса (манифест индекса) и уходят в where точными
+значениями. То, что пушнуть нельзя (подстрока, которой нет в словаре), проверяется в Python,
+а query_filtered в этом случае добирает кандидатов адаптивно, пока не наберёт k.
+"""
+
+import re
+import json
+import pathlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MANIFEST_PATH = pathlib.Path(__file__).resolve().parent / "storage" / "index_manifest.json"
+
+OVERFETCH_START = 2     # первый запрос: k × 2
+OVERFETCH_MAX   = 64    # потолок: k × 64 (дальше — весь индекс не тянем)
+
+_DATE_RE = re.compile(r"(\d{4})(?:[-./](\d{1,2}))?")
+
+# ── Нормализация (общая для индекса и запроса) ─────────────────────────────────
+def norm_text(s: Any) -> str:
+    return " ".join(str(s or "").lower().replace("ё", "е").split())
+
+def tag_key(tag: str) -> str:
+    return f"tag:{norm_text(tag)}"
+
+def split_tags(tags: Any) -> List[str]:
+    if isinstance(tags, list):
+        items = tags
+    else:
+        items = str(tags or "").split(",")
+    return [t for t in (norm_text(x) for x in items) if t]
+
+def parse_date_range(value: Any) -> Optional[Tuple[int, int]]:
+    """'2023-02' → (202302, 202302); '2023-02 — 2023-03' → (202302, 202303); '2023' → (202301, 202312)."""
+    found = _DATE_RE.findall(str(value or ""))
+    if not found:
+        return None
+    starts, ends = [], []
+    for year, month in found:
+        y = int(year)
+        if month and 1 <= int(month) <= 12:
+            starts.append(y * 100 + int(month))
+            ends.append(y * 100 + int(month))
+        else:
+            starts.append(y * 100 + 1)
+            ends.append(y * 100 + 12)
+    return min(starts), max(ends)
+
+def filter_fields(front: Dict) -> Dict[str, Any]:
+    """Поля для where — кладутся в мету каждого чанка документа."""
+    fields: Dict[str, Any] = {
+        "product_norm": norm_text(front.get("product")),
+        "project_norm": norm_text(front.get("project")),
+    }
+    rng = parse_date_range(front.get("date"))
+    if rng:
+        fields["date_start"], fields["date_end"] = rng
+    for t in split_tags(front.get("tags")):
+        fields[tag_key(t)] = True
+    return fields
+
+# ── Словари тегов и продуктов (из манифеста индекса) ───────────────────────────
+_EMPTY_VOCAB: Dict[str, set] = {"tags": set(), "product_norm": set(), "project_norm": set()}
+_vocab_cache: Dict[str, Any] = {"mtime": None, "values": _EMPTY_VOCAB}
+
+def known_values() -> Dict[str, set]:
+    """{"tags", "product_norm", "project_norm"} → значения в корпусе; манифест перечитываем, только если он изменился."""
+    try:
+        mtime = MANIFEST_PATH.stat().st_mtime
+    except OSError:
+        return _EMPTY_VOCAB
+    if _vocab_cache["mtime"] != mtime:
+        try:
+            files = json.loads(MANIFEST_PATH.read_text(encoding="utf-8")).get("files", {}).values()
+            values = {"tags": {t for entry in files for t in entry.get("tags", [])},
+                      "product_norm": {e["product"] for e in files if e.get("product")},
+                      "project_norm": {e["project"] for e in files if e.get("project")}}
+        except Exception:
+            values = _EMPTY_VOCAB
+        _vocab_cache.update(mtime=mtime, values=values)
+    return _vocab_cache["values"]
+
+def known_tags() -> set:
+    """Все теги корпуса."""
+    return known_values()["tags"]
+
+# ── Построение where ───────────────────────────────────────────────────────────
+def _and(clauses: List[Dict]) -> Optional[Dict]:
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _or(clauses: List[Dict]) -> Dict:
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def build_where(iteration: str = "", scenario: str = "", date_hint: str = "", product: str = "",
+                vocab: Optional[set] = None,
+                products: Optional[Dict[str, set]] = None) -> Tuple[Optional[Dict], Optional[Callable[[Dict], bool]]]:
+    """
+    Возвращает (where для Chroma или None, остаточный предикат по мете или None).
+    Предикат появляется, только если часть фильтра нельзя выразить через where.
+    vocab — теги корпуса, products — {"product_norm", "project_norm"} → значения (None — из манифеста).
+    """
+    clauses: List[Dict] = []
+    residual: List[Callable[[Dict], bool]] = []
+
+    if iteration.strip():
+        clauses.append({"iteration": iteration.strip()})
+
+    if product.strip():
+        p = norm_text(product)
+        products = known_values() if products is None else products
+        # подстрока продукта/проекта → $in по точным значениям из словаря, как у тегов
+        matched = {key: sorted(v for v in products.get(key, ()) if p in v) for key in ("product_norm", "project_norm")}
+        if any(matched.values()):
+            clauses.append(_or([{key: {"$in": values}} for key, values in matched.items() if values]))
+        else:
+            residual.append(lambda md: p in (md.get("product_norm") or "") or p in (md.get("project_norm") or ""))
+
+    if date_hint.strip():
+        rng = parse_date_range(date_hint)
+        if rng:
+            # пересечение диапазонов: начало исследования ≤ конца запроса и конец ≥ начала
+            clauses.append({"date_start": {"$lte": rng[1]}})
+            clauses.append({"date_end": {"$gte": rng[0]}})
+        else:
+            d = date_hint.strip()
+            residual.append(lambda md: (md.get("date") or "").strip() == d)
+
+    if scenario.strip():
+        s = norm_text(scenario)
+        vocab = known_tags() if vocab is None else vocab
+        matched = sorted(t for t in vocab if s in t)
+        if matched:
+            # подстрока тега → OR по точным булевым ключам всех подходящих тегов
+            clauses.append(_or([{tag_key(t): True} for t in matched]))
+        else:
+            residual.append(lambda md: s in norm_text(md.get("tags")))
+
+    pred = None
+    if residual:
+        pred = lambda md: all(f(md or {}) for f in residual)
+    return _and(clauses), pred
+
+# ── Запрос с адаптивным добором ────────────────────────────────────────────────
+def _first(batch) -> list:
+    """Результаты первого (единственного) запроса из пакетного ответа Chroma."""
+    if batch is None or len(batch) == 0:
+        return []
+    return list(batch[0])
+
+def query_filtered(collection, query_embedding: List[float], k: int,
+                   where: Optional[Dict] = None, pred: Optional[Callable[[Dict], bool]] = None,
+                   include: Optional[List[str]] = None) -> Dict[str, list]:
+    """
+    collection.query с where; если есть остаточный предикат — тянем k×2, k×4, …
+    кандидатов, пока k не пройдут фильтр (или кандидаты не кончатся).
+    Возвращает плоский dict: ids / documents / metadatas / distances (+ embeddings, если просили).
+    """
+    include = include or ["documents", "metadatas", "distances"]
+    fetch = k if pred is None else k * OVERFETCH_START
+    total = None
+    while True:
+        kwargs = {"query_embeddings": [query_embedding], "n_results": fetch, "include": include}
+        if where:
+            kwargs["where"] = where
+        res = collection.query(**kwargs)
+        out = {key: _first(res.get(key)) for key in ["ids", *include]}
+        got = len(out["ids"])
+        if pred is not None:
+            keep = [i for i, md in enumerate(out.get("metadatas") or []) if pred(md or {})]
+            out = {key: [vals[i] for i in keep] for key, vals in out.items()}
+        if pred is None or len(out["ids"]) >= k or got < fetch:
+            break
+        if total is None:
+            total = collection.count()
+        if fetch >= min(total, k * OVERFETCH_MAX):
+            break
+        fetch = min(fetch * 2, total, k * OVERFETCH_MAX)
+    return {key: vals[:k] for key, vals in out.items()}
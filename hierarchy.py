@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+hierarchy.py — поиск «исследование → секция → чанк»
+
+Плоский поиск сравнивает запрос с каждым чанком ux_research, и с ростом корпуса
+(годы исследований) это растёт линейно, хотя почти все чанки нерелевантного
+исследования нерелевантны вместе с ним. build_index.py поэтому держит ещё два уровня:
+- ux_docs     — вектор исследования: frontmatter (title, goal, key_findings — doc_text)
+                плюс центроид всех его чанков;
+- ux_sections — центроид векторов чанков секции (единичный), key_findings — своя «секция».
+Мета обоих уровней несёт те же поля фильтров, что и чанки (filters.filter_fields), —
+where/pred из build_where работают на каждом уровне.
+
+narrow() на запросе: HIER_TOP_DOCS лучших исследований → HIER_TOP_SECTIONS лучших
+секций только среди них → where для чанков только этих секций. Векторная ветка
+retrieval.search_text ищет уже по нему; лексическая (BM25) остаётся по всему корпусу.
+Выгода — у NumPy-хранилища (vector_store.py): узкий where считает скаляры только по
+своим строкам. Полнота против плоского поиска и выигрыш по времени — bench/eval_hierarchy.py.
+
+HIER_SEARCH=auto (по умолчанию) включает иерархию, когда хранилище — NumPy, в ux_research
+не меньше HIER_MIN_CHUNKS чанков и уровни построены: на маленьком корпусе плоский поиск
+точен и быстр, а у Chroma длинный $in не сужает HNSW-поиск и только замедляет его.
+"""
+
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()
+
+import metrics
+import resources
+from filters import query_filtered
+from manifest import read_generation
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+HIER_SEARCH       = os.getenv("HIER_SEARCH", "auto").lower()      # auto | true | false
+HIER_MIN_CHUNKS   = int(os.getenv("HIER_MIN_CHUNKS", "20000"))    # auto: с какого размера корпуса
+HIER_TOP_DOCS     = int(os.getenv("HIER_TOP_DOCS", "40"))
+HIER_TOP_SECTIONS = int(os.getenv("HIER_TOP_SECTIONS", "120"))
+
+BUILD_FILES = 64     # файлов на один get при сборке центроидов — память не растёт с корпусом
+CHUNK_ONLY  = ("chunk_index", "images")   # поля чанка, которых нет у секции
+
+# ── Сборка ─────────────────────────────────────────────────────────────────────
+def doc_text(front: Dict) -> str:
+    """Текст вектора исследования: заголовок, цель и ключевые выводы из frontmatter."""
+    kf = front.get("key_findings") or []
+    parts = [front.get("title"), front.get("goal"), *(kf if isinstance(kf, list) else [kf])]
+    return "\n".join(str(p).strip() for p in parts if p and str(p).strip())
+
+def section_of(md: Dict) -> Optional[str]:
+    """Номер секции чанка из chunk_index "<секция>_<чанк>"; key_findings ("kf_<i>") — "kf"."""
+    sec, _, i = str(md.get("chunk_index") or "").rpartition("_")
+    if sec == "kf":
+        return "kf"
+    return sec if sec.isdigit() and i.isdigit() else None
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+def _section_rows(res: Dict) -> Tuple[List[Tuple[str, List[float], Dict]], Dict[str, np.ndarray]]:
+    """
+    Чанки (get с embeddings и metadatas) → строки секций (id секции, центроид, мета секции)
+    и единичные центроиды файлов по всем их чанкам.
+    """
+    sums: Dict[str, List] = {}
+    files: Dict[str, np.ndarray] = {}
+    for emb, md in zip(res.get("embeddings") if res.get("embeddings") is not None else [], res.get("metadatas") or []):
+        md = md or {}
+        if emb is None:
+            continue
+        vec = np.asarray(emb, dtype=np.float64)
+        name = md.get("filename")
+        files[name] = files[name] + vec if name in files else vec.copy()
+        sec = section_of(md)
+        if sec is None:
+            continue
+        sid = f"{name}#{sec}"
+        entry = sums.get(sid)
+        if entry is None:
+            meta = {k: v for k, v in md.items() if k not in CHUNK_ONLY}
+            sums[sid] = [vec.copy(), 1, meta]
+        else:
+            entry[0] += vec
+            entry[1] += 1
+    rows = [(sid, _unit(vec).astype(np.float32).tolist(), {**meta, "n_chunks": n})
+            for sid, (vec, n, meta) in sums.items()]
+    return rows, {name: _unit(vec) for name, vec in files.items()}
+
+def build(collection, docs_coll, sections_coll, docs: Sequence[Tuple[str, str, Dict]],
+          removed: Iterable[str], embed: Callable[[List[str]], List[List[float]]], batch: int = 64) -> Dict[str, int]:
+    """
+    Обновляет уровни для изменённых файлов: docs — (filename, doc_text, мета исследования),
+    removed — исчезнувшие файлы. Секции пересчитываются по уже записанным чанкам; вектор
+    исследования — сумма единичных векторов frontmatter и центроида всех его чанков:
+    одни title/goal/key_findings слишком коротки, чтобы по ним найти ответ из середины отчёта.
+    """
+    names = [name for name, _, _ in docs]
+    gone = sorted(set(removed) | set(names))
+    for i in range(0, len(gone), BUILD_FILES):
+        part = gone[i:i + BUILD_FILES]
+        where = {"filename": {"$in": part}}
+        docs_coll.delete(where=where)
+        sections_coll.delete(where=where)
+
+    n_docs = n_sections = 0
+    for i in range(0, len(docs), BUILD_FILES):
+        part = docs[i:i + BUILD_FILES]
+        res = collection.get(where={"filename": {"$in": [name for name, _, _ in part]}},
+                             include=["embeddings", "metadatas"])
+        rows, centroids = _section_rows(res)
+        for j in range(0, len(rows), batch):
+            chunk = rows[j:j + batch]
+            sections_coll.upsert(ids=[sid for sid, _, _ in chunk], embeddings=[v for _, v, _ in chunk],
+                                 metadatas=[md for _, _, md in chunk])
+        n_sections += len(rows)
+
+        for j in range(0, len(part), batch):
+            chunk = part[j:j + batch]
+            texts = [text or name for name, text, _ in chunk]     # без frontmatter — хотя бы имя файла
+            vecs = []
+            for (name, _, _), v in zip(chunk, embed(texts)):
+                v = _unit(np.asarray(v, dtype=np.float64))
+                c = centroids.get(name)
+                vecs.append(_unit(v + c if c is not None and c.shape == v.shape else v).astype(np.float32).tolist())
+            docs_coll.upsert(ids=[name for name, _, _ in chunk], embeddings=vecs,
+                             documents=texts, metadatas=[meta for _, _, meta in chunk])
+            n_docs += len(chunk)
+    return {"docs": n_docs, "sections": n_sections, "removed": len(set(removed))}
+
+# ── Поиск ──────────────────────────────────────────────────────────────────────
+_state_lock = threading.Lock()
+_state: Dict[str, object] = {"gen": None, "ready": False}
+
+def enabled() -> bool:
+    """HIER_SEARCH=true|false; auto — NumPy-хранилище, уровни построены и корпус не меньше HIER_MIN_CHUNKS."""
+    if HIER_SEARCH in ("true", "false"):
+        return HIER_SEARCH == "true"
+    if resources.VECTOR_BACKEND != "numpy":
+        return False
+    # размеры коллекций меняются только с переиндексацией — проверяем раз на поколение
+    gen = read_generation().get("text", 0)
+    if _state["gen"] != gen:
+        with _state_lock:
+            try:
+                ready = (resources.collection(resources.TEXT_COLLECTION).count() >= HIER_MIN_CHUNKS
+                         and resources.collection(resources.DOC_COLLECTION).count() > 0)
+            except Exception:
+                ready = False
+            _state.update(gen=gen, ready=ready)
+    return bool(_state["ready"])
+
+def _and(*clauses: Optional[Dict]) -> Dict:
+    clauses = [c for c in clauses if c]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def narrow(qvec: Sequence[float], where: Optional[Dict] = None, pred: Optional[Callable[[Dict], bool]] = None,
+           top_docs: Optional[int] = None, top_sections: Optional[int] = None) -> Optional[Dict]:
+    """where для чанков: только лучшие секции лучших исследований. None — уровни пусты, ищите по всему корпусу."""
+    top_docs, top_sections = top_docs or HIER_TOP_DOCS, top_sections or HIER_TOP_SECTIONS
+    with metrics.span("hier_docs"):
+        res = query_filtered(resources.collection(resources.DOC_COLLECTION), qvec, top_docs,
+                             where=where, pred=pred, include=["metadatas"])
+    files = sorted({md.get("filename") for md in res["metadatas"] if md and md.get("filename")})
+    if not files:
+        return None
+    with metrics.span("hier_sections"):
+        res = query_filtered(resources.collection(resources.SECTION_COLLECTION), qvec, top_sections,
+                             where=_and(where, {"filename": {"$in": files}}), pred=pred, include=["metadatas"])
+    sections = [md for md in res["metadatas"] if md]
+    if not sections:
+        return None
+    # filename × section_path — надмножество выбранных секций (одинаковые заголовки в разных
+    # исследованиях), зато where остаётся двумя $in без перечисления пар
+    return _and(where,
+                {"filename": {"$in": sorted({md["filename"] for md in sections})}},
+                {"section_path": {"$in": sorted({md.get("section_path") or "" for md in sections})}})
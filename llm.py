@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+llm.py — клиент LLM для онлайн-ответа: общий пул соединений, стриминг, бюджет времени
+
+Раньше rag.llm_answer создавал OpenAI() на каждый поиск (новое TLS-соединение) и ждал
+нестримингового chat.completions.create целиком. Теперь:
+- клиент один на процесс (resources.registry, "llm_client"): httpx-пул на LLM_POOL_SIZE
+  keep-alive соединений, повторов нет — их заменяет офлайн-фолбэк;
+- stream_chat() отдаёт токены по мере прихода (on_token — накопленный текст),
+  первые слова видны через сотни миллисекунд, а не после всей генерации;
+  SSE читается до конца тела — только так соединение возвращается в пул;
+- бюджет LLM_BUDGET_S жёсткий: таймер гасит сокет ответа, даже если сервер
+  замолчал посреди генерации, и stream_chat поднимает LLMBudgetExceeded.
+
+Совместимый с OpenAI сервер задаётся OPENAI_BASE_URL (так работает и локальная
+заглушка bench/llm_standin.py — см. bench/bench_llm.py).
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import metrics
+import resources
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+OPENAI_LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-4o")
+LLM_BUDGET_S     = float(os.getenv("LLM_BUDGET_S", "20"))      # весь ответ; дольше — офлайн-фолбэк
+LLM_CONNECT_S    = float(os.getenv("LLM_CONNECT_S", "3"))      # установка соединения
+LLM_POOL_SIZE    = int(os.getenv("LLM_POOL_SIZE", "8"))        # keep-alive соединений на процесс
+
+class LLMBudgetExceeded(TimeoutError):
+    """Ответ не уложился в бюджет; partial — что успело прийти."""
+
+    def __init__(self, budget_s: float, partial: str = ""):
+        super().__init__(f"LLM не уложился в {budget_s:g} с")
+        self.budget_s = budget_s
+        self.partial = partial
+
+# ── Клиент ─────────────────────────────────────────────────────────────────────
+def _load_llm_client():
+    import httpx
+    from openai import OpenAI
+    http = httpx.Client(
+        limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+        timeout=httpx.Timeout(LLM_BUDGET_S, connect=LLM_CONNECT_S),
+    )
+    return OpenAI(http_client=http, max_retries=0)
+
+resources.registry.register("llm_client", _load_llm_client, warm=not resources.OFFLINE_ONLY)
+
+def llm_client():
+    return resources.registry.get("llm_client")
+
+# ── Стриминг ───────────────────────────────────────────────────────────────────
+def stream_chat(messages: List[Dict[str, str]], on_token: Optional[Callable[[str], None]] = None,
+                budget_s: Optional[float] = None, model: Optional[str] = None, temperature: float = 0) -> str:
+    """Полный текст ответа; on_token(накопленный текст) — после каждого куска. LLMBudgetExceeded — по бюджету."""
+    budget_s = LLM_BUDGET_S if budget_s is None else budget_s
+    model = model or OPENAI_LLM_MODEL
+    t0 = time.monotonic()
+    deadline = t0 + budget_s
+    parts: List[str] = []
+    box: Dict[str, object] = {}
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        response = box.get("response")
+        if response is not None:
+            _abort(response)
+
+    timer = threading.Timer(budget_s, expire)
+    timer.daemon = True
+    timer.start()
+    try:
+        with llm_client().chat.completions.with_streaming_response.create(
+            model=model, messages=messages, temperature=temperature, stream=True,
+            timeout=max(0.1, deadline - time.monotonic()),
+        ) as raw:
+            box["response"] = raw.http_response
+            if expired.is_set():
+                raise LLMBudgetExceeded(budget_s)
+            for delta in _sse_deltas(raw.iter_lines()):
+                if not parts:
+                    metrics.observe("llm_first_token", time.monotonic() - t0)
+                parts.append(delta)
+                if on_token is not None:
+                    on_token("".join(parts))
+    except LLMBudgetExceeded:
+        raise
+    except Exception:
+        if expired.is_set() or time.monotonic() >= deadline:
+            raise LLMBudgetExceeded(budget_s, "".join(parts))
+        raise
+    finally:
+        timer.cancel()
+    if expired.is_set():   # ответ закрыли между кусками — итерация могла кончиться без ошибки
+        raise LLMBudgetExceeded(budget_s, "".join(parts))
+    return "".join(parts)
+
+def _abort(response) -> None:
+    """Оборвать ответ из другого потока. response.close() не будит поток, висящий в recv
+    (таймаут httpx — на каждое чтение, а не на весь ответ), поэтому гасим сам сокет."""
+    stream = (getattr(response, "extensions", None) or {}).get("network_stream")
+    sock = stream.get_extra_info("socket") if stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+def _sse_deltas(lines: Iterable[str]) -> Iterator[str]:
+    """Куски текста из SSE chat.completion.chunk. Тело читается до конца, а не до [DONE]:
+    недочитанный ответ httpx закрывает вместе с соединением, и пул не переиспользуется."""
+    for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            continue
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            raise RuntimeError(f"LLM: {chunk['error']}")
+        choices = chunk.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        if delta:
+            yield delta
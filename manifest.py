@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+manifest.py — манифест инкрементальной индексации (лежит рядом с ./storage/chroma)
+
+Формат (JSON):
+{
+  "version": 1,
+  "embedder": "ST(...)",                # чем строили векторы; сменился → полная пересборка
+  "params":   {...},                    # параметры нарезки; сменились → полная пересборка
+  "files": {
+    "<filename>": {"sha256": "...", "chunks": {"<chunk_id>": "<chunk_hash>", ...}}
+  }
+}
+
+Поколения индексов (./storage/index_generation.json): {"text": N, "images": M}.
+Индексаторы увеличивают счётчик после каждого запуска, который что-то поменял;
+кэш результатов (result_cache.py) включает поколение в ключ и сам устаревает.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable
+
+MANIFEST_VERSION = 1
+GENERATION_PATH  = Path(__file__).resolve().parent / "storage" / "index_generation.json"
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def sha256_file(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+def chunk_hash(text: str, meta: Dict[str, Any]) -> str:
+    """Хэш чанка: текст + метаданные (правка тегов/картинок тоже даёт upsert)."""
+    payload = json.dumps({"t": text, "m": meta}, ensure_ascii=False, sort_keys=True, default=str)
+    return sha256_bytes(payload.encode("utf-8"))[:32]
+
+def empty_manifest(**header: Any) -> Dict[str, Any]:
+    return {"version": MANIFEST_VERSION, **header, "files": {}}
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("version") == MANIFEST_VERSION and isinstance(data.get("files"), dict):
+            return data
+    except Exception:
+        pass
+    return {}
+
+def save_manifest(path: Path, data: Dict[str, Any]) -> None:
+    """Атомарная запись: сначала во временный файл, потом os.replace."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+def all_ids(manifest: Dict[str, Any], files: Iterable[str] = None) -> set:
+    entries = manifest.get("files", {})
+    names = entries.keys() if files is None else files
+    out = set()
+    for name in names:
+        out.update((entries.get(name) or {}).get("chunks", {}).keys())
+    return out
+
+# ── Поколения индексов ─────────────────────────────────────────────────────────
+_gen_lock = threading.Lock()
+_gen_cache: Dict[str, Any] = {"mtime": None, "value": {}}
+
+def read_generation(path: Path = GENERATION_PATH) -> Dict[str, int]:
+    """{"text": N, "images": M}; перечитывается, только если файл изменился (один stat на вызов)."""
+    try:
+        mtime = Path(path).stat().st_mtime_ns
+    except OSError:
+        return {}
+    if _gen_cache["mtime"] != mtime:
+        with _gen_lock:
+            try:
+                value = json.loads(Path(path).read_text(encoding="utf-8"))
+            except Exception:
+                value = {}
+            _gen_cache.update(mtime=mtime, value=value if isinstance(value, dict) else {})
+    return _gen_cache["value"]
+
+def bump_generation(kind: str, path: Path = GENERATION_PATH) -> int:
+    """Новое поколение индекса kind ("text" / "images"); запись атомарная."""
+    try:
+        value = json.loads(Path(path).read_text(encoding="utf-8"))
+    except Exception:
+        value = {}
+    value[kind] = int(value.get(kind, 0)) + 1
+    save_manifest(path, value)
+    return value[kind]
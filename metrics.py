@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+metrics.py — тайминги стадий поиска и экспорт метрик в формате Prometheus
+
+Когда поиск «тормозит», непонятно, куда ушло время: эмбеддинг, запрос к Chroma,
+BM25, фильтры, TextRank, OpenAI, картинки или отчёт. Здесь:
+- span("стадия") — контекст-менеджер вокруг стадии: время идёт в гистограмму
+  стадии и, если открыт trace(), — в разбор текущего запроса;
+- trace() — разбор одного запроса (панель «⏱ Тайминги» в сайдбаре app.py,
+  заголовок Server-Timing в server.py). Живёт в contextvars; в пул потоков
+  его переносит copy_context();
+- count("метрика", метка=…) — счётчики: попадания в кэши, вызовы и фолбэки LLM;
+- render_prometheus() — текстовый формат Prometheus (GET /metrics у server.py)
+  или файл METRICS_FILE (textfile-коллектор node_exporter) — для app.py; туда же
+  идут гистограммы микробатчинга эмбеддингов (batching.py): размер батча и ожидание в очереди.
+
+METRICS_ENABLED=false — span() отдаёт общий пустой контекст, trace() — None,
+count() сразу возвращается: остаётся один вызов функции на стадию.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from batching import Histogram, all_stats as batcher_stats
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_FILE    = os.getenv("METRICS_FILE", "")                 # пусто — файл не пишем
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "15"))
+
+PREFIX = "ux_rag"
+STAGE_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+COUNTERS = {
+    "cache_requests_total": "Обращения к кэшам (cache=result|answer|query_text|query_image, result=hit|miss)",
+    "llm_requests_total":   "Вызовы LLM для ответа",
+    "llm_fallbacks_total":  "Ответы LLM, заменённые офлайн-цитатами (reason=error|budget)",
+    "llm_prompt_tokens_total":       "Токены промптов LLM после context_pack.py",
+    "llm_prompt_tokens_saved_total": "Токены, сэкономленные context_pack.py против format_cite top-5",
+}
+
+_lock = threading.Lock()
+_stages: Dict[str, Histogram] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], int] = {}
+
+# ── Разбор одного запроса ──────────────────────────────────────────────────────
+class Trace:
+    """Стадии одного запроса по порядку; одинаковые стадии складываются."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.total_s: Optional[float] = None
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans.append((stage, seconds))   # append атомарен — пишут и потоки пула
+
+    def rows(self) -> List[Dict[str, Any]]:
+        agg: Dict[str, List[float]] = {}
+        for stage, seconds in list(self.spans):
+            agg.setdefault(stage, []).append(seconds)
+        return [{"stage": s, "ms": round(sum(v) * 1000.0, 2), "calls": len(v)} for s, v in agg.items()]
+
+    def server_timing(self) -> str:
+        parts = [f"{r['stage']};dur={r['ms']:.1f}" for r in self.rows()]
+        if self.total_s is not None:
+            parts.append(f"total;dur={self.total_s * 1000.0:.1f}")
+        return ", ".join(parts)
+
+_current: ContextVar[Optional[Trace]] = ContextVar("metrics_trace", default=None)
+
+@contextmanager
+def trace(stage: Optional[str] = None) -> Iterator[Optional[Trace]]:
+    """Открыть разбор запроса; stage — записать и общее время в гистограмму с этим именем."""
+    if not METRICS_ENABLED:
+        yield None
+        return
+    tr = Trace()
+    token = _current.set(tr)
+    try:
+        yield tr
+    finally:
+        tr.total_s = time.perf_counter() - tr.started
+        _current.reset(token)
+        if stage:
+            _histogram(stage).observe(tr.total_s)
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+def in_context(fn: Callable) -> Callable:
+    """fn в копии текущего контекста — для executor.submit / run_in_executor (стадии попадут в тот же trace)."""
+    if not METRICS_ENABLED:
+        return fn
+    ctx = copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+# ── Стадии ─────────────────────────────────────────────────────────────────────
+def _histogram(stage: str) -> Histogram:
+    hist = _stages.get(stage)
+    if hist is None:
+        with _lock:
+            hist = _stages.setdefault(stage, Histogram(STAGE_BUCKETS_S))
+    return hist
+
+def observe(stage: str, seconds: float) -> None:
+    _histogram(stage).observe(seconds)
+    tr = _current.get()
+    if tr is not None:
+        tr.add(stage, seconds)
+
+class _Span:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        observe(self.stage, time.perf_counter() - self.t0)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(stage: str):
+    return _Span(stage) if METRICS_ENABLED else _NO_SPAN
+
+# ── Счётчики ───────────────────────────────────────────────────────────────────
+def count(metric: str, n: int = 1, **labels: str) -> None:
+    if not METRICS_ENABLED:
+        return
+    key = (metric, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+# ── Снимки ─────────────────────────────────────────────────────────────────────
+def _quantile(snap: Dict[str, Any], q: float) -> Optional[float]:
+    """Оценка квантиля по корзинам (линейно внутри корзины, как histogram_quantile)."""
+    n = snap["count"]
+    if not n:
+        return None
+    rank, prev_le, prev_acc = q * n, 0.0, 0
+    for le, acc in snap["buckets"]:
+        if acc >= rank:
+            if le == "+Inf":
+                return prev_le
+            inside = acc - prev_acc
+            return prev_le + (le - prev_le) * ((rank - prev_acc) / inside if inside else 1.0)
+        prev_le, prev_acc = le, acc
+    return prev_le
+
+def stage_stats() -> List[Dict[str, Any]]:
+    """По каждой стадии: число замеров, среднее и оценки p50/p95 в мс."""
+    with _lock:
+        items = sorted(_stages.items())
+    out = []
+    for stage, hist in items:
+        snap = hist.snapshot()
+        p50, p95 = _quantile(snap, 0.5), _quantile(snap, 0.95)
+        out.append({"stage": stage, "count": snap["count"],
+                    "mean_ms": round(snap["mean"] * 1000.0, 2) if snap["mean"] is not None else None,
+                    "p50_ms": round(p50 * 1000.0, 2) if p50 is not None else None,
+                    "p95_ms": round(p95 * 1000.0, 2) if p95 is not None else None})
+    return out
+
+def counter_stats() -> List[Dict[str, Any]]:
+    with _lock:
+        items = sorted(_counters.items())
+    return [{"metric": m, "labels": dict(labels), "value": v} for (m, labels), v in items]
+
+# ── Prometheus ─────────────────────────────────────────────────────────────────
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs) -> str:
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}" if body else ""
+
+def _histogram_lines(lines: List[str], name: str, labels: List[Tuple[str, Any]], snap: Dict[str, Any],
+               scale: float = 1.0) -> None:
+    """Строки одной гистограммы; scale переводит единицы снимка (мс → с)."""
+    for le, acc in snap["buckets"]:
+        lines.append(f"{name}_bucket{_labels(labels + [('le', le if le == '+Inf' or scale == 1.0 else le * scale)])} {acc}")
+    lines.append(f"{name}_sum{_labels(labels)} {snap['sum'] * scale:.6f}")
+    lines.append(f"{name}_count{_labels(labels)} {snap['count']}")
+
+def render_prometheus() -> str:
+    lines = [f"# HELP {PREFIX}_stage_seconds Время стадий конвейера поиска",
+             f"# TYPE {PREFIX}_stage_seconds histogram"]
+    with _lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+    for stage, hist in stages:
+        _histogram_lines(lines, f"{PREFIX}_stage_seconds", [("stage", stage)], hist.snapshot())
+    batchers = batcher_stats()
+    if batchers:
+        lines += [f"# HELP {PREFIX}_batch_size Элементов в одном encode микробатчера",
+                  f"# TYPE {PREFIX}_batch_size histogram"]
+        for b in batchers:
+            _histogram_lines(lines, f"{PREFIX}_batch_size", [("batcher", b["name"])], b["batch_size"])
+        lines += [f"# HELP {PREFIX}_batch_queue_wait_seconds Ожидание элемента в очереди микробатчера",
+                  f"# TYPE {PREFIX}_batch_queue_wait_seconds histogram"]
+        for b in batchers:
+            _histogram_lines(lines, f"{PREFIX}_batch_queue_wait_seconds", [("batcher", b["name"])], b["queue_wait_ms"],
+                             scale=0.001)
+    seen = set()
+    for (metric, labels), value in counters:
+        name = f"{PREFIX}_{metric}"
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {name} {COUNTERS.get(metric, metric)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: Path) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(render_prometheus(), encoding="utf-8")
+    os.replace(tmp, path)   # коллектор не должен увидеть недописанный файл
+
+_exporter: Dict[str, Any] = {"thread": None}
+_exporter_lock = threading.Lock()
+
+def start_file_exporter(path: str = METRICS_FILE, interval: float = METRICS_FLUSH_S) -> bool:
+    """Фоновая запись метрик в файл раз в interval секунд (один поток на процесс)."""
+    if not (METRICS_ENABLED and path):
+        return False
+    with _exporter_lock:
+        if _exporter["thread"] is not None:
+            return True
+
+        def loop():
+            while True:
+                try:
+                    write_prometheus(Path(path))
+                except OSError as e:
+                    print(f"[metrics] не удалось записать {path}: {e}")
+                time.sleep(max(1.0, interval))
+
+        _exporter["thread"] = threading.Thread(target=loop, name="metrics-exporter", daemon=True)
+        _exporter["thread"].start()
+    return True
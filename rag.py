@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+rag.py — поиск, своды и поиск по макету без Streamlit
+
+Логика, которая раньше жила внутри app.py (и перезапускалась вместе со скриптом
+на каждое действие), вынесена сюда. Её используют:
+- app.py — интерфейс Streamlit;
+- server.py — асинхронный HTTP-бэкенд для app-ui (контракты app-ui/lib/schemas.ts).
+Все функции блокирующие (модели, Chroma, LLM): из asyncio их вызывают через executor.
+Ответ LLM (llm.py) стримится: summarize/answer принимают on_token для вывода по кускам.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import answer_cache
+import context_pack
+import llm
+import metrics
+import resources
+import retrieval
+import section_images
+from embeddings import bytes_key, get_image_embedder, get_text_embedder, normalize_query
+from filters import build_where
+from result_cache import get_result_cache, make_key
+from sentence_index import sentence_index
+from summarize import offline_summary, summarize_tfidf_textrank
+
+_summary_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="summary")
+
+# ── Картинки хита ──────────────────────────────────────────────────────────────
+def _append_img(imgs, item):
+    if isinstance(item, str):
+        imgs.append((item, None))
+    elif isinstance(item, dict):
+        path = item.get("path") or item.get("src") or item.get("url")
+        if path:
+            imgs.append((path, item.get("alt")))
+
+def parse_images(images_raw) -> List[Tuple[str, Optional[str]]]:
+    """meta['images'] → список пар (path, alt). Поддерживает list/dict/JSON/str."""
+    imgs = []
+    if images_raw is None:
+        return imgs
+    if isinstance(images_raw, list):
+        for it in images_raw: _append_img(imgs, it)
+    elif isinstance(images_raw, dict):
+        _append_img(imgs, images_raw)
+    elif isinstance(images_raw, str):
+        try:
+            parsed = json.loads(images_raw)
+            if isinstance(parsed, list):
+                for it in parsed: _append_img(imgs, it)
+            elif isinstance(parsed, dict):
+                _append_img(imgs, parsed)
+            else:
+                _append_img(imgs, images_raw)
+        except Exception:
+            _append_img(imgs, images_raw)
+    return imgs
+
+def hit_images(meta: Optional[Dict], max_count: int = 3) -> List[Tuple[str, Optional[str]]]:
+    """Картинки из метаданных чанка, а если их нет — картинки секции (section_images.json)."""
+    meta = meta or {}
+    return parse_images(meta.get("images") or []) or section_images.images_for(meta, max_count=max_count)
+
+# ── Поиск по тексту ────────────────────────────────────────────────────────────
+def search(query: str, iteration: str = "", scenario: str = "", date_hint: str = "", product: str = "",
+           k: int = 12, hybrid: bool = retrieval.HYBRID_SEARCH,
+           rerank: bool = retrieval.RERANK) -> Tuple[List[Dict], bool]:
+    """Хиты retrieval.search_text и признак «фильтры заданы» (для подсказки при пустой выдаче)."""
+    # фильтры по метаданным уходят в where-запрос к индексу (filters.py)
+    with metrics.span("filters"):
+        where, pred = build_where(iteration, scenario, date_hint, product)
+    hits = retrieval.search_text(query, k, where=where, pred=pred, hybrid=hybrid, rerank=rerank)
+    return hits, bool(where or pred)
+
+# ── Ответ и своды ──────────────────────────────────────────────────────────────
+def format_cite(hit, idx):
+    md = hit["meta"] or {}
+    label = f"{md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}"
+    where = f"{md.get('filename')} / {md.get('section_path') or '…'} / chunk {md.get('chunk_index')}"
+    return f"[{idx}] {label}\n{where}\n\"{(hit.get('text') or '').strip()}\""
+
+def build_prompt(q: str, top_hits: List[Dict], context: Optional[str] = None) -> str:
+    """context — готовый контекст (context_pack.pack); без него — format_cite top-5 как есть."""
+    if context is None:
+        context = "\n\n".join(format_cite(h, i+1) for i, h in enumerate(top_hits[:5]))
+    return (
+        "Ты — UX-исследователь. Ответь кратко и по делу.\n"
+        "1) Итог (2–4 предложения).\n"
+        "2) 1–3 дословные цитаты (ставь [номер источника]).\n"
+        "3) Источники: id · title · iteration · date · filename/section/chunk.\n\n"
+        f"Вопрос: {q}\n\nКонтекст:\n{context}\n"
+    )
+
+def offline_quotes(top_hits: List[Dict], header: str = "**Итог (офлайн).** Ниже — лучшие цитаты по запросу.") -> str:
+    return header + "\n\n" + "\n\n".join(format_cite(h, i+1) for i, h in enumerate(top_hits[:3]))
+
+def _pack_context(q: str, top_hits: List[Dict], report: Optional[Dict]) -> Tuple[str, List[str]]:
+    """(промпт, id чанков в нём). CONTEXT_PACK — контекст из context_pack.py, в report — токены до и после."""
+    if not (context_pack.CONTEXT_PACK and top_hits):
+        return build_prompt(q, top_hits), answer_cache.context_ids(top_hits[:5])
+    with metrics.span("context_pack"):
+        packed = context_pack.pack(top_hits)
+        prompt = build_prompt(q, top_hits, packed["text"])
+        tokens = context_pack.count_tokens(prompt)
+        before = context_pack.count_tokens(build_prompt(q, top_hits))
+    metrics.count("llm_prompt_tokens_total", tokens)
+    metrics.count("llm_prompt_tokens_saved_total", max(0, before - tokens))
+    if report is not None:
+        report.update(prompt_tokens=tokens, prompt_tokens_before=before, tokens_saved=before - tokens,
+                      fragments=packed["fragments"], hits=packed["hits"], truncated=packed["truncated"],
+                      tokenizer=context_pack.tokenizer_name())
+    return prompt, packed["ids"]
+
+def llm_answer(q, top_hits, offline_mode, on_token: Optional[Callable[[str], None]] = None,
+               report: Optional[Dict] = None):
+    """
+    Ответ LLM (стриминг через общий клиент llm.py); ошибка или бюджет LLM_BUDGET_S — цитаты офлайн.
+    Близкий по смыслу вопрос с тем же контекстом берётся из answer_cache.py без вызова LLM.
+    report — словарь, куда дописываются размер промпта, сэкономленные токены, ttft_ms
+    и fallback="error"|"budget", если вместо ответа LLM ушли офлайн-цитаты.
+    """
+    if offline_mode:
+        return offline_quotes(top_hits)
+    prompt, ids = _pack_context(q, top_hits, report)
+    cache = answer_cache.get_answer_cache() if answer_cache.ANSWER_CACHE and top_hits else None
+    if cache is not None:
+        embedder = get_text_embedder()
+        qvec = embedder.embed_query(q)          # тот же LRU, что у поиска
+        cached = cache.lookup(qvec, ids, llm.OPENAI_LLM_MODEL, embedder.name)   # ids — ровно то, что в промпте
+        if cached is not None:
+            if report is not None:
+                report["cached"] = True
+            if on_token is not None:
+                on_token(cached)
+            return cached
+    metrics.count("llm_requests_total")
+    t0 = time.perf_counter()
+
+    def first_token(text: str) -> None:
+        if report is not None and "ttft_ms" not in report:
+            report["ttft_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        if on_token is not None:
+            on_token(text)
+
+    try:
+        text = llm.stream_chat([{"role": "user", "content": prompt}], on_token=first_token)
+    except llm.LLMBudgetExceeded as e:
+        metrics.count("llm_fallbacks_total", reason="budget")
+        if report is not None:
+            report["fallback"] = "budget"
+        return offline_quotes(top_hits, f"**Итог (офлайн).** {e} — показаны цитаты.")
+    except Exception as e:
+        metrics.count("llm_fallbacks_total", reason="error")
+        if report is not None:
+            report["fallback"] = "error"
+        return offline_quotes(top_hits, f"Не удалось вызвать LLM ({e}). Показаны цитаты:")
+    if cache is not None and text:
+        cache.put(normalize_query(q), qvec, ids, llm.OPENAI_LLM_MODEL, embedder.name, text)
+    return text
+
+def _offline_summary(hits: List[Dict]) -> str:
+    with metrics.span("offline_summary"):
+        return offline_summary(hits, max_sent=4, index=sentence_index())
+
+def summarize(hits: List[Dict], query: str, offline_mode: bool,
+              on_token: Optional[Callable[[str], None]] = None,
+              report: Optional[Dict] = None) -> Tuple[Optional[str], str]:
+    """
+    (ответ LLM или None, экстрактивный свод).
+    Офлайн — TF-IDF + TextRank; онлайн — LLM, а офлайн-свод как резерв: он считается
+    в пуле параллельно со стримом LLM и готов к концу ответа (или к срабатыванию бюджета).
+    """
+    if offline_mode:
+        with metrics.span("textrank"):
+            return None, summarize_tfidf_textrank(hits, query, max_sentences=5, index=sentence_index())
+    fallback = _summary_pool.submit(metrics.in_context(_offline_summary), hits)
+    with metrics.span("llm"):
+        llm_out = llm_answer(query, hits, offline_mode, on_token=on_token, report=report)
+    return llm_out, fallback.result()
+
+# ── Конвейер целиком, через кэш результатов ────────────────────────────────────
+def answer(query: str, iteration: str = "", scenario: str = "", date_hint: str = "", product: str = "",
+           offline: bool = True, hybrid: bool = retrieval.HYBRID_SEARCH, k: int = 12,
+           summary_query: Optional[str] = None, on_token: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    {"hits", "has_filters", "llm", "summary", "context"} — из result_cache, если такой запрос
+    (те же фильтры, режим и поколение индекса) уже считали. В запись можно дописать "report_md".
+    "context" — онлайн-режим: токены промпта до и после context_pack.py, ttft_ms; иначе None.
+    on_token — куски ответа LLM по мере стриминга (только если ответ реально считается).
+    """
+    key = make_key("text", q=normalize_query(query), sq=normalize_query(summary_query or ""),
+                   f=[iteration.strip(), scenario.strip(), date_hint.strip(), product.strip()],
+                   offline=offline, hybrid=hybrid, k=k)
+
+    def compute() -> Dict:
+        hits, has_filters = search(query, iteration, scenario, date_hint, product, k=k, hybrid=hybrid)
+        context: Dict = {}
+        llm_out, summary_text = summarize(hits, summary_query or query, offline, on_token=on_token, report=context)
+        return {"hits": hits, "has_filters": has_filters, "llm": llm_out, "summary": summary_text,
+                "context": context or None}
+
+    # офлайн-цитаты вместо ответа LLM (ошибка, бюджет) не кэшируем — следующий такой же запрос снова спросит LLM
+    return get_result_cache().get_or_compute(key, compute,
+                                             cacheable=lambda r: not (r.get("context") or {}).get("fallback"))
+
+# ── Поиск по макету ────────────────────────────────────────────────────────────
+def search_images(image_bytes: bytes, k: int = 12) -> List[Dict]:
+    """Похожие картинки из ux_images: {"id", "path", "name", "rel", "dist"} (кэш по sha256 и поколению)."""
+    key = make_key("images", sha=bytes_key(image_bytes), k=k)
+    return get_result_cache().get_or_compute(key, lambda: {"hits": _search_images(image_bytes, k)})["hits"]
+
+def _search_images(image_bytes: bytes, k: int) -> List[Dict]:
+    # эмбеддинг изображения (CLIP) — кэш по sha256 байтов файла, модель из общего реестра
+    with metrics.span("image_embed"):
+        qvec = get_image_embedder().embed_image_bytes(image_bytes)
+    images_coll = resources.collection(resources.IMAGE_COLLECTION)
+    with metrics.span("image_query"):
+        res = images_coll.query(query_embeddings=[qvec], n_results=k, include=["metadatas", "documents", "distances"])
+
+    hits = []
+    # Получаем количество результатов из любого доступного поля
+    result_count = len(res["metadatas"][0]) if "metadatas" in res and res["metadatas"] else 0
+    for i in range(result_count):
+        md = res["metadatas"][0][i] or {}
+        # Используем индекс как ID, если ids недоступен
+        item_id = res["ids"][0][i] if "ids" in res and res["ids"] else f"item_{i}"
+        hits.append({
+            "id": item_id,
+            "path": md.get("path"),
+            "name": md.get("filename"),
+            "rel": md.get("rel"),
+            "dist": res["distances"][0][i] if "distances" in res and res["distances"] else None,
+        })
+    return hits
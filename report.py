@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+report.py — экспорт аналитического отчёта (.md / .pdf) по запросу, в памяти
+
+Раньше app.py на каждый поиск собирал markdown, импортировал reportlab и писал
+ux_insights_report.pdf в корень проекта, а потом читал его обратно — даже если
+отчёт никто не скачивал; одновременные сессии перезаписывали один и тот же файл.
+Теперь:
+- отчёт собирается, только когда пользователь выбрал формат;
+- PDF рисуется в BytesIO — файлов на диске нет;
+- PDF (особенно с картинками) рендерится в фоновом пуле (REPORT_WORKERS),
+  страница с результатами не ждёт; Future лежит в небольшом LRU по (формат, запрос,
+  свод, хиты), а не в записи result_cache — фолбэк LLM в кэш не попадает, и каждый rerun
+  получает новую запись. Повторный rerun или другая сессия с тем же отчётом получают
+  те же байты.
+"""
+
+import io
+import os
+import re
+import json
+import hashlib
+import threading
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+import metrics
+import resources
+from asset_index import resolve_image_path
+from rag import hit_images
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))     # потоков на рендер PDF
+REPORT_WAIT_S  = float(os.getenv("REPORT_WAIT_S", "2"))    # сколько app.py ждёт PDF без картинок
+REPORT_CACHE   = int(os.getenv("REPORT_CACHE", "16"))      # сколько последних PDF держать в памяти
+
+FORMATS = ("pdf", "pdf_images")   # PDF без картинок / с картинками из 03_assets
+_IMG_RE = re.compile(r"!\[([^\]]*)\]\(([^)]+)\)")
+_lock = threading.Lock()
+_pdfs: "OrderedDict[str, Future]" = OrderedDict()   # sha256(формат, запрос, свод, хиты) → Future с байтами
+
+# ── Markdown ───────────────────────────────────────────────────────────────────
+def summary_bullets(summary_text: str, limit: int = 4) -> List[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", summary_text or "") if s.strip()][:limit]
+
+def build_markdown(query: str, summary_text: str, hits: List[Dict], max_hits: int = 8) -> str:
+    now = datetime.now().strftime("%Y-%m-%d %H:%M")
+    parts = []
+    parts.append(f"# Аналитический отчёт — ИИ-исследователь 2.0\n")
+    parts.append(f"**Время:** {now}\n")
+    parts.append(f"**Запрос:** {query}\n")
+    parts.append("## Итоговый вывод\n")
+    if summary_text:
+        for b in summary_bullets(summary_text):
+            parts.append(f"- {b}")
+        parts.append("")
+    else:
+        parts.append("_Нет итогового свода._\n")
+    parts.append("## Источники и цитаты\n")
+    for i, h in enumerate(hits[:max_hits], start=1):
+        md = h["meta"] or {}
+        label = f"{md.get('id')} · {md.get('title')} · итерация {md.get('iteration')} · {md.get('date')}"
+        where = f"{md.get('filename')} / {md.get('section_path') or '…'} / chunk {md.get('chunk_index')}"
+        parts.append(f"### [{i}] {label}")
+        parts.append(where)
+        parts.append("")
+        parts.append(f"> { (h.get('text') or '').strip() }")
+        # картинки (если есть)
+        parsed_imgs = hit_images(md, max_count=3)
+        if parsed_imgs:
+            parts.append("")
+            parts.append("Связанные изображения:")
+            for p, _ in parsed_imgs[:3]:
+                parts.append(f"![img]({p})")
+            parts.append("")
+    return "\n".join(parts)
+
+def markdown_for(entry: Dict, query: str) -> str:
+    """Markdown отчёта из записи rag.answer — собирается один раз и остаётся в записи ("report_md")."""
+    if "report_md" not in entry:
+        with metrics.span("report_md"):
+            entry["report_md"] = build_markdown(query, entry.get("summary") or "", entry.get("hits") or [])
+    return entry["report_md"]
+
+# ── PDF ────────────────────────────────────────────────────────────────────────
+def pdf_available() -> bool:
+    return importlib.util.find_spec("reportlab") is not None
+
+def render_pdf(md_text: str, with_images: bool = False) -> bytes:
+    """PDF из markdown в памяти; with_images — картинки из 03_assets вставляются под источником."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    width, height = A4
+    x, y = 20*mm, height - 20*mm
+
+    def newline(step=6*mm):
+        nonlocal y
+        y -= step
+        if y < 15*mm:
+            c.showPage(); y = height - 20*mm
+
+    for line in md_text.splitlines():
+        img = _IMG_RE.fullmatch(line.strip())
+        if img:
+            path, found = resolve_image_path(img.group(2))
+            if with_images and found and not path.startswith("http"):
+                try:
+                    reader = ImageReader(path)
+                    iw, ih = reader.getSize()
+                    w = min(80*mm, width - 2*x)
+                    h = w * ih / iw if iw else w
+                    h = min(h, height - 40*mm)
+                    w = h * iw / ih if ih else w
+                    if y - h < 15*mm:
+                        c.showPage(); y = height - 20*mm
+                    c.drawImage(reader, x, y - h, width=w, height=h)
+                    newline(h + 4*mm)
+                    continue
+                except Exception:
+                    pass   # битая картинка — оставим текстовую пометку
+            line = "[image]"
+        # простейшая обрезка по ширине
+        while len(line) > 110:
+            c.drawString(x, y, line[:110])
+            line = line[110:]
+            newline()
+        c.drawString(x, y, line)
+        newline()
+    c.save()
+    return buf.getvalue()
+
+def _render(md_text: str, with_images: bool) -> bytes:
+    with metrics.span("report_pdf_images" if with_images else "report_pdf"):
+        return render_pdf(md_text, with_images)
+
+resources.registry.register(
+    "report_pool", lambda: ThreadPoolExecutor(max_workers=max(1, REPORT_WORKERS), thread_name_prefix="report"),
+    warm=False)
+
+def pdf_for(entry: Dict, query: str, fmt: str = "pdf") -> Future:
+    """Future с байтами PDF; рендер ставится в пул один раз на отчёт и формат."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown report format: {fmt}")
+    # ключ — то, из чего собран отчёт (в markdown ещё и время сборки, оно ключ бы не повторило)
+    key = hashlib.sha256(json.dumps([fmt, query, entry.get("summary") or "", [h.get("id") for h in entry.get("hits") or []]],
+                                    ensure_ascii=False).encode("utf-8")).hexdigest()
+    with _lock:
+        fut = _pdfs.get(key)
+        if fut is None or (fut.done() and fut.exception() is not None):   # после ошибки — можно повторить
+            fut = resources.registry.get("report_pool").submit(_render, markdown_for(entry, query), fmt == "pdf_images")
+            _pdfs[key] = fut
+        _pdfs.move_to_end(key)
+        while len(_pdfs) > max(1, REPORT_CACHE):
+            _pdfs.popitem(last=False)
+    return fut
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+rerank.py — разнообразие выдачи: склейка соседних чанков и MMR
+
+SentenceSplitter режет секцию с перекрытием 220 символов, поэтому в top-12 часто
+оказываются соседние чанки одной секции с почти одинаковым текстом — они съедают
+карточки выдачи и контекст LLM. retrieval.search_text берёт k × RERANK_OVERFETCH
+кандидатов вместе с их векторами (include=["embeddings"] — тем же запросом, что и
+тексты) и передаёт их в diversify():
+1) collapse_neighbours — идущие подряд chunk_index одной секции (18_0, 18_1, 18_2)
+   склеиваются в один хит, перекрытие текста вырезается;
+2) mmr — Maximal Marginal Relevance: score = λ·релевантность − (1 − λ)·max сходство
+   с уже выбранными. Матрица сходств кандидатов считается одним умножением,
+   шаг жадного выбора — векторная операция над массивом n кандидатов.
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+RERANK           = os.getenv("RERANK", "true").lower() == "true"
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "3"))     # кандидатов: k × 3
+MMR_LAMBDA       = float(os.getenv("MMR_LAMBDA", "0.7"))       # 1 — только релевантность, 0 — только разнообразие
+
+OVERLAP_PROBE = 60     # символов начала следующего чанка, которые ищем в хвосте предыдущего
+OVERLAP_MAX   = 600    # дальше от конца перекрытие не ищем (chunk_overlap=220 + запас на границы предложений)
+
+# ── Векторы кандидатов ─────────────────────────────────────────────────────────
+def attach_embeddings(collection, hits: List[Dict]) -> None:
+    """Хитам без "emb" (например, из кэша) дочитать векторы одним get(ids=…)."""
+    missing = [h["id"] for h in hits if h.get("emb") is None]
+    if not missing:
+        return
+    res = collection.get(ids=missing, include=["embeddings"])
+    embs = dict(zip(res["ids"], res["embeddings"] if res.get("embeddings") is not None else []))
+    for h in hits:
+        if h.get("emb") is None:
+            h["emb"] = embs.get(h["id"])
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+# ── Склейка соседних чанков ────────────────────────────────────────────────────
+def _chunk_pos(md: Dict) -> Optional[Tuple[Tuple, int]]:
+    """((файл, секция, номер секции), номер чанка) из chunk_index "<секция>_<чанк>"; key_findings — нет."""
+    sec, _, i = str(md.get("chunk_index") or "").rpartition("_")
+    if not (sec.isdigit() and i.isdigit()):
+        return None
+    return (md.get("filename"), md.get("section_path"), sec), int(i)
+
+def join_overlap(a: str, b: str) -> str:
+    """a + b без общего куска: хвост a, совпадающий с началом b, не повторяем."""
+    probe = b[:OVERLAP_PROBE]
+    if probe:
+        pos = a.find(probe, max(0, len(a) - OVERLAP_MAX))
+        while pos >= 0:
+            if b.startswith(a[pos:]):
+                return a + b[len(a) - pos:]
+            pos = a.find(probe, pos + 1)
+    return a.rstrip() + "\n" + b.lstrip()
+
+def collapse_neighbours(hits: List[Dict]) -> List[List[int]]:
+    """Группы индексов хитов: подряд идущие чанки одной секции — одна группа; порядок — по лучшему хиту."""
+    runs: Dict[Tuple, List[Tuple[int, int]]] = {}
+    groups: List[List[int]] = []
+    for rank, h in enumerate(hits):
+        pos = _chunk_pos(h.get("meta") or {})
+        if pos is None:
+            groups.append([rank])
+        else:
+            runs.setdefault(pos[0], []).append((pos[1], rank))
+    for members in runs.values():
+        members.sort()
+        run = [members[0]]
+        for prev, cur in zip(members, members[1:]):
+            if cur[0] == prev[0] + 1:
+                run.append(cur)
+            else:
+                groups.append([r for _, r in run])
+                run = [cur]
+        groups.append([r for _, r in run])   # внутри группы — порядок чанков в тексте
+    groups.sort(key=min)
+    return groups
+
+def _merge(hits: List[Dict], group: List[int]) -> Dict:
+    best = hits[min(group)]
+    if len(group) == 1:
+        return dict(best)
+    text = hits[group[0]].get("text") or ""
+    for r in group[1:]:
+        text = join_overlap(text, hits[r].get("text") or "")
+    first, last = (hits[r]["meta"]["chunk_index"] for r in (group[0], group[-1]))
+    return {**best, "text": text, "meta": {**best["meta"], "chunk_index": f"{first}–{last}"},
+            "merged_ids": [hits[r]["id"] for r in group]}
+
+# ── MMR ────────────────────────────────────────────────────────────────────────
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lam: float = MMR_LAMBDA) -> List[int]:
+    """Порядок выбора k из n кандидатов; vectors — единичные строки (n, d), relevance — в [0, 1]."""
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    sim = vectors @ vectors.T                      # (n, n) — одна матрица на все шаги
+    chosen = [int(np.argmax(relevance))]
+    max_sim = sim[:, chosen[0]].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[chosen[0]] = True
+    for _ in range(k - 1):
+        score = lam * relevance - (1.0 - lam) * max_sim
+        score[taken] = -np.inf
+        j = int(np.argmax(score))
+        chosen.append(j)
+        taken[j] = True
+        np.maximum(max_sim, sim[:, j], out=max_sim)
+    return chosen
+
+def _relevance(hits: List[Dict], vectors: np.ndarray, qvec: Optional[Sequence[float]]) -> np.ndarray:
+    """Слитый счёт RRF (гибрид) или косинус с запросом; min-max в [0, 1], чтобы λ сравнивал соизмеримое."""
+    if all(h.get("rrf") is not None for h in hits):
+        rel = np.array([h["rrf"] for h in hits], dtype=np.float32)
+    elif qvec is not None:
+        rel = vectors @ _unit_rows(np.asarray(qvec, dtype=np.float32)[None, :])[0]
+    else:
+        rel = -np.arange(len(hits), dtype=np.float32)   # только порядок
+    span = float(rel.max() - rel.min()) if len(rel) else 0.0
+    return (rel - rel.min()) / span if span > 0 else np.ones(len(rel), dtype=np.float32)
+
+def diversify(collection, hits: List[Dict], k: int, qvec: Optional[Sequence[float]] = None,
+              lam: float = MMR_LAMBDA) -> List[Dict]:
+    """Кандидаты (лучшие сверху) → не больше k хитов: соседи склеены, повторы смысла разнесены MMR."""
+    if not hits:
+        return []
+    attach_embeddings(collection, hits)
+    hits = [h for h in hits if h.get("emb") is not None]   # чанк удалён между поиском и get
+    if not hits:
+        return []
+    groups = collapse_neighbours(hits)
+    vectors = _unit_rows(np.asarray([h["emb"] for h in hits], dtype=np.float32))
+    group_vecs = _unit_rows(np.stack([vectors[g].mean(axis=0) for g in groups]))
+    rel = _relevance(hits, vectors, qvec)
+    group_rel = np.array([rel[g].max() for g in groups], dtype=np.float32)
+    out = []
+    for gi in mmr(group_rel, group_vecs, k, lam):
+        merged = _merge(hits, groups[gi])
+        merged.pop("emb", None)
+        out.append(merged)
+    return out
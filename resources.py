@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+resources.py — общий реестр тяжёлых ресурсов процесса (модели и клиенты Chroma)
+
+Зачем:
+- Streamlit перезапускает app.py целиком на каждое действие пользователя, а CLIP,
+  текстовый эмбеддер и PersistentClient грузятся секунды. Импортированные модули
+  при этом НЕ перезапускаются, поэтому реестр живёт здесь и переживает rerun'ы.
+- Ресурсы грузятся лениво и ровно один раз на процесс; загрузка защищена
+  отдельной блокировкой на каждый ключ, так что параллельные сессии ждут
+  одну загрузку, а не запускают свою.
+- warm_up() позволяет прогреть всё при старте (WARMUP_ON_START=true в .env).
+- stats() отдаёт время загрузки и прирост резидентной памяти по каждому ресурсу.
+"""
+
+import os
+import sys
+import time
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from manifest import read_generation
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+BASE_DIR = Path(__file__).resolve().parent
+DB_DIR   = str((BASE_DIR / "storage" / "chroma").resolve())
+VECTOR_DIR = str((BASE_DIR / "storage" / "vectors").resolve())
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()   # chroma | numpy (vector_store.py)
+
+LOCAL_ST_MODEL  = os.getenv("LOCAL_ST_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+CLIP_MODEL      = os.getenv("CLIP_MODEL", "clip-ViT-B-32")
+OFFLINE_ONLY    = os.getenv("OFFLINE_ONLY", "true").lower() == "true"
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "false").lower() == "true"
+
+TEXT_COLLECTION    = "ux_research"
+IMAGE_COLLECTION   = "ux_images"
+DOC_COLLECTION     = "ux_docs"        # вектор исследования: title + goal + key_findings (hierarchy.py)
+SECTION_COLLECTION = "ux_sections"    # центроид чанков секции (hierarchy.py)
+
+# ── Резидентная память процесса ────────────────────────────────────────────────
+def rss_bytes() -> Optional[int]:
+    """Текущий RSS процесса в байтах (psutil → /proc → None)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+# ── Реестр ─────────────────────────────────────────────────────────────────────
+class ResourceRegistry:
+    """
+    Ленивый потокобезопасный реестр: name → loader().
+    Значение создаётся при первом get(name) и дальше отдаётся из памяти.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._values: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._warm: Dict[str, bool] = {}
+        self._guard = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], warm: bool = True) -> None:
+        """warm=False — ресурс грузится только по требованию, warm_up() его пропускает."""
+        with self._guard:
+            if name not in self._loaders:
+                self._loaders[name] = loader
+                self._locks[name] = threading.Lock()
+                self._warm[name] = warm
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._values
+
+    def get(self, name: str) -> Any:
+        # быстрый путь без блокировок — ресурс уже загружен
+        if name in self._values:
+            return self._values[name]
+        with self._guard:
+            if name not in self._loaders:
+                raise KeyError(f"Ресурс не зарегистрирован: {name}")
+            lock = self._locks[name]
+        with lock:
+            if name in self._values:
+                return self._values[name]
+            rss0 = rss_bytes()
+            t0 = time.perf_counter()
+            value = self._loaders[name]()
+            load_s = time.perf_counter() - t0
+            rss1 = rss_bytes()
+            self._stats[name] = {
+                "name": name,
+                "load_s": round(load_s, 3),
+                "rss_mb": round((rss1 - rss0) / 2**20, 1) if rss0 is not None and rss1 is not None else None,
+                "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "thread": threading.current_thread().name,
+            }
+            self._values[name] = value
+            return value
+
+    def warm_up(self, names: Optional[Iterable[str]] = None, verbose: bool = False) -> List[Dict[str, Any]]:
+        """Грузит перечисленные (или все) ресурсы; ошибки не роняют процесс."""
+        targets = list(names) if names is not None else [n for n in self._loaders if self._warm.get(n)]
+        report = []
+        for name in targets:
+            try:
+                self.get(name)
+                row = dict(self._stats.get(name) or {"name": name})
+            except Exception as e:
+                row = {"name": name, "error": str(e)}
+            if verbose:
+                print(f"  warm-up {name}: {row}", file=sys.stderr)
+            report.append(row)
+        return report
+
+    def stats(self) -> List[Dict[str, Any]]:
+        rows = []
+        for name in self._loaders:
+            row = dict(self._stats.get(name) or {"name": name})
+            row["loaded"] = name in self._values
+            rows.append(row)
+        return rows
+
+    def set(self, name: str, value: Any) -> None:
+        """Подставить готовое значение (бенчмарки: временная коллекция, детерминированный эмбеддер)."""
+        with self._guard:
+            if name not in self._loaders:
+                self._loaders[name] = lambda: value
+                self._locks[name] = threading.Lock()
+                self._warm[name] = False
+            self._values[name] = value
+            self._stats[name] = {"name": name, "load_s": 0.0, "rss_mb": None,
+                                 "loaded_at": time.strftime("%Y-%m-%d %H:%M:%S"), "thread": "set"}
+
+    def drop(self, name: str) -> None:
+        """Выгрузить ресурс (например, после пересборки индекса — см. collection())."""
+        with self._guard:
+            self._values.pop(name, None)
+            self._stats.pop(name, None)
+
+registry = ResourceRegistry()
+
+# ── Стандартные ресурсы ────────────────────────────────────────────────────────
+def _load_text_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(LOCAL_ST_MODEL)
+
+def _load_clip_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(CLIP_MODEL)
+
+def _load_vector_client():
+    from vector_store import open_client   # chromadb импортируется, только если VECTOR_BACKEND=chroma
+    return open_client(VECTOR_BACKEND)
+
+registry.register("text_model", _load_text_model, warm=OFFLINE_ONLY)
+registry.register("clip_model", _load_clip_model)
+registry.register("vector_store", _load_vector_client)
+registry.register(f"collection:{TEXT_COLLECTION}",
+                  lambda: registry.get("vector_store").get_or_create_collection(TEXT_COLLECTION))
+registry.register(f"collection:{IMAGE_COLLECTION}",
+                  lambda: registry.get("vector_store").get_or_create_collection(IMAGE_COLLECTION))
+
+def text_model():
+    return registry.get("text_model")
+
+def clip_model():
+    return registry.get("clip_model")
+
+def vector_client():
+    """Клиент хранилища векторов: Chroma или vector_store.NumpyClient (VECTOR_BACKEND)."""
+    return registry.get("vector_store")
+
+_collection_gen: Dict[str, int] = {}
+
+def collection(name: str):
+    """
+    Хэндл коллекции привязан к поколению индекса (manifest.read_generation — один stat):
+    полная пересборка удаляет и создаёт коллекцию заново, и старый хэндл Chroma
+    отвечает NotFoundError. Поколение сменилось — хэндл выгружается и открывается снова.
+    """
+    key = f"collection:{name}"
+    registry.register(key, lambda: registry.get("vector_store").get_or_create_collection(name))
+    gen = int(read_generation().get("images" if name == IMAGE_COLLECTION else "text", 0))
+    if _collection_gen.setdefault(key, gen) != gen:
+        registry.drop(key)
+        _collection_gen[key] = gen
+    return registry.get(key)
+
+# ── Прогрев при старте ─────────────────────────────────────────────────────────
+_warmup_started = False
+_warmup_guard = threading.Lock()
+
+def warm_up_in_background(names: Optional[Iterable[str]] = None) -> bool:
+    """
+    Запускает прогрев в фоновом потоке один раз на процесс.
+    Возвращает True, если поток запущен именно этим вызовом.
+    """
+    global _warmup_started
+    with _warmup_guard:
+        if _warmup_started:
+            return False
+        _warmup_started = True
+    t = threading.Thread(target=registry.warm_up, args=(names,), name="resources-warmup", daemon=True)
+    t.start()
+    return True
+
+if __name__ == "__main__":
+    # python resources.py — прогреть всё и показать, сколько что стоит
+    for row in registry.warm_up(verbose=False):
+        print(row)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+result_cache.py — кэш результатов «запрос → хиты + свод + отчёт»
+
+Streamlit перезапускает app.py на любое действие (переключатель, скачивание отчёта,
+правка фильтра), и раньше каждый rerun заново шёл по всему конвейеру: эмбеддинг,
+query, своды (TF-IDF/TextRank или LLM), сборка отчёта. Здесь результат хранится
+по ключу (нормализованный запрос, фильтры, режим, поколение индекса).
+
+- Поколение индекса пишут build_index.py / build_images_index.py
+  (manifest.bump_generation) — после переиндексации старые записи просто
+  перестают совпадать по ключу и вытесняются LRU.
+- TTL (RESULT_CACHE_TTL_S) ограничивает жизнь записи, RESULT_CACHE_SIZE — число записей.
+- Значение — изменяемый dict: отчёт (report_md) можно дописать в запись позже.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+import resources
+from manifest import read_generation
+
+RESULT_CACHE_SIZE  = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL_S = float(os.getenv("RESULT_CACHE_TTL_S", "900"))
+
+def make_key(kind: str, **parts: Any) -> str:
+    """Стабильный ключ: kind + отсортированные части (JSON) + поколение индекса kind."""
+    payload = json.dumps({"kind": kind, "gen": read_generation().get(kind, 0), **parts},
+                         ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """Потокобезопасный LRU с TTL: key → dict."""
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl_s: float = RESULT_CACHE_TTL_S):
+        self.maxsize = max(1, maxsize)
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl_s > 0 and time.monotonic() - item[0] > self.ttl_s):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                value = None
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = item[1]
+        metrics.count("cache_requests_total", cache="result", result="miss" if value is None else "hit")
+        return value
+
+    def _peek(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl_s > 0 and time.monotonic() - item[0] > self.ttl_s):
+                return None
+            return item[1]
+
+    def put(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict],
+                       cacheable: Optional[Callable[[Dict], bool]] = None) -> Dict:
+        """
+        Одинаковые запросы из разных сессий считаются один раз (блокировка на ключ).
+        cacheable(значение) → False — значение отдаётся, но в кэш не кладётся (например, фолбэк LLM).
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            lock = self._key_locks.setdefault(key, threading.Lock())
+        with lock:
+            value = self._peek(key)   # пока ждали блокировку, мог посчитать другой поток
+            if value is None:
+                value = compute()
+                if cacheable is None or cacheable(value):
+                    self.put(key, value)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "ttl_s": self.ttl_s,
+                    "hits": self.hits, "misses": self.misses}
+
+resources.registry.register("result_cache", ResultCache)
+
+def get_result_cache() -> ResultCache:
+    return resources.registry.get("result_cache")
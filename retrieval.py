@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+retrieval.py — поиск по чанкам ux_research: векторный + лексический (BM25), слияние RRF
+
+search_text(q, k, where, pred):
+1) векторный поиск (embeddings.py → Chroma с where/адаптивным добором, filters.py);
+2) параллельно — BM25 по ./storage/bm25 (bm25.py); найденные id дочитываются из Chroma
+   одним get(ids=..., where=...) — так фильтры действуют и на лексическую ветку;
+3) reciprocal-rank fusion: score = Σ 1 / (RRF_K + rank) по обоим спискам;
+4) RERANK=true — кандидатов берётся k × RERANK_OVERFETCH вместе с векторами,
+   rerank.diversify склеивает соседние чанки секции и разносит повторы MMR.
+5) на большом корпусе (hierarchy.py) векторная ветка ищет не по всем чанкам, а только
+   в лучших секциях лучших исследований: ux_docs → ux_sections → ux_research.
+Если BM25-индекса нет (старый индекс) или HYBRID_SEARCH=false — только векторы.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import hierarchy
+import metrics
+import resources
+from bm25 import BM25Index
+from embeddings import get_text_embedder
+from filters import query_filtered
+from rerank import RERANK, RERANK_OVERFETCH, diversify
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+BM25_DIR      = resources.BASE_DIR / "storage" / "bm25"
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+RRF_K         = 60      # сглаживание RRF (стандартное значение из литературы)
+LEX_OVERFETCH = 3       # лексических кандидатов: k × 3 (часть отсеют фильтры)
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+# ── BM25: открываем один раз, переоткрываем после пересборки ───────────────────
+_bm25_lock = threading.Lock()
+_bm25_state: Dict[str, object] = {"mtime": None, "index": None}
+
+def bm25_index() -> Optional[BM25Index]:
+    meta = BM25_DIR / "meta.json"
+    try:
+        mtime = meta.stat().st_mtime
+    except OSError:
+        return None
+    if _bm25_state["mtime"] != mtime:
+        with _bm25_lock:
+            if _bm25_state["mtime"] != mtime:
+                _bm25_state["index"] = BM25Index.open(BM25_DIR)
+                _bm25_state["mtime"] = mtime
+    return _bm25_state["index"]
+
+# ── Ветки поиска ───────────────────────────────────────────────────────────────
+def _vector_hits(collection, qvec: List[float], k: int, where, pred, with_emb: bool = False) -> List[Dict]:
+    # фильтры исполняет Chroma (where); остаток — с адаптивным добором до k
+    include = ["documents", "metadatas", "distances"] + (["embeddings"] if with_emb else [])
+    with metrics.span("chroma_query"):
+        res = query_filtered(collection, qvec, k, where=where, pred=pred, include=include)
+    hits = []
+    for i in range(len(res["documents"])):
+        hits.append({
+            "id": res["ids"][i],
+            "text": res["documents"][i],
+            "meta": res["metadatas"][i],
+            "dist": res["distances"][i] if res.get("distances") else None,
+        })
+        if with_emb:
+            hits[-1]["emb"] = res["embeddings"][i]
+    return hits
+
+def _lexical_hits(collection, index: BM25Index, q: str, k: int, where, pred, with_emb: bool = False) -> List[Dict]:
+    with metrics.span("bm25"):
+        ranked = index.search(q, k * LEX_OVERFETCH)
+    if not ranked:
+        return []
+    include = ["documents", "metadatas"] + (["embeddings"] if with_emb else [])
+    kwargs = {"ids": [cid for cid, _ in ranked], "include": include}
+    if where:
+        kwargs["where"] = where
+    with metrics.span("chroma_get"):
+        res = collection.get(**kwargs)
+    embs = res["embeddings"] if with_emb else [None] * len(res["ids"])
+    rows = {cid: (doc, md, emb) for cid, doc, md, emb in zip(res["ids"], res["documents"], res["metadatas"], embs)}
+    hits = []
+    for cid, score in ranked:
+        if cid not in rows:
+            continue  # отсеяно where (или чанк удалён после сборки BM25)
+        doc, md, emb = rows[cid]
+        if pred is not None and not pred(md or {}):
+            continue
+        hits.append({"id": cid, "text": doc, "meta": md, "dist": None, "bm25": score})
+        if with_emb:
+            hits[-1]["emb"] = emb
+        if len(hits) >= k:
+            break
+    return hits
+
+def rrf_merge(rankings: List[List[Dict]], k: int, rrf_k: int = RRF_K) -> List[Dict]:
+    """Reciprocal-rank fusion списков хитов (ключ — id); поля хита берутся из первого списка, где он есть."""
+    scores: Dict[str, float] = {}
+    first: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (rrf_k + rank)
+            if hit["id"] in first:
+                first[hit["id"]].update({key: v for key, v in hit.items() if first[hit["id"]].get(key) is None})
+            else:
+                first[hit["id"]] = dict(hit)
+    order = sorted(scores, key=lambda cid: scores[cid], reverse=True)[:k]
+    return [{**first[cid], "rrf": scores[cid]} for cid in order]
+
+# ── Публичный поиск ────────────────────────────────────────────────────────────
+def search_text(q: str, k: int = 12, where: Optional[Dict] = None,
+                pred: Optional[Callable[[Dict], bool]] = None, hybrid: bool = HYBRID_SEARCH,
+                rerank: bool = RERANK, hierarchical: Optional[bool] = None) -> List[Dict]:
+    """
+    Хиты: {"id", "text", "meta", "dist"[, "bm25", "rrf", "merged_ids"]} — лучшие сверху.
+    hierarchical=None — по HIER_SEARCH (hierarchy.enabled()).
+    """
+    collection = resources.collection(resources.TEXT_COLLECTION)
+    index = bm25_index() if hybrid else None
+    # добор для MMR — только у векторной ветки: get по id в Chroma дорожает с числом id,
+    # а лексическая ветка и так даёт k кандидатов из k × LEX_OVERFETCH
+    n = k * RERANK_OVERFETCH if rerank else k
+    lex = None
+    if index is not None:
+        lex = _executor.submit(metrics.in_context(_lexical_hits), collection, index, q, k, where, pred, rerank)
+    # вектор запроса — из общего эмбеддера с LRU (повторный запрос модель не трогает)
+    with metrics.span("embed_query"):
+        qvec = get_text_embedder().embed_query(q)
+    chunk_where = where
+    if hierarchy.enabled() if hierarchical is None else hierarchical:
+        chunk_where = hierarchy.narrow(qvec, where, pred) or where
+    hits = _vector_hits(collection, qvec, n, chunk_where, pred, rerank)
+    if lex is not None:
+        hits = rrf_merge([hits, lex.result()], n)
+    if rerank:
+        with metrics.span("rerank"):
+            hits = diversify(collection, hits, k, qvec=qvec)
+    return hits
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+section_images.py — превью картинок для карточек без meta['images']
+
+build_index.py при индексации раскладывает картинки Markdown по секциям и пишет
+./storage/section_images.json: {filename: {section_path: [пути], "*": [все картинки файла]}}.
+Здесь карта читается один раз (перечитывается, только если файл изменился),
+а карточка получает картинки своей секции словарным поиском — без чтения исходного .md.
+"""
+
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import resources
+
+SECTION_IMAGES_PATH = resources.BASE_DIR / "storage" / "section_images.json"
+FILE_IMAGES_KEY     = "*"      # тот же ключ, что в build_index.py
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {"mtime": None, "lookup": {}}
+
+def lookup() -> Dict[str, Dict[str, List[str]]]:
+    """Вся карта filename → section_path → картинки (пустая, если индекс ещё не собран)."""
+    try:
+        mtime = SECTION_IMAGES_PATH.stat().st_mtime
+    except OSError:
+        return {}
+    if _state["mtime"] != mtime:
+        with _lock:
+            if _state["mtime"] != mtime:
+                try:
+                    data = json.loads(SECTION_IMAGES_PATH.read_text(encoding="utf-8"))
+                except Exception:
+                    data = {}
+                _state.update(mtime=mtime, lookup=data if isinstance(data, dict) else {})
+    return _state["lookup"]
+
+def images_for(meta: Optional[Dict], max_count: int = 3) -> List[Tuple[str, None]]:
+    """Картинки секции чанка, а если в секции их нет — первые картинки файла; пары (path, alt=None)."""
+    meta = meta or {}
+    by_section = lookup().get(meta.get("filename") or "")
+    if not by_section:
+        return []
+    found = by_section.get(meta.get("section_path") or "") or by_section.get(FILE_IMAGES_KEY) or []
+    return [(p, None) for p in found[:max_count]]
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+sentence_index.py — предложения чанков и их TF-IDF, посчитанные при индексации
+
+Офлайн-своды (summarize.py) раньше на каждый запрос заново резали top-хиты на
+предложения, токенизировали их, строили словарь и TF-IDF — одну и ту же работу для
+одних и тех же чанков. build_index.py теперь делает это один раз (build()), а на
+запросе SentenceIndex.gather() только собирает готовые строки по chunk id, и
+остаётся TextRank.
+
+Токенизация и нарезка — те же summarize._tokenize / _sent_split; IDF — по всем
+предложениям корпуса, а не по двум десяткам предложений выдачи.
+
+Формат на диске (./storage/sentences/, .npy через mmap, как у bm25.py):
+- ids.npy        — U*, chunk id по номеру;
+- chunk_sent.npy — int64[N+1], границы предложений чанка;
+- sents.bin      — тексты предложений (UTF-8 подряд), sents_off.npy — int64[S+1] границы;
+- ntok.npy       — int32[S], число токенов предложения (фильтр коротких);
+- indptr.npy / indices.npy / data.npy — CSR-строки TF-IDF (L2-нормированы, float32),
+  indices — номера термов (token ids) в terms.npy;
+- terms.npy      — отсортированный словарь (поиск терма запроса — searchsorted), idf.npy;
+- meta.json      — размеры и версия.
+"""
+
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+import resources
+from summarize import _sent_split, _tokenize
+
+SENTENCES_VERSION = 1
+SENTENCES_DIR     = resources.BASE_DIR / "storage" / "sentences"
+
+# ── Сборка ─────────────────────────────────────────────────────────────────────
+def build(chunks: Iterable[Tuple[str, str]], out_dir: Path) -> dict:
+    """chunks — поток (chunk_id, text). Запись атомарная: во временную папку и rename."""
+    t0 = time.perf_counter()
+    vocab: Dict[str, int] = {}
+    ids: List[str] = []
+    chunk_sent = [0]
+    blob = bytearray()
+    sent_off = [0]
+    ntok: List[int] = []
+    indptr = [0]
+    parts_t, parts_f = [], []
+    for cid, text in chunks:
+        ids.append(cid)
+        for s in _sent_split(text or ""):
+            toks = _tokenize(s)
+            blob += s.encode("utf-8")
+            sent_off.append(len(blob))
+            ntok.append(len(toks))
+            if toks:
+                tids, counts = np.unique(np.fromiter((vocab.setdefault(t, len(vocab)) for t in toks),
+                                                     dtype=np.int64), return_counts=True)
+                parts_t.append(tids.astype(np.int32))
+                parts_f.append(counts.astype(np.float32))
+            indptr.append(indptr[-1] + (len(tids) if toks else 0))
+        chunk_sent.append(len(ntok))
+
+    n_sents, v = len(ntok), len(vocab)
+    term_ids = np.concatenate(parts_t) if parts_t else np.zeros(0, np.int32)
+    tf = np.concatenate(parts_f) if parts_f else np.zeros(0, np.float32)
+    # термы — в алфавитном порядке, как в bm25.py
+    terms_unsorted = np.array(list(vocab.keys()) or [""], dtype=str)[:v]
+    alpha = np.argsort(terms_unsorted, kind="stable")
+    rank = np.empty(v, dtype=np.int32)
+    rank[alpha] = np.arange(v, dtype=np.int32)
+    term_ids = rank[term_ids] if len(term_ids) else term_ids
+    # IDF — та же формула, что у summarize._build_tfidf, но по всему корпусу
+    df = np.bincount(term_ids, minlength=v)
+    idf = (np.log((1.0 + n_sents) / (1.0 + df)) + 1.0).astype(np.float32)
+    x = sp.csr_matrix((tf * idf[term_ids], term_ids, np.asarray(indptr, dtype=np.int64)), shape=(n_sents, v))
+    x.sort_indices()
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    x = (sp.diags(1.0 / norms) @ x).tocsr().astype(np.float32)
+
+    out_dir = Path(out_dir)
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    np.save(tmp / "ids.npy", np.asarray(ids or [""], dtype=str)[:len(ids)])
+    np.save(tmp / "chunk_sent.npy", np.asarray(chunk_sent, dtype=np.int64))
+    (tmp / "sents.bin").write_bytes(bytes(blob))
+    np.save(tmp / "sents_off.npy", np.asarray(sent_off, dtype=np.int64))
+    np.save(tmp / "ntok.npy", np.asarray(ntok, dtype=np.int32))
+    np.save(tmp / "indptr.npy", x.indptr.astype(np.int64))
+    np.save(tmp / "indices.npy", x.indices.astype(np.int32))
+    np.save(tmp / "data.npy", x.data.astype(np.float32))
+    np.save(tmp / "terms.npy", terms_unsorted[alpha])
+    np.save(tmp / "idf.npy", idf[alpha])
+    meta = {"version": SENTENCES_VERSION, "n_chunks": len(ids), "n_sents": n_sents, "n_terms": v,
+            "nnz": int(x.nnz), "bytes_text": len(blob)}
+    (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    if out_dir.exists():
+        old = out_dir.with_name(out_dir.name + ".old")
+        if old.exists():
+            _rmtree(old)
+        out_dir.rename(old)
+        tmp.rename(out_dir)
+        _rmtree(old)
+    else:
+        tmp.rename(out_dir)
+    meta["build_s"] = round(time.perf_counter() - t0, 3)
+    return meta
+
+def _rmtree(p: Path) -> None:
+    for f in p.iterdir():
+        f.unlink()
+    p.rmdir()
+
+# ── Чтение ─────────────────────────────────────────────────────────────────────
+class SentenceIndex:
+    """Открытый через mmap индекс предложений; gather() — строки TF-IDF для найденных чанков."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        if self.meta.get("version") != SENTENCES_VERSION:
+            raise ValueError(f"sentences: версия {self.meta.get('version')}, нужна {SENTENCES_VERSION}")
+        load = lambda name: np.load(self.path / name, mmap_mode="r")
+        self.ids, self.chunk_sent = load("ids.npy"), load("chunk_sent.npy")
+        self.sents_off, self.ntok = load("sents_off.npy"), load("ntok.npy")
+        self.indptr, self.indices, self.data = load("indptr.npy"), load("indices.npy"), load("data.npy")
+        self.terms, self.idf = load("terms.npy"), load("idf.npy")
+        self.blob = np.memmap(self.path / "sents.bin", dtype=np.uint8, mode="r") if self.meta["bytes_text"] else b""
+        self.n, self.n_terms = int(self.meta["n_chunks"]), int(self.meta["n_terms"])
+        self._row = {str(cid): i for i, cid in enumerate(self.ids[: self.n])}
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["SentenceIndex"]:
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def chunk_sentences(self, row: int) -> Tuple[int, List[str]]:
+        """(номер первого предложения, тексты) чанка — одно чтение байтов чанка и нарезка по границам."""
+        lo, hi = int(self.chunk_sent[row]), int(self.chunk_sent[row + 1])
+        off = self.sents_off[lo:hi + 1].tolist()
+        raw = bytes(self.blob[off[0]:off[-1]]) if hi > lo else b""
+        return lo, [raw[a - off[0]:b - off[0]].decode("utf-8") for a, b in zip(off, off[1:])]
+
+    def _rows(self, sent_ids: np.ndarray) -> sp.csr_matrix:
+        starts, ends = self.indptr[sent_ids], self.indptr[sent_ids + 1]
+        lens = (ends - starts).astype(np.int64)
+        indptr = np.zeros(len(sent_ids) + 1, dtype=np.int64)
+        np.cumsum(lens, out=indptr[1:])
+        # позиции нужных элементов CSR без цикла: начало строки + сдвиг внутри неё
+        take = np.repeat(starts - indptr[:-1], lens) + np.arange(indptr[-1], dtype=np.int64)
+        return sp.csr_matrix((np.asarray(self.data[take]), np.asarray(self.indices[take]), indptr),
+                             shape=(len(sent_ids), self.n_terms))
+
+    def gather(self, hits: Sequence[Dict], rows: bool = True
+               ) -> Optional[Tuple[List[str], np.ndarray, Optional[sp.csr_matrix]]]:
+        """
+        (предложения, число токенов, строки TF-IDF или None при rows=False) хитов по порядку;
+        склеенный rerank.py хит — все его чанки, повтор предложения из перекрытия соседних
+        чанков — один раз. None — какого-то чанка нет в индексе (собран до переиндексации):
+        считайте на лету.
+        """
+        picked: List[int] = []
+        texts: List[str] = []
+        seen = set()
+        for h in hits:
+            for cid in h.get("merged_ids") or [h["id"]]:
+                row = self._row.get(cid)
+                if row is None:
+                    return None
+                first, sents = self.chunk_sentences(row)
+                for i, s in enumerate(sents, first):
+                    if s not in seen:
+                        seen.add(s)
+                        picked.append(i)
+                        texts.append(s)
+        sent_ids = np.asarray(picked, dtype=np.int64)
+        return (texts, np.asarray(self.ntok[sent_ids], dtype=np.int32),
+                self._rows(sent_ids) if rows else None)
+
+    def vectorize(self, token_lists: Sequence[Sequence[str]]) -> sp.csr_matrix:
+        """Строки TF-IDF для текста не из корпуса (запрос) — по словарю и IDF индекса; новые слова не учитываются."""
+        indptr, indices, data = [0], [], []
+        for toks in token_lists:
+            pos = np.searchsorted(self.terms, toks) if toks else np.zeros(0, np.int64)
+            known = [(int(p), t) for p, t in zip(pos, toks) if p < len(self.terms) and self.terms[p] == t]
+            tids, counts = (np.unique([p for p, _ in known], return_counts=True) if known
+                            else (np.zeros(0, np.int64), np.zeros(0, np.int64)))
+            row = counts * np.asarray(self.idf[tids], dtype=np.float64)
+            norm = float(np.linalg.norm(row)) or 1.0
+            indices.extend(tids.tolist())
+            data.extend((row / norm).tolist())
+            indptr.append(len(indices))
+        return sp.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int64),
+                              np.asarray(indptr, dtype=np.int64)), shape=(len(token_lists), self.n_terms))
+
+# ── Открываем один раз, переоткрываем после пересборки ─────────────────────────
+_lock = threading.Lock()
+_state: Dict[str, object] = {"mtime": None, "index": None}
+
+def sentence_index(path: Path = SENTENCES_DIR) -> Optional[SentenceIndex]:
+    meta = Path(path) / "meta.json"
+    try:
+        mtime = meta.stat().st_mtime
+    except OSError:
+        return None
+    if _state["mtime"] != mtime:
+        with _lock:
+            if _state["mtime"] != mtime:
+                _state["index"] = SentenceIndex.open(path)
+                _state["mtime"] = mtime
+    return _state["index"]
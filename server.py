@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+server.py — асинхронный HTTP-бэкенд поиска для app-ui (aiohttp)
+
+Контракты — app-ui/lib/schemas.ts:
+- POST /api/search        SearchRequest  → SearchResponse (+ answerId, threadId);
+- GET  /api/answers/{id}  → AnswerResponse (ответы хранятся в памяти, LRU);
+- POST /api/followup      FollowupRequest → FollowupResponse (уточнение в рамках треда);
+- GET  /api/health        — состояние ресурсов и очереди;
+- GET  /metrics           — тайминги стадий и счётчики в формате Prometheus (metrics.py);
+- GET  /assets/...        — картинки из 03_assets (пути в images[].path указывают сюда).
+
+Модели и Chroma — блокирующие вызовы: они идут в ограниченный пул потоков
+(SERVER_WORKERS), а событийный цикл только принимает запросы и отдаёт JSON.
+Если в очереди уже SERVER_MAX_PENDING задач, новый запрос сразу получает 503,
+а не копится без предела. Ресурсы (resources.py) общие на процесс и
+прогреваются в фоне при старте.
+
+Запуск: python server.py [--host 127.0.0.1] [--port 8000]
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+load_dotenv()
+
+import rag
+import batching
+import metrics
+import resources
+from asset_index import ASSETS_DIR, resolve_image_path
+from manifest import read_generation
+from answer_cache import get_answer_cache
+from result_cache import get_result_cache
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+SERVER_HOST        = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT        = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS     = int(os.getenv("SERVER_WORKERS", "4"))        # потоков на модели/Chroma
+SERVER_MAX_PENDING = int(os.getenv("SERVER_MAX_PENDING", "64"))   # задач в работе + в очереди
+ANSWER_STORE_SIZE  = int(os.getenv("ANSWER_STORE_SIZE", "1000"))  # ответов/тредов в памяти
+
+TOP_K        = 12
+QUOTES_SHOWN = 6
+IMAGES_SHOWN = 12
+
+class Busy(Exception):
+    """Очередь блокирующих задач заполнена."""
+
+# ── Пул для блокирующих вызовов ────────────────────────────────────────────────
+class BlockingPool:
+    """ThreadPoolExecutor + счётчик задач: сверх max_pending — отказ, а не бесконечная очередь."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="rag")
+        self.workers, self.max_pending = max(1, workers), max(1, max_pending)
+        self.pending = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self.pending >= self.max_pending:
+            raise Busy()
+        self.pending += 1   # счётчик трогает только событийный цикл — блокировка не нужна
+        try:
+            # копия контекста — стадии из потока пула попадут в trace запроса (Server-Timing)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, metrics.in_context(fn), *args)
+        finally:
+            self.pending -= 1
+
+class LRUStore:
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._data: "OrderedDict[str, Dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Dict) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+# ── Хиты → контракт app-ui ─────────────────────────────────────────────────────
+def _str(v: Any) -> str:
+    return "" if v is None else str(v)
+
+def asset_url(p: str) -> Optional[str]:
+    """Путь к картинке → URL, по которому её отдаёт этот сервер (или None, если файла нет)."""
+    resolved, exists = resolve_image_path(p)
+    if not exists:
+        return None
+    if resolved.startswith("http://") or resolved.startswith("https://"):
+        return resolved
+    try:
+        rel = Path(resolved).resolve().relative_to(ASSETS_DIR)
+    except ValueError:
+        return None   # вне 03_assets наружу не отдаём
+    return "/assets/" + rel.as_posix()
+
+def to_quote(hit: Dict) -> Dict:
+    md = hit.get("meta") or {}
+    quote = {
+        "id": _str(hit.get("id")),
+        "text": (hit.get("text") or "").strip(),
+        "metadata": {
+            "id": _str(md.get("id")), "title": _str(md.get("title")),
+            "iteration": _str(md.get("iteration")), "date": _str(md.get("date")),
+            "filename": _str(md.get("filename")), "section_path": _str(md.get("section_path")),
+            "chunk_index": _str(md.get("chunk_index")), "product": _str(md.get("product")),
+        },
+    }
+    if hit.get("dist") is not None:
+        quote["distance"] = float(hit["dist"])
+    return quote
+
+def to_sources(hits: List[Dict]) -> List[Dict]:
+    seen, out = set(), []
+    for h in hits:
+        md = h.get("meta") or {}
+        sid = _str(md.get("id") or md.get("filename"))
+        if sid and sid not in seen:
+            seen.add(sid)
+            out.append({"id": sid, "title": _str(md.get("title")),
+                        "date": _str(md.get("date")), "iteration": _str(md.get("iteration"))})
+    return out
+
+def to_images(hits: List[Dict]) -> List[Dict]:
+    seen, out = set(), []
+    for h in hits:
+        md = h.get("meta") or {}
+        for p, alt in rag.hit_images(md, max_count=3):
+            url = asset_url(p)
+            if url and url not in seen:
+                seen.add(url)
+                item = {"path": url, "source_id": _str(md.get("id") or md.get("filename"))}
+                if alt:
+                    item["alt"] = alt
+                out.append(item)
+    return out[:IMAGES_SHOWN]
+
+# ── Блокирующая часть запросов (идёт в пул) ────────────────────────────────────
+def text_answer(query: str, filters: Dict, offline: bool, summary_query: Optional[str] = None) -> Dict:
+    res = rag.answer(query, filters.get("iteration") or "", filters.get("scenario") or "",
+                     filters.get("date") or "", filters.get("product") or "",
+                     offline=offline, k=TOP_K, summary_query=summary_query)
+    hits, has_filters = res["hits"], res["has_filters"]
+    summary = res["llm"] or res["summary"]
+    if not hits:
+        summary = ("По заданным фильтрам ничего не нашлось — ослабьте фильтры." if has_filters
+                   else "Ничего не нашлось. Попробуйте переформулировать запрос.")
+    elif not summary:
+        summary = "Недостаточно контекста для свода. Попробуйте уточнить запрос."
+    shown = hits[:QUOTES_SHOWN]
+    return {"summary": summary, "quotes": [to_quote(h) for h in shown],
+            "sources": to_sources(shown), "images": to_images(shown)}
+
+def image_answer(file_ids: List[str]) -> Dict:
+    """fileIds — пути/имена файлов из 03_assets: ищем похожие макеты по каждому и сливаем."""
+    best: Dict[str, Dict] = {}
+    for fid in file_ids:
+        resolved, exists = resolve_image_path(fid)
+        if not exists or resolved.startswith("http"):
+            raise web.HTTPBadRequest(text=f"Файл не найден в 03_assets: {fid}")
+        data = Path(resolved).read_bytes()
+        for h in rag.search_images(data, k=TOP_K):
+            prev = best.get(h["id"])
+            if prev is None or (h["dist"] is not None and (prev["dist"] is None or h["dist"] < prev["dist"])):
+                best[h["id"]] = h
+    hits = sorted(best.values(), key=lambda h: (h["dist"] is None, h["dist"] or 0.0))
+    images = []
+    for h in hits:
+        url = asset_url(h.get("rel") or h.get("path") or "")
+        if url:
+            images.append({"path": url, "alt": _str(h.get("name")), "source_id": Path(_str(h.get("name"))).stem})
+    images = images[:IMAGES_SHOWN]
+    summary = (f"Похожих макетов: {len(images)}." if images else
+               "Ничего похожего не нашлось. Убедись, что индекс изображений собран (`build_images_index.py`).")
+    return {"summary": summary, "quotes": [], "sources": [], "images": images}
+
+# ── Валидация (повторяет zod-схемы app-ui) ─────────────────────────────────────
+def _bad(details: str) -> web.Response:
+    return web.json_response({"error": "Invalid request", "details": details}, status=400)
+
+def _opt_str(body: Dict, key: str) -> bool:
+    return body.get(key) is None or isinstance(body.get(key), str)
+
+def validate_search(body: Any) -> Optional[str]:
+    if not isinstance(body, dict):
+        return "body must be an object"
+    if body.get("mode") not in ("online", "offline"):
+        return "mode: expected 'online' | 'offline'"
+    if body.get("queryType") not in ("text", "image"):
+        return "queryType: expected 'text' | 'image'"
+    if not _opt_str(body, "query"):
+        return "query: expected string"
+    ids = body.get("fileIds")
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(x, str) for x in ids)):
+        return "fileIds: expected string[]"
+    filters = body.get("filters")
+    if filters is not None:
+        if not isinstance(filters, dict):
+            return "filters: expected object"
+        for key in ("iteration", "scenario", "date", "product"):
+            if not _opt_str(filters, key):
+                return f"filters.{key}: expected string"
+    if body["queryType"] == "text" and not (body.get("query") or "").strip():
+        return "query: required for queryType 'text'"
+    if body["queryType"] == "image" and not ids:
+        return "fileIds: required for queryType 'image'"
+    return None
+
+async def _json_body(request: web.Request) -> Any:
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+# ── Обработчики ────────────────────────────────────────────────────────────────
+POOL    = web.AppKey("pool", BlockingPool)
+ANSWERS = web.AppKey("answers", LRUStore)
+THREADS = web.AppKey("threads", LRUStore)
+
+def _store_answer(app: web.Application, resp: Dict, mode: str) -> str:
+    answer_id = uuid.uuid4().hex
+    app[ANSWERS].put(answer_id, {**resp, "id": answer_id, "mode": mode,
+                                 "createdAt": datetime.now(timezone.utc).isoformat()})
+    return answer_id
+
+async def handle_search(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    err = validate_search(body)
+    if err:
+        return _bad(err)
+    mode = body["mode"]
+    filters = body.get("filters") or {}
+    pool = request.app[POOL]
+    if body["queryType"] == "image":
+        resp = await pool.run(image_answer, body["fileIds"])
+        return web.json_response({**resp, "answerId": _store_answer(request.app, resp, mode)})
+
+    query = body["query"].strip()
+    resp = await pool.run(text_answer, query, filters, mode == "offline")
+    thread_id = uuid.uuid4().hex
+    request.app[THREADS].put(thread_id, {"query": query, "filters": filters, "mode": mode, "history": [query]})
+    return web.json_response({**resp, "answerId": _store_answer(request.app, resp, mode), "threadId": thread_id})
+
+async def handle_answer(request: web.Request) -> web.Response:
+    answer = request.app[ANSWERS].get(request.match_info["id"])
+    if answer is None:
+        return web.json_response({"error": "Not found"}, status=404)
+    return web.json_response(answer)
+
+async def handle_followup(request: web.Request) -> web.Response:
+    body = await _json_body(request)
+    if not isinstance(body, dict) or not isinstance(body.get("threadId"), str) \
+            or not isinstance(body.get("query"), str) or not body["query"].strip():
+        return _bad("expected {threadId: string, query: string}")
+    thread = request.app[THREADS].get(body["threadId"])
+    if thread is None:
+        return web.json_response({"error": "Thread not found"}, status=404)
+    query = body["query"].strip()
+    # ищем по исходному вопросу + уточнению (с фильтрами треда), свод — по уточнению
+    resp = await request.app[POOL].run(text_answer, f"{thread['query']}. {query}", thread["filters"],
+                                       thread["mode"] == "offline", query)
+    thread["history"].append(query)
+    answer_id = _store_answer(request.app, resp, thread["mode"])
+    return web.json_response({**resp, "threadId": body["threadId"], "answerId": answer_id})
+
+async def handle_health(request: web.Request) -> web.Response:
+    pool = request.app[POOL]
+    return web.json_response({
+        "ok": True, "pending": pool.pending, "workers": pool.workers, "max_pending": pool.max_pending,
+        "answers": len(request.app[ANSWERS]), "threads": len(request.app[THREADS]),
+        "resources": resources.registry.stats(),
+        "embed_batching": batching.all_stats(),
+        "result_cache": get_result_cache().stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "index_generation": read_generation(),
+        "stages": metrics.stage_stats(),
+        "counters": metrics.counter_stats(),
+    })
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=metrics.render_prometheus(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+@web.middleware
+async def errors_middleware(request: web.Request, handler):
+    t0 = time.perf_counter()
+    with metrics.trace() as tr:
+        resp = await _handle(request, handler)
+    # разбор по стадиям (embed_query, chroma_query, bm25, textrank, …) — виден в DevTools
+    resp.headers["Server-Timing"] = (tr.server_timing() if tr is not None
+                                     else f"total;dur={(time.perf_counter() - t0) * 1000:.1f}")
+    return resp
+
+async def _handle(request: web.Request, handler) -> web.StreamResponse:
+    try:
+        resp = await handler(request)
+    except Busy:
+        resp = web.json_response({"error": "Server busy, retry later"}, status=503, headers={"Retry-After": "1"})
+    except web.HTTPException as e:
+        if e.status < 400:
+            raise
+        resp = web.json_response({"error": e.text or e.reason}, status=e.status)
+    except Exception as e:
+        print(f"[server] {request.method} {request.path}: {e!r}")
+        resp = web.json_response({"error": "Internal server error"}, status=500)
+    return resp
+
+async def _on_startup(app: web.Application) -> None:
+    # сервер живёт долго — модели грузим сразу в фоне, а не на первом запросе
+    resources.warm_up_in_background()
+    metrics.start_file_exporter()
+
+async def _on_cleanup(app: web.Application) -> None:
+    app[POOL].executor.shutdown(wait=False, cancel_futures=True)
+
+def create_app(workers: int = SERVER_WORKERS, max_pending: int = SERVER_MAX_PENDING) -> web.Application:
+    app = web.Application(middlewares=[errors_middleware], client_max_size=1 * 2**20)
+    app[POOL] = BlockingPool(workers, max_pending)
+    app[ANSWERS] = LRUStore(ANSWER_STORE_SIZE)
+    app[THREADS] = LRUStore(ANSWER_STORE_SIZE)
+    app.router.add_post("/api/search", handle_search)
+    app.router.add_get("/api/answers/{id}", handle_answer)
+    app.router.add_post("/api/followup", handle_followup)
+    app.router.add_get("/api/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    if ASSETS_DIR.is_dir():
+        app.router.add_static("/assets/", ASSETS_DIR)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="HTTP-бэкенд поиска для app-ui.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="потоков на модели/Chroma")
+    args = parser.parse_args(argv)
+    web.run_app(create_app(args.workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
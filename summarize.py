@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+summarize.py — офлайн-своды по найденным фрагментам (без LLM)
+
+- offline_summary — простой экстрактивный свод по ключевым словам.
+- summarize_tfidf_textrank — TF-IDF + TextRank на NumPy/SciPy:
+  разреженная матрица TF-IDF (CSR), косинусы одним произведением X·Xᵀ,
+  PageRank — матрично-векторными умножениями. Ранжирование то же, что у прежней
+  реализации на списках (см. bench/bench_textrank.py), но без O(n²·V) циклов.
+- index (sentence_index.SentenceIndex) — предложения и строки TF-IDF чанков, готовые
+  с индексации: на запросе остаётся собрать строки по chunk id и TextRank.
+  Без индекса (или если чанка в нём нет) всё считается по тексту хитов, как раньше.
+"""
+
+import re
+import heapq
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+# ── Токенизация (регэкспы и стоп-слова собираем один раз) ──────────────────────
+_NON_WORD_RE = re.compile(r"[^a-zа-я0-9ё\- ]+")
+_SENT_RE     = re.compile(r"(?<=[.!?])\s+")
+
+# русские/английские стоп-слова (минимальный набор)
+STOP_WORDS = frozenset("""
+    и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было
+    вот от меня еще нет о из ли же до ни кто это того потому этот какой где когда здесь там него нее них
+    при чем раз два три или либо также также-то чтобы для без про над под между около
+    the a an to of is are was were be been being this that these those and or not from by as with into onto about
+""".split())
+
+def _tokenize(text: str) -> List[str]:
+    text = _NON_WORD_RE.sub(" ", text.lower())
+    return [t for t in text.split() if t and t not in STOP_WORDS and len(t) > 2]
+
+def _sent_split(text: str) -> List[str]:
+    parts = _SENT_RE.split(text)
+    return [p.strip() for p in parts if len(p.strip()) > 0]
+
+# ---------- офлайн-свод (экстрактивно) ----------
+def offline_summary(top_hits, max_sent=4, index=None):
+    """Простой экстрактивный свод: выбираем информативные предложения из top-хитов."""
+    got = index.gather(top_hits[:8], rows=False) if index is not None else None
+    if got is not None:
+        sents = got[0]
+    else:
+        text = " ".join((h.get("text") or "") for h in top_hits[:8])
+        sents = _SENT_RE.split(text)
+        sents = [s.strip() for s in sents if s.strip()]
+    if len(sents) <= max_sent:
+        return " ".join(sents)
+    def score(s):
+        sc = len(s)
+        for kw in ("процент", "лимит", "задолж", "беспроцент", "комис", "сняти", "перевод", "понят", "экран", "визуал"):
+            if kw in s.lower(): sc += 30
+        return sc
+    best = heapq.nlargest(max_sent, sents, key=score)
+    return " ".join(best)
+
+# ---------- TF-IDF + TextRank (векторизовано) ----------
+def _build_tfidf(token_lists: Sequence[Sequence[str]]) -> sp.csr_matrix:
+    """Строки — предложения, столбцы — термы; строки L2-нормированы."""
+    vocab: Dict[str, int] = {}
+    indptr = [0]
+    indices: List[int] = []
+    for toks in token_lists:
+        for t in toks:
+            indices.append(vocab.setdefault(t, len(vocab)))
+        indptr.append(len(indices))
+    n, v = len(token_lists), len(vocab)
+    data = np.ones(len(indices), dtype=np.float64)
+    tf = sp.csr_matrix((data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)), shape=(n, v))
+    tf.sum_duplicates()  # повторы терма в предложении → счётчик
+    df = np.bincount(tf.indices, minlength=v)
+    idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+    x = tf.multiply(idf[np.newaxis, :]).tocsr()
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.diags(1.0 / norms) @ x
+
+def _textrank_scores(tfidf: sp.csr_matrix, damping=0.85, iters=30, eps=1e-6) -> np.ndarray:
+    n = tfidf.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    # матрица схожести (косинус = скалярное произведение нормированных строк), без диагонали
+    sim = (tfidf @ tfidf.T).toarray()
+    np.fill_diagonal(sim, 0.0)
+    # нормировка по строкам
+    row_sum = sim.sum(axis=1)
+    safe = np.where(row_sum > 0, row_sum, 1.0)
+    m_t = (sim / safe[:, np.newaxis]).T.copy()  # PageRank тянет по входящим рёбрам: Mᵀ·pr
+    # PageRank
+    pr = np.full(n, 1.0 / n)
+    base = (1.0 - damping) / n
+    for _ in range(iters):
+        new = base + damping * (m_t @ pr)
+        diff = np.abs(new - pr).sum()
+        pr = new
+        if diff < eps:
+            break
+    return pr
+
+def rank_sentences(sentences: Sequence[str], token_lists: Sequence[Sequence[str]] = None) -> np.ndarray:
+    """TextRank-веса предложений (порядок как во входе)."""
+    if token_lists is None:
+        token_lists = [_tokenize(s) for s in sentences]
+    return _textrank_scores(_build_tfidf(token_lists))
+
+def _select(sentences: Sequence[str], ranks: np.ndarray, max_sentences: int) -> str:
+    # берём top-N по рангу (при равенстве — раньше встреченное), сохраняем порядок появления;
+    # округление гасит шум порядка суммирования, чтобы одинаковые предложения были равны
+    idx_sorted = np.argsort(-np.round(ranks, 12), kind="stable")[:max_sentences]
+    idx_sorted = sorted(idx_sorted.tolist())
+    # лёгкая «склейка»: убираем дубликаты по началу
+    result = []
+    seen = set()
+    for i in idx_sorted:
+        s = sentences[i].strip()
+        key = s[:40].lower()
+        if key not in seen:
+            result.append(s)
+            seen.add(key)
+    return " ".join(result)
+
+def summarize_tfidf_textrank(hits, query: str, max_sentences: int = 5, index=None) -> str:
+    """Берём топ-хиты → режем на предложения → считаем TF-IDF и TextRank → возвращаем свод."""
+    got = index.gather(hits[:10]) if index is not None else None
+    if got is not None:
+        return _summarize_precomputed(index, got, query, max_sentences)
+    text = " ".join((h.get("text") or "") for h in hits[:10])
+    # подмешаем сам запрос (даёт лёгкий приоритет словам из запроса)
+    text = (query or "") + ". " + text
+    pairs: List[Tuple[str, List[str]]] = [(s, _tokenize(s)) for s in _sent_split(text)]
+    # фильтр слишком коротких
+    pairs = [(s, toks) for s, toks in pairs if len(toks) >= 5]
+    if not pairs:
+        return ""
+    sentences = [s for s, _ in pairs]
+    ranks = rank_sentences(sentences, [toks for _, toks in pairs])
+    return _select(sentences, ranks, max_sentences)
+
+def _summarize_precomputed(index, got, query: str, max_sentences: int) -> str:
+    """То же, но строки TF-IDF предложений хитов — из индекса; на лету считается только запрос."""
+    sents, ntok, rows = got
+    q_pairs = [(s, toks) for s, toks in ((s, _tokenize(s)) for s in _sent_split(query or "")) if len(toks) >= 5]
+    keep = np.flatnonzero(ntok >= 5)
+    if not q_pairs and not len(keep):
+        return ""
+    sentences = [s for s, _ in q_pairs] + [sents[i] for i in keep]
+    x = rows[keep]
+    if q_pairs:
+        x = sp.vstack([index.vectorize([toks for _, toks in q_pairs]), x], format="csr")
+    return _select(sentences, _textrank_scores(x), max_sentences)
@@ -0,0 +1,807 @@
+# -*- coding: utf-8 -*-
+"""
+vector_store.py — встроенное хранилище векторов на NumPy (альтернатива Chroma)
+
+Для корпуса нашего размера SQLite + HNSW в Chroma дают лишний старт, память и
+блокировки, а точный поиск по всем векторам стоит единицы миллисекунд. Здесь
+коллекция — папка ./storage/vectors/<name>/:
+- s<K>/ — сегменты, после записи не меняются. В сегменте:
+  - vectors.npy — матрица int8 (по умолчанию, + scales.npy — масштаб строки), float16
+    или float32 (VECTOR_DTYPE); norms.npy — нормы исходных векторов. int8 вчетверо меньше
+    float32 и быстрее float16: перевод int8 → float32 блоком векторизуется, а float16 в NumPy
+    на многих CPU конвертируется медленно (замер — bench/bench_suite.py --backend numpy);
+  - ids.bin / docs.bin + *.off.npy — строки UTF-8 подряд и смещения;
+  - columns.json + c<N>.npy — метаданные по колонкам: словарь значений колонки и
+    коды строк (-1 — у строки нет ключа). Фильтр where считается по словарю
+    (десятки значений), а по строкам — одним индексированием кодов → булева маска;
+  - idhash.npy / idrow.npy — отсортированные 64-битные хэши id и их строки (поиск по id
+    двоичным поиском, без словаря id → строка в памяти);
+- v<N>/ — версии: meta.json (список сегментов, метаданные коллекции) и <сегмент>.dead.npy —
+  строки сегмента, удалённые или перезаписанные позже;
+- CURRENT — имя актуальной версии.
+Всё открывается через np.load(mmap_mode="r"): несколько процессов (воркеры
+server.py, сессии Streamlit, индексатор) делят одни страницы в page cache.
+
+Запрос — точный top-k по каждому сегменту: блоки матрицы × вектор запроса, argpartition;
+k лучших сегментов сливаются. Расстояние — квадрат L2, как у коллекции Chroma по умолчанию.
+
+API — подмножество Chroma, которым пользуются retrieval.py / filters.py / индексаторы:
+get_or_create_collection / get_collection / delete_collection у клиента,
+upsert / delete / get / query / count / modify / metadata у коллекции.
+В памяти копятся только изменения. Сброс пишет их новым сегментом, прежние строки тех же
+id отмечает удалёнными и создаёт версию v<N+1>; переключает на неё замена CURRENT через
+os.replace — читатель никогда не видит коллекцию без версии или версию из файлов разных
+сбросов. Поэтому память индексатора не растёт с корпусом, а сброс стоит O(изменений).
+Сегменты сливаются по размеру, как разряды двоичного счётчика (новый не меньше
+предыдущего — сливаем): сегментов порядка log₂ n, строка переписывается O(log n) раз,
+слияние идёт блоками BLOCK_ROWS прямо в файлы. Сегмент, где удалено больше DEAD_FRACTION
+строк, переписывается. Сброс — при чтении, раз в VECTOR_FLUSH_S секунд во время
+индексации, persist() и при выходе. Предыдущая версия и её сегменты удаляются следующим
+сбросом: кто прочитал CURRENT перед переключением, ещё успевает их открыть.
+Хранилище STORE_VERSION 1–2 (снимок целиком в папке коллекции или в v<N>/) читается как
+один сегмент, первый сброс переписывает его в s<K>/.
+Выбор хранилища — VECTOR_BACKEND=chroma|numpy (resources.py, индексаторы, app.py, server.py).
+"""
+
+import os
+import json
+import time
+import atexit
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import resources
+
+# ── Параметры ──────────────────────────────────────────────────────────────────
+VECTOR_DTYPE    = os.getenv("VECTOR_DTYPE", "int8").lower()      # int8 | float16 | float32
+VECTOR_FLUSH_S  = float(os.getenv("VECTOR_FLUSH_S", "30"))       # как часто сбрасывать на диск при индексации
+STORE_VERSION   = 3        # 1 — снимок в папке коллекции, 2 — снимки v<N>/ (читаются, первый сброс переводит на сегменты)
+POINTER         = "CURRENT"
+OPEN_RETRIES    = 5        # версия удалена между чтением CURRENT и открытием — перечитываем указатель
+BLOCK_ROWS      = 8192     # строк матрицы на один блок скалярных произведений / слияния сегментов
+SUBSET_FRACTION = 4        # where оставил < 1/4 строк — считаем только их (выборка строк дороже сплошного блока)
+DEAD_FRACTION   = 0.5      # удалено больше половины строк сегмента — переписываем его
+DTYPES          = ("int8", "float16", "float32")
+
+# ── Версии коллекции ───────────────────────────────────────────────────────────
+def _stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """Отпечаток указателя (inode, mtime): os.replace даёт новый inode. None — коллекции нет."""
+    for name in (POINTER, "meta.json"):
+        try:
+            st = (path / name).stat()
+            return st.st_ino, st.st_mtime_ns
+        except OSError:
+            continue
+    return None
+
+def _current(path: Path) -> Optional[Path]:
+    """Папка актуальной версии или None."""
+    try:
+        return path / (path / POINTER).read_text(encoding="utf-8").strip()
+    except OSError:
+        return path if (path / "meta.json").exists() else None   # STORE_VERSION 1
+
+def _seq(p: Path, prefix: str) -> int:
+    """Номер папки v<N> / s<K>; -1 — не она."""
+    return int(p.name[1:]) if p.is_dir() and p.name[:1] == prefix and p.name[1:].isdigit() else -1
+
+def _id_hashes(ids: Sequence[str]) -> np.ndarray:
+    """64-битные хэши id (blake2b) — индекс сегмента по id."""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(cid.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+                        for cid in ids), dtype=np.int64, count=len(ids))
+
+def _small_codes(n_values: int):
+    return np.int8 if n_values < 127 else np.int16 if n_values < 32767 else np.int32
+
+# ── Строки UTF-8 подряд ────────────────────────────────────────────────────────
+class _Strings:
+    def __init__(self, path: Path, name: str):
+        self.offsets = np.load(path / f"{name}.off.npy")
+        size = (path / f"{name}.bin").stat().st_size
+        self.blob = np.memmap(path / f"{name}.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+# ── Условия where ──────────────────────────────────────────────────────────────
+def _is_num(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _same(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return isinstance(a, bool) and isinstance(b, bool) and a == b
+    return a == b
+
+def _match(op: str, value: Any, arg: Any) -> bool:
+    if op == "$eq":
+        return _same(value, arg)
+    if op == "$ne":
+        return not _same(value, arg)
+    if op == "$in":
+        return any(_same(value, a) for a in arg)
+    if op == "$nin":
+        return not any(_same(value, a) for a in arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        if not (_is_num(value) and _is_num(arg)):
+            return False
+        return {"$gt": value > arg, "$gte": value >= arg, "$lt": value < arg, "$lte": value <= arg}[op]
+    raise ValueError(f"unsupported where operator: {op}")
+
+def _in_key(v: Any) -> Any:
+    """Ключ множества для $in/$nin с той же семантикой, что _same: True ≠ 1, но 1 == 1.0."""
+    if isinstance(v, bool):
+        return ("bool", v)
+    if _is_num(v):
+        return ("num", v)
+    return (type(v).__name__, v)
+
+def _value_key(v: Any) -> Tuple[str, Any]:
+    """Ключ словаря колонки: True и 1 — разные значения; списки (meta["images"]) — по JSON."""
+    if isinstance(v, (list, dict)):
+        return (type(v).__name__, json.dumps(v, ensure_ascii=False, sort_keys=True))
+    return (type(v).__name__, v)
+
+
+# ── Сегмент на диске (только чтение, mmap) ─────────────────────────────────────
+class _Snapshot:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self.n, self.dim, self.dtype = int(self.meta["n"]), int(self.meta["dim"]), self.meta["dtype"]
+        mmap = "r" if self.n else None   # пустой массив не отображается в память
+        load = lambda name: np.load(path / name, mmap_mode=mmap)
+        self.vectors = load("vectors.npy")
+        self.norms = load("norms.npy")
+        self.scales = load("scales.npy") if self.dtype == "int8" else None
+        self.ids = _Strings(path, "ids")
+        self.docs = _Strings(path, "docs")
+        self.columns: Dict[str, Dict[str, Any]] = json.loads((path / "columns.json").read_text(encoding="utf-8"))
+        self._codes: Dict[str, np.ndarray] = {}
+        self._value_codes: Dict[str, Optional[Dict[Any, List[int]]]] = {}
+        self._id_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def codes(self, key: str) -> np.ndarray:
+        arr = self._codes.get(key)
+        if arr is None:
+            arr = np.load(self.path / self.columns[key]["file"], mmap_mode="r" if self.n else None)
+            self._codes[key] = arr
+        return arr
+
+    def id_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(отсортированные хэши id, строка каждого хэша); у снимков STORE_VERSION 1–2 — считается при открытии."""
+        if self._id_index is None:
+            with self._lock:
+                if self._id_index is None:
+                    if (self.path / "idhash.npy").exists():
+                        mmap = "r" if self.n else None
+                        self._id_index = (np.load(self.path / "idhash.npy", mmap_mode=mmap),
+                                          np.load(self.path / "idrow.npy", mmap_mode=mmap))
+                    else:
+                        hashes = _id_hashes([self.ids[i] for i in range(self.n)])
+                        order = np.argsort(hashes, kind="stable")
+                        self._id_index = (hashes[order], order)
+        return self._id_index
+
+    def find(self, ids: Sequence[str]) -> np.ndarray:
+        """Строки по id (-1 — нет в сегменте): двоичный поиск по хэшам, сам id сверяется (коллизии)."""
+        out = np.full(len(ids), -1, dtype=np.int64)
+        if not self.n or not len(ids):
+            return out
+        hashes, rows = self.id_index()
+        wanted = _id_hashes(ids)
+        for i, p in enumerate(np.searchsorted(hashes, wanted).tolist()):
+            while p < self.n and hashes[p] == wanted[i]:
+                if self.ids[int(rows[p])] == ids[i]:
+                    out[i] = rows[p]
+                    break
+                p += 1
+        return out
+
+    # ---- строки ----
+    def vector(self, rows: np.ndarray) -> np.ndarray:
+        out = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            out *= np.asarray(self.scales[rows], dtype=np.float32)[:, None]
+        return out
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        return self.metadatas([row])[0]
+
+    def metadatas(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        """Мета строк: по одной выборке кодов на колонку, а не на каждую пару строка × колонка."""
+        out: List[Dict[str, Any]] = [{} for _ in rows]
+        if not len(rows):
+            return out
+        idx = np.asarray(rows, dtype=np.int64)
+        for key, col in self.columns.items():
+            values = col["values"]
+            for md, code in zip(out, self.codes(key)[idx].tolist()):
+                if code >= 0:
+                    md[key] = values[code]
+        return out
+
+    def value_codes(self, key: str) -> Optional[Dict[Any, List[int]]]:
+        """_in_key(значение) → коды колонки; None — в колонке есть нехешируемые значения (списки)."""
+        index = self._value_codes.get(key, False)
+        if index is False:
+            index = {}
+            try:
+                for code, v in enumerate(self.columns[key]["values"]):
+                    index.setdefault(_in_key(v), []).append(code)
+            except TypeError:
+                index = None
+            self._value_codes[key] = index
+        return index
+
+    def _column_match(self, key: str, op: str, arg: Any) -> np.ndarray:
+        """_match по словарю колонки; $in/$nin — поиском кодов аргументов, без values × arg сравнений."""
+        values = self.columns[key]["values"]
+        index = self.value_codes(key) if op in ("$in", "$nin") else None
+        if index is not None:
+            try:
+                codes = [c for a in arg for c in index.get(_in_key(a), ())]
+            except TypeError:
+                codes = None       # нехешируемый аргумент — по одному, как остальные операторы
+            if codes is not None:
+                ok = np.zeros(len(values), dtype=bool)
+                ok[codes] = True
+                return ok if op == "$in" else ~ok
+        return np.fromiter((_match(op, v, arg) for v in values), dtype=bool, count=len(values))
+
+    # ---- фильтр ----
+    def mask(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        out = np.ones(self.n, dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    out &= self.mask(sub)
+            elif key == "$or":
+                any_ = np.zeros(self.n, dtype=bool)
+                for sub in cond:
+                    any_ |= self.mask(sub)
+                out &= any_
+            else:
+                if not isinstance(cond, dict):
+                    cond = {"$eq": cond}
+                col = self.columns.get(key)
+                if col is None:
+                    return np.zeros(self.n, dtype=bool)   # ключа нет ни у одной строки
+                codes = self.codes(key)
+                for op, arg in cond.items():
+                    ok = self._column_match(key, op, arg)
+                    out &= np.append(ok, False)[codes]     # код -1 (нет ключа) → последний элемент, False
+        return out
+
+    # ---- поиск ----
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Скалярные произведения (n, q) блоками — float16/int8 переводятся во float32 по кусочку."""
+        out = np.empty((self.n, len(queries)), dtype=np.float32)
+        qt = queries.T.astype(np.float32)
+        for lo in range(0, self.n, BLOCK_ROWS):
+            hi = min(self.n, lo + BLOCK_ROWS)
+            block = np.asarray(self.vectors[lo:hi], dtype=np.float32) @ qt
+            if self.scales is not None:
+                block *= np.asarray(self.scales[lo:hi], dtype=np.float32)[:, None]
+            out[lo:hi] = block
+        return out
+
+# ── Запись сегмента ────────────────────────────────────────────────────────────
+class _SegmentWriter:
+    """
+    Новый сегмент блоками: векторы, нормы и коды колонок пишутся прямо в файлы (open_memmap),
+    строки — подряд в .bin; в памяти — только смещения и хэши id (24 байта на строку).
+    Словарь колонок задаётся заранее — по его размеру выбирается ширина кодов.
+    """
+
+    def __init__(self, path: Path, n: int, dim: int, dtype: str, columns: Dict[str, List[Any]]):
+        path.mkdir(parents=True)
+        self.path, self.n, self.dim, self.dtype, self.row = path, n, dim, dtype, 0
+        mm = lambda name, dt, shape: np.lib.format.open_memmap(path / name, mode="w+", dtype=dt, shape=shape)
+        self.vectors = mm("vectors.npy", dtype, (n, dim))
+        self.norms = mm("norms.npy", np.float32, (n,))
+        self.scales = mm("scales.npy", np.float32, (n,)) if dtype == "int8" else None
+        self.columns = {key: {"file": f"c{i}.npy", "values": list(values)} for i, (key, values) in enumerate(columns.items())}
+        self.lookup = {key: {_value_key(v): code for code, v in enumerate(values)} for key, values in columns.items()}
+        self.codes: Dict[str, np.ndarray] = {}
+        for key, col in self.columns.items():
+            self.codes[key] = mm(col["file"], _small_codes(len(col["values"])), (n,))
+            self.codes[key][:] = -1
+        self.strings = {name: (open(path / f"{name}.bin", "wb"), np.zeros(n + 1, dtype=np.int64)) for name in ("ids", "docs")}
+        self.hashes = np.empty(n, dtype=np.int64)
+
+    def add(self, ids: Sequence[str], vecs: np.ndarray, docs: Sequence[str], metas: Sequence[Dict]) -> None:
+        lo, hi = self.row, self.row + len(ids)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        self.norms[lo:hi] = np.linalg.norm(vecs, axis=1)
+        if self.scales is not None:
+            scales = np.abs(vecs).max(axis=1) / 127.0 if len(vecs) else np.zeros(0, np.float32)
+            scales[scales == 0] = 1.0
+            self.vectors[lo:hi] = np.round(vecs / scales[:, None])
+            self.scales[lo:hi] = scales
+        else:
+            self.vectors[lo:hi] = vecs
+        for name, values in (("ids", ids), ("docs", docs)):
+            f, offsets = self.strings[name]
+            for i, value in enumerate(values, start=lo):
+                encoded = (value or "").encode("utf-8")
+                f.write(encoded)
+                offsets[i + 1] = offsets[i] + len(encoded)
+        self.hashes[lo:hi] = _id_hashes(ids)
+        for i, md in enumerate(metas, start=lo):
+            for key, value in (md or {}).items():
+                if value is not None:
+                    self.codes[key][i] = self.lookup[key][_value_key(value)]
+        self.row = hi
+
+    def close(self) -> _Snapshot:
+        for arr in (self.vectors, self.norms, self.scales, *self.codes.values()):
+            if arr is not None:
+                arr.flush()
+        for name, (f, offsets) in self.strings.items():
+            f.close()
+            np.save(self.path / f"{name}.off.npy", offsets)
+        order = np.argsort(self.hashes, kind="stable")
+        np.save(self.path / "idhash.npy", self.hashes[order])
+        np.save(self.path / "idrow.npy", order)
+        (self.path / "columns.json").write_text(json.dumps(self.columns, ensure_ascii=False), encoding="utf-8")
+        meta = {"version": STORE_VERSION, "n": self.n, "dim": int(self.dim), "dtype": self.dtype}
+        (self.path / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        self.vectors = self.norms = self.scales = None
+        self.codes = {}
+        return _Snapshot(self.path)
+
+def _vocab(metas: Iterable[Dict]) -> Dict[str, List[Any]]:
+    """Словари колонок по мета строк (в порядке появления значений)."""
+    columns: Dict[str, List[Any]] = {}
+    seen: Dict[str, set] = {}
+    for md in metas:
+        for key, value in (md or {}).items():
+            if value is None:
+                continue
+            vk = _value_key(value)
+            if vk not in seen.setdefault(key, set()):
+                seen[key].add(vk)
+                columns.setdefault(key, []).append(value)
+    return columns
+
+# ── Версия коллекции: сегменты + удалённые строки ──────────────────────────────
+class _View:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        self.legacy = "segments" not in self.meta     # STORE_VERSION 1–2: сама папка — единственный сегмент
+        self.segments: List[_Snapshot] = []
+        self.alive: List[Optional[np.ndarray]] = []   # None — живы все строки сегмента
+        if self.legacy:
+            self.segments.append(_Snapshot(path))
+            self.alive.append(None)
+        else:
+            for entry in self.meta["segments"]:
+                seg = _Snapshot(path.parent / entry["name"])
+                alive = None
+                if entry.get("dead"):
+                    alive = np.ones(seg.n, dtype=bool)
+                    alive[np.load(path / entry["dead"])] = False
+                self.segments.append(seg)
+                self.alive.append(alive)
+        self.dim = int(self.meta.get("dim") or 0)
+        self.n = sum(self.live(si) for si in range(len(self.segments)))
+
+    def live(self, si: int) -> int:
+        alive = self.alive[si]
+        return self.segments[si].n if alive is None else int(np.count_nonzero(alive))
+
+    def mask(self, si: int, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Живые строки сегмента под where; None — все."""
+        mask, alive = self.segments[si].mask(where), self.alive[si]
+        if alive is None:
+            return mask
+        return alive if mask is None else mask & alive
+
+    def find(self, ids: Sequence[str]) -> List[Tuple[int, int]]:
+        """(сегмент, строка) живой записи каждого id; (-1, -1) — нет."""
+        out = [(-1, -1)] * len(ids)
+        for si, seg in enumerate(self.segments):
+            alive = self.alive[si]
+            for i, row in enumerate(seg.find(ids).tolist()):
+                if row >= 0 and (alive is None or alive[row]):
+                    out[i] = (si, row)
+        return out
+
+    def select(self, where: Optional[Dict], offset: int, limit: Optional[int]) -> List[Tuple[int, int]]:
+        """(сегмент, строка) под where по порядку сегментов; целые сегменты до offset пропускаются по счёту."""
+        out: List[Tuple[int, int]] = []
+        for si, seg in enumerate(self.segments):
+            if limit is not None and len(out) >= limit:
+                break
+            mask = self.mask(si, where)
+            rows = np.arange(seg.n) if mask is None else np.flatnonzero(mask)
+            if offset >= len(rows):
+                offset -= len(rows)
+                continue
+            rows = rows[offset:] if limit is None else rows[offset:offset + limit - len(out)]
+            offset = 0
+            out.extend((si, row) for row in rows.tolist())
+        return out
+
+    def rows_out(self, pairs: Sequence[Tuple[int, int]], include: Sequence[str]) -> Dict[str, list]:
+        """Ответ get/query по парам (сегмент, строка): выборки делаются посегментно."""
+        out: Dict[str, list] = {"ids": [None] * len(pairs)}
+        if "documents" in include:
+            out["documents"] = [None] * len(pairs)
+        if "metadatas" in include:
+            out["metadatas"] = [None] * len(pairs)
+        if "embeddings" in include:
+            out["embeddings"] = np.zeros((len(pairs), self.dim), np.float32)
+        by_segment: Dict[int, List[int]] = {}
+        for pos, (si, _) in enumerate(pairs):
+            by_segment.setdefault(si, []).append(pos)
+        for si, positions in by_segment.items():
+            seg = self.segments[si]
+            rows = [pairs[pos][1] for pos in positions]
+            for pos, row in zip(positions, rows):
+                out["ids"][pos] = seg.ids[row]
+                if "documents" in out:
+                    out["documents"][pos] = seg.docs[row]
+            if "metadatas" in out:
+                for pos, md in zip(positions, seg.metadatas(rows)):
+                    out["metadatas"][pos] = md
+            if "embeddings" in out:
+                out["embeddings"][positions] = seg.vector(np.asarray(rows, dtype=np.int64))
+        return out
+
+# ── Коллекция ──────────────────────────────────────────────────────────────────
+class NumpyCollection:
+    def __init__(self, client: "NumpyClient", name: str, metadata: Optional[Dict] = None):
+        self.client = client
+        self.name = name
+        self.path = Path(client.path) / name
+        self._lock = threading.RLock()
+        self._view: Optional[_View] = None
+        self._view_stamp: Optional[Tuple[int, int]] = None
+        self._rows: "OrderedDict[str, Tuple[np.ndarray, str, Dict]]" = OrderedDict()   # несохранённые upsert
+        self._deleted: set = set()                                                    # несохранённые delete
+        self._pending_meta: Optional[Dict] = None
+        self._last_flush = time.monotonic()
+        if _current(self.path) is None:
+            self._pending_meta = dict(metadata or {})
+            self.persist()
+
+    # ---- версия / изменения ----
+    def _pending(self) -> bool:
+        return bool(self._rows or self._deleted) or self._pending_meta is not None
+
+    def _snap(self) -> _View:
+        """Актуальная версия; несохранённые изменения сначала сбрасываются."""
+        if self._pending():
+            self.persist()
+        return self._open()
+
+    def _open(self) -> _View:
+        """Актуальная версия на диске; чужая запись — переоткрывается."""
+        for _ in range(OPEN_RETRIES):
+            stamp = _stamp(self.path)
+            if stamp is None:
+                raise ValueError(f"Collection {self.name} does not exist.")
+            if self._view is not None and self._view_stamp == stamp:
+                return self._view
+            with self._lock:
+                if self._view is None or self._view_stamp != stamp:
+                    current = _current(self.path)
+                    try:
+                        view = _View(current) if current is not None else None
+                    except OSError:
+                        view = None   # писатель успел дважды переключить CURRENT и удалить эту версию
+                    if view is None:
+                        continue
+                    self._view, self._view_stamp = view, stamp
+                return self._view
+        if self._view is None:
+            raise ValueError(f"Collection {self.name} does not exist.")
+        return self._view     # уже открытая версия валидна: mmap удалённых файлов не пропадает
+
+    def _stored(self, cid: str) -> Optional[Tuple[str, Dict]]:
+        """(документ, мета) записи id — из несохранённых изменений или с диска."""
+        if cid in self._rows:
+            _, doc, md = self._rows[cid]
+            return doc, md
+        if cid in self._deleted or _current(self.path) is None:
+            return None
+        view = self._open()
+        si, row = view.find([cid])[0]
+        if si < 0:
+            return None
+        return view.segments[si].docs[row], view.segments[si].metadata(row)
+
+    def _new_segment(self) -> Path:
+        return self.path / f"s{max([0, *(_seq(p, 's') for p in self.path.iterdir())]) + 1}"
+
+    def _merge(self, parts: List[List]) -> Optional[List]:
+        """Живые строки частей [сегмент, alive] → один новый сегмент блоками BLOCK_ROWS; None — строк нет."""
+        rows = [(seg, None if alive is None else np.flatnonzero(alive)) for seg, alive in parts]
+        n = sum(seg.n if r is None else len(r) for seg, r in rows)
+        if not n:
+            return None
+        columns: Dict[str, List[Any]] = {}
+        for seg, _ in rows:
+            for key, col in seg.columns.items():
+                known = {_value_key(v) for v in columns.setdefault(key, [])}
+                columns[key].extend(v for v in col["values"] if _value_key(v) not in known)
+        dim = max(seg.dim for seg, _ in parts)
+        writer = _SegmentWriter(self._new_segment(), n, dim, self.client.dtype, columns)
+        for seg, r in rows:
+            total = seg.n if r is None else len(r)
+            for lo in range(0, total, BLOCK_ROWS):
+                idx = np.arange(lo, min(total, lo + BLOCK_ROWS)) if r is None else r[lo:lo + BLOCK_ROWS]
+                block = idx.tolist()
+                writer.add([seg.ids[i] for i in block], seg.vector(idx), [seg.docs[i] for i in block], seg.metadatas(block))
+        return [writer.close(), None]
+
+    def _compact(self, parts: List[List]) -> List[List]:
+        """Слияние по размеру: сегмент не больше следующего → сливаем; много удалённых строк → переписываем."""
+        live = lambda part: part[0].n if part[1] is None else int(np.count_nonzero(part[1]))
+        out: List[List] = []
+        for part in parts:
+            if live(part) == 0:
+                continue
+            if part[0].n - live(part) > DEAD_FRACTION * part[0].n:
+                part = self._merge([part])
+            out.append(part)
+            while len(out) >= 2 and live(out[-2]) <= live(out[-1]):
+                out[-2:] = [self._merge(out[-2:])]
+        return out
+
+    def persist(self) -> None:
+        """Сбросить изменения: сегмент с новыми строками + отметки удалённых → версия v<N+1> → замена CURRENT."""
+        with self._lock:
+            if not self._pending():
+                return
+            view = self._open() if _current(self.path) is not None else None
+            self.path.mkdir(parents=True, exist_ok=True)
+            parts: List[List] = []      # [сегмент, живые строки или None]
+            kill = list(self._rows.keys() | self._deleted)
+            for seg, alive in zip(view.segments, view.alive) if view is not None else ():
+                rows = seg.find(kill)
+                rows = rows[rows >= 0]
+                if len(rows):
+                    alive = np.ones(seg.n, dtype=bool) if alive is None else alive.copy()
+                    alive[rows] = False
+                parts.append([seg, alive])
+            dim = view.dim if view is not None else 0
+            if self._rows:
+                values = list(self._rows.values())
+                vecs = np.stack([v for v, _, _ in values])
+                dim = vecs.shape[1]
+                writer = _SegmentWriter(self._new_segment(), len(values), dim, self.client.dtype,
+                                        _vocab(md for _, _, md in values))
+                writer.add(list(self._rows.keys()), vecs, [d for _, d, _ in values], [md for _, _, md in values])
+                parts.append([writer.close(), None])
+            if view is not None and view.legacy:
+                parts = [part for part in [self._merge(parts)] if part]   # STORE_VERSION 1–2 → сегменты
+            parts = self._compact(parts)
+
+            target = self.path / f"v{max([0, *(_seq(p, 'v') for p in self.path.iterdir())]) + 1}"
+            tmp = self.path / (target.name + ".tmp")
+            if tmp.exists():
+                shutil.rmtree(tmp)
+            tmp.mkdir()
+            segments = []
+            for seg, alive in parts:
+                entry = {"name": seg.path.name, "dead": None}
+                if alive is not None:
+                    entry["dead"] = f"{seg.path.name}.dead.npy"
+                    np.save(tmp / entry["dead"], np.flatnonzero(~alive))
+                segments.append(entry)
+            metadata = self._pending_meta if self._pending_meta is not None else (view.meta.get("metadata") if view else None)
+            meta = {"version": STORE_VERSION, "segments": segments,
+                    "n": sum(seg.n if alive is None else int(np.count_nonzero(alive)) for seg, alive in parts),
+                    "dim": int(dim), "dtype": self.client.dtype, "metadata": metadata or {}, "saved_at": time.time()}
+            (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+            tmp.rename(target)
+            pointer = self.path / (POINTER + ".tmp")
+            pointer.write_text(target.name, encoding="utf-8")
+            os.replace(pointer, self.path / POINTER)
+            # остаются новая и предыдущая версии со своими сегментами; открытые mmap удалённых валидны
+            keep = {target.name} | {seg.path.name for seg, _ in parts}
+            if view is not None:
+                keep |= {view.path.name} | {seg.path.name for seg in view.segments}
+            for p in self.path.iterdir():
+                if p.is_dir() and p.name not in keep:
+                    shutil.rmtree(p, ignore_errors=True)
+                elif p.is_file() and p.name != POINTER:
+                    p.unlink()          # снимок STORE_VERSION 1 в корне папки
+            self._rows = OrderedDict()
+            self._deleted = set()
+            self._pending_meta = None
+            self._last_flush = time.monotonic()
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush > VECTOR_FLUSH_S:
+            self.persist()
+        else:
+            self.client._dirty.add(self)
+
+    # ---- API Chroma ----
+    @property
+    def metadata(self) -> Dict:
+        if self._pending_meta is not None:
+            return dict(self._pending_meta)
+        return dict(self._snap().meta.get("metadata") or {})
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[Dict] = None) -> None:
+        if metadata is None:
+            return
+        with self._lock:
+            self._pending_meta = dict(metadata)
+            self.persist()
+
+    def count(self) -> int:
+        return self._snap().n
+
+    def upsert(self, ids: Sequence[str], embeddings: Sequence[Sequence[float]],
+               metadatas: Optional[Sequence[Dict]] = None, documents: Optional[Sequence[str]] = None) -> None:
+        vecs = np.asarray(embeddings, dtype=np.float32)
+        if vecs.ndim != 2 or len(vecs) != len(ids):
+            raise ValueError(f"{self.name}: {len(ids)} ids, embeddings shape {vecs.shape}")
+        with self._lock:
+            for i, cid in enumerate(ids):
+                prev = self._stored(cid) if documents is None or metadatas is None else None
+                doc = documents[i] if documents is not None else (prev[0] if prev else "")
+                md = metadatas[i] if metadatas is not None else (prev[1] if prev else {})
+                self._rows[cid] = (vecs[i], doc, dict(md or {}))
+            self._maybe_flush()
+
+    add = upsert
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None) -> None:
+        with self._lock:
+            drop = set(ids or [])
+            if where:
+                view = self._snap()
+                for si, seg in enumerate(view.segments):
+                    drop |= {seg.ids[i] for i in np.flatnonzero(view.mask(si, where))}
+            if not drop:
+                return
+            for cid in drop:
+                self._rows.pop(cid, None)
+                self._deleted.add(cid)
+            self._maybe_flush()
+
+    def get(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None,
+            limit: Optional[int] = None, offset: Optional[int] = None,
+            include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, list]:
+        view = self._snap()
+        if ids is not None:
+            pairs = [p for p in view.find(list(ids)) if p[0] >= 0]
+            if where:
+                masks = [view.mask(si, where) for si in range(len(view.segments))]
+                pairs = [(si, row) for si, row in pairs if masks[si][row]]
+            pairs = pairs[(offset or 0):]
+            if limit is not None:
+                pairs = pairs[:limit]
+        else:
+            pairs = view.select(where, offset or 0, limit)
+        return view.rows_out(pairs, include)
+
+    def query(self, query_embeddings: Sequence[Sequence[float]], n_results: int = 10,
+              where: Optional[Dict] = None,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict[str, list]:
+        view = self._snap()
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        out: Dict[str, list] = {key: [] for key in ("ids", *include)}
+        # кандидаты по запросам: (расстояния, сегмент, строки) — k лучших каждого сегмента
+        found: List[List[Tuple[np.ndarray, int, np.ndarray]]] = [[] for _ in queries]
+        for si, seg in enumerate(view.segments):
+            if not seg.n:
+                continue
+            mask = view.mask(si, where)
+            subset = None
+            if mask is not None and np.count_nonzero(mask) * SUBSET_FRACTION < seg.n:
+                # узкий where (секции из hierarchy.py, редкий тег) — скаляры только по своим строкам
+                subset = np.flatnonzero(mask)
+                scores = seg.vector(subset) @ queries.T       # (m, q)
+                norms_sq = np.square(np.asarray(seg.norms[subset], dtype=np.float32))
+                mask = None
+            else:
+                scores = seg.scores(queries)                   # (n, q)
+                norms_sq = np.square(np.asarray(seg.norms, dtype=np.float32))
+            m = len(norms_sq)
+            for j, q in enumerate(queries):
+                # квадрат L2: |x|² − 2·x·q + |q|² — как distance у Chroma (space="l2")
+                dist = norms_sq - 2.0 * scores[:, j] + float(q @ q)
+                if mask is not None:
+                    dist = np.where(mask, dist, np.inf)
+                k = min(n_results, m if mask is None else int(mask.sum()))
+                if k <= 0:
+                    continue
+                top = np.argpartition(dist, k - 1)[:k] if k < m else np.arange(m)
+                found[j].append((dist[top], si, top if subset is None else subset[top]))
+        for j in range(len(queries)):
+            if found[j]:
+                dist = np.concatenate([d for d, _, _ in found[j]])
+                segs = np.concatenate([np.full(len(d), si) for d, si, _ in found[j]])
+                rows = np.concatenate([r for _, _, r in found[j]])
+                top = np.argsort(dist, kind="stable")[:n_results]
+                pairs = list(zip(segs[top].tolist(), rows[top].tolist()))
+                dist = dist[top]
+            else:
+                pairs, dist = [], np.zeros(0, np.float32)
+            for key, vals in view.rows_out(pairs, include).items():
+                out[key].append(vals)
+            if "distances" in include:
+                out["distances"].append(np.maximum(dist, 0.0).tolist())
+        return out
+
+# ── Клиент ─────────────────────────────────────────────────────────────────────
+class NumpyClient:
+    """Папка с коллекциями; одна копия объекта коллекции на имя внутри процесса."""
+
+    def __init__(self, path: str = resources.VECTOR_DIR, dtype: str = VECTOR_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"VECTOR_DTYPE must be one of {DTYPES}, got {dtype!r}")
+        self.path = str(path)
+        self.dtype = dtype
+        Path(self.path).mkdir(parents=True, exist_ok=True)
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+        self._dirty: set = set()
+        atexit.register(self.persist)
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict] = None) -> NumpyCollection:
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                coll = self._collections[name] = NumpyCollection(self, name, metadata)
+            return coll
+
+    def get_collection(self, name: str) -> NumpyCollection:
+        if name not in self._collections and _current(Path(self.path) / name) is None:
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.get_or_create_collection(name)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            coll = self._collections.pop(name, None)
+            self._dirty.discard(coll)
+            path = Path(self.path) / name
+            if not path.exists():
+                raise ValueError(f"Collection {name} does not exist.")
+            shutil.rmtree(path)
+
+    def list_collections(self) -> List[str]:
+        return sorted(p.name for p in Path(self.path).iterdir() if _current(p) is not None)
+
+    def persist(self) -> None:
+        for coll in list(self._dirty):
+            coll.persist()
+        self._dirty.clear()
+
+# ── Выбор хранилища ────────────────────────────────────────────────────────────
+def open_client(backend: Optional[str] = None, path: Optional[str] = None):
+    """Клиент выбранного хранилища: "numpy" → NumpyClient, иначе chromadb.PersistentClient."""
+    backend = (backend or resources.VECTOR_BACKEND).lower()
+    if backend == "numpy":
+        return NumpyClient(path or resources.VECTOR_DIR)
+    if backend != "chroma":
+        raise ValueError(f"VECTOR_BACKEND must be 'chroma' or 'numpy', got {backend!r}")
+    import chromadb
+    return chromadb.PersistentClient(path=path or resources.DB_DIR)
+
+def persist(collection) -> None:
+    """Сбросить записи на диск (у Chroma — ничего не делает, она пишет сразу)."""
+    flush = getattr(collection, "persist", None)
+    if callable(flush):
+        flush()